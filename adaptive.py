@@ -0,0 +1,268 @@
+# coding=utf-8
+"""
+自适应并发测试：根据延迟与错误信号实时调整在途请求上限，自动找出满足 SLO 的最大并发
+
+固定并发在网关返回 429 / 超时后仍以同样的并发持续施压，测得的只是“过载时的表现”。
+自适应模式在固定时长测试的基础上由控制器每个周期调整并发上限：
+    aimd      满足 SLO 时每周期加 increase，违反 SLO（成功率、P95）或出现 429/503/超时则乘以 backoff
+    gradient  参考 Netflix concurrency-limits 的 Gradient2：以长期 RTT / 短期 RTT 的比值缩放上限，
+              延迟开始上升（排队）时自动收缩，再加上 max(4, sqrt(limit)) 的探测余量；违反 SLO 同样乘以 backoff
+响应携带 Retry-After 时，在其指定的时间内暂停派发新请求。
+结果给出满足 SLO 的最大并发（discovered_limit）、末段稳定并发（steady_limit）与每个周期的控制轨迹。
+
+注意：openai SDK 默认会自动重试 429/5xx（最多 2 次），过载信号会被推迟甚至掩盖，
+使用精简请求路径（request_path="raw"）可以让控制器直接看到每一次限流。
+"""
+import math
+import time
+import asyncio
+import threading
+from typing import Dict, Any, List, Optional
+from tqdm import tqdm
+from stats import LatencyHistogram, RunStats, classify_error
+
+ALGORITHMS = ("aimd", "gradient")
+# 视为过载的失败类型：无论错误率是否超过 SLO 都立即收缩
+_OVERLOAD = ("http_429", "http_503", "timeout")
+
+
+class ConcurrencyController:
+    """
+    并发上限控制器：工作线程/协程按编号（slot）领取许可，编号小于当前上限的才允许发送请求
+
+    Args:
+        initial: 初始并发上限
+        min_limit / max_limit: 上限的取值范围（max_limit 同时是启动的工作线程/协程数）
+        algorithm: aimd 或 gradient
+        min_success_rate: SLO，周期内成功率下限（%）
+        max_p95: SLO，周期内 P95 耗时上限（秒），None 表示不限制
+        interval: 控制周期（秒），周期越长单个周期的 P95 越稳定
+        increase: aimd 每周期的加性增量
+        backoff: 违反 SLO 时的乘性收缩系数
+        min_samples: 周期内完成请求数少于该值时不调整（样本太少，P95 不可信）
+    """
+
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 256, algorithm: str = "aimd",
+                 min_success_rate: float = 99.0, max_p95: Optional[float] = None, interval: float = 5.0,
+                 increase: int = 1, backoff: float = 0.75, min_samples: int = 5):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"不支持的自适应算法: {algorithm}")
+        if not 1 <= min_limit <= initial <= max_limit:
+            raise ValueError(f"需满足 1 <= 最小并发({min_limit}) <= 初始并发({initial}) <= 最大并发({max_limit})")
+        self.algorithm = algorithm
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.min_success_rate = min_success_rate
+        self.max_p95 = max_p95
+        self.interval = interval
+        self.increase = increase
+        self.backoff = backoff
+        self.min_samples = min_samples
+        self.limit = initial
+        self.trajectory: List[Dict[str, Any]] = []
+        self._estimate = float(initial)
+        self._long_rtt = None
+        self._hold_until = 0.0
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._reset_window()
+
+    def _reset_window(self) -> None:
+        self._latency = LatencyHistogram()
+        self._completed = 0
+        self._success = 0
+        self._overload = 0
+        self._retry_after = 0.0
+
+    # ---------- 许可 ----------
+
+    def _ready(self, slot: int, now: float) -> bool:
+        return slot < self.limit and now >= self._hold_until
+
+    def wait_turn(self, slot: int, end_time: float) -> bool:
+        """线程引擎：阻塞直到 slot 可以发送下一个请求，到达 end_time 时返回 False"""
+        with self._cond:
+            while True:
+                now = time.time()
+                if now >= end_time:
+                    return False
+                if self._ready(slot, now):
+                    return True
+                wait = end_time - now
+                if slot < self.limit:
+                    wait = min(wait, self._hold_until - now)
+                self._cond.wait(timeout=min(wait, 1.0))
+
+    async def await_turn(self, slot: int, end_time: float) -> bool:
+        """asyncio 引擎：同 wait_turn；上限提高时由控制线程通过 call_soon_threadsafe 唤醒"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                now = time.time()
+                if now >= end_time:
+                    return False
+                if self._ready(slot, now):
+                    return True
+                future = None
+                if slot < self.limit:
+                    wait = min(end_time, self._hold_until) - now
+                else:
+                    wait = end_time - now
+                    future = loop.create_future()
+                    self._waiters.append((loop, future))
+            if future is None:
+                await asyncio.sleep(wait)
+            else:
+                try:
+                    await asyncio.wait_for(future, wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    def _wake_all(self) -> None:
+        # 调用方持有 self._cond
+        self._cond.notify_all()
+        for loop, future in self._waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+        self._waiters = []
+
+    # ---------- 信号 ----------
+
+    def observe(self, result: Dict[str, Any]) -> None:
+        """记录一次请求结果（成功耗时、失败类型、Retry-After）"""
+        with self._cond:
+            self._completed += 1
+            if result["success"]:
+                self._success += 1
+                self._latency.record(result["time"])
+                return
+            if classify_error(result.get("error")) in _OVERLOAD:
+                self._overload += 1
+            if result.get("retry_after"):
+                self._retry_after = max(self._retry_after, result["retry_after"])
+                self._hold_until = max(self._hold_until, time.time() + result["retry_after"])
+
+    def update(self, elapsed: float) -> Dict[str, Any]:
+        """结束一个控制周期：根据周期内的信号调整上限，返回该周期的控制轨迹行"""
+        with self._cond:
+            completed, success, overload = self._completed, self._success, self._overload
+            retry_after, latency = self._retry_after, self._latency
+            self._reset_window()
+
+            row = {"t": round(elapsed, 1), "limit": self.limit, "completed": completed,
+                   "qps": round(success / self.interval, 2),
+                   "success_rate": round(success / completed * 100, 2) if completed else None,
+                   "p95_time": round(latency.percentile(95), 3) if success else None,
+                   "retry_after": round(retry_after, 2) if retry_after else None}
+            problems = []
+            if completed and row["success_rate"] < self.min_success_rate:
+                problems.append(f"成功率 {row['success_rate']}%")
+            if self.max_p95 is not None and success and row["p95_time"] > self.max_p95:
+                problems.append(f"P95 {row['p95_time']}s")
+            if overload:
+                problems.append(f"过载 {overload} 次")
+            row["ok"] = completed >= self.min_samples and not problems
+
+            if problems:
+                self._estimate = max(self.min_limit, min(self._estimate, self.limit) * self.backoff)
+                action = "decrease"
+            elif completed < self.min_samples:
+                action = "hold"
+            elif self.algorithm == "aimd":
+                self._estimate = self.limit + self.increase
+                action = "increase"
+            else:
+                action = self._gradient(latency.percentile(50))
+            self._estimate = min(float(self.max_limit), max(self._estimate, float(self.min_limit)))
+            raised = int(self._estimate) > self.limit
+            self.limit = int(self._estimate)
+            if raised:
+                self._wake_all()
+            row["new_limit"] = self.limit
+            row["action"] = action
+            row["reason"] = "; ".join(problems)
+            self.trajectory.append(row)
+            return row
+
+    def _gradient(self, short_rtt: float) -> str:
+        """Gradient2：长期 RTT 以指数滑动平均跟随短期 RTT，二者之比 < 1 说明请求开始排队"""
+        short_rtt = max(short_rtt, 1e-4)
+        if self._long_rtt is None:
+            self._long_rtt = short_rtt
+        else:
+            self._long_rtt = self._long_rtt * 0.9 + short_rtt * 0.1
+            # 长期 RTT 远高于当前值（负载已下降）时快速回落，避免持续放大上限
+            if self._long_rtt / short_rtt > 2:
+                self._long_rtt *= 0.95
+        gradient = max(0.5, min(1.0, 1.5 * self._long_rtt / short_rtt))
+        # 探测余量取 max(4, sqrt(limit))（Gradient2 的默认队列大小），按周期更新时平滑系数取 0.5
+        target = self.limit * gradient + max(4.0, math.sqrt(self.limit))
+        previous = self._estimate
+        self._estimate = self._estimate * 0.5 + target * 0.5
+        return "increase" if self._estimate > previous else "decrease"
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Returns:
+            discovered_limit: 满足 SLO 的周期中出现过的最大并发上限（无满足的周期时为 None）
+            steady_limit: 后半段周期并发上限的平均值（控制器收敛的位置）
+            trajectory: 每个周期的控制轨迹
+        """
+        ok = [row["limit"] for row in self.trajectory if row["ok"]]
+        tail = self.trajectory[len(self.trajectory) // 2:]
+        return {
+            "algorithm": self.algorithm,
+            "discovered_limit": max(ok) if ok else None,
+            "steady_limit": round(sum(row["limit"] for row in tail) / len(tail), 1) if tail else None,
+            "final_limit": self.limit,
+            "trajectory": list(self.trajectory)
+        }
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def control_loop(controller: ConcurrencyController, run: RunStats, start_time: float, end_time: float,
+                 duration: int, show_progress: bool, progress_callback: Any) -> None:
+    """自适应模式的进度循环：每秒刷新进度（附带当前并发上限），每个控制周期调用一次 controller.update()"""
+    pbar = tqdm(total=duration, desc="自适应测试", unit="s") if show_progress and progress_callback is None else None
+    next_update = start_time + controller.interval
+    while time.time() < end_time:
+        time.sleep(max(0.0, min(1.0, end_time - time.time())))
+        now = time.time()
+        if now >= next_update:
+            controller.update(now - start_time)
+            next_update += controller.interval
+        snap = run.snapshot()
+        elapsed = max(1e-6, now - start_time)
+        if pbar is not None:
+            pbar.update(1)
+            pbar.set_postfix({"limit": controller.limit, "requests": snap["requests"],
+                              "qps": round(snap["success"] / elapsed, 2)})
+        elif progress_callback is not None:
+            progress_callback({
+                "elapsed": round(elapsed, 2),
+                "target": duration,
+                "requests": snap["requests"],
+                "success": snap["success"],
+                "qps": round(snap["success"] / elapsed, 2),
+                "window": snap["window"],
+                "limit": controller.limit
+            })
+    if pbar is not None:
+        pbar.close()
+
+
+def format_adaptive_table(adaptive: Dict[str, Any]) -> str:
+    """把控制轨迹格式化为终端表格"""
+    lines = [f"{'时间(s)':>8} {'并发上限':>8} {'完成数':>8} {'QPS':>8} {'成功率%':>8} {'P95(s)':>8} {'调整后':>8}  动作"]
+    for row in adaptive["trajectory"]:
+        success_rate = "-" if row["success_rate"] is None else row["success_rate"]
+        p95 = "-" if row["p95_time"] is None else row["p95_time"]
+        note = f"{row['action']}" + (f" ({row['reason']})" if row["reason"] else "")
+        if row["retry_after"]:
+            note += f" Retry-After {row['retry_after']}s"
+        lines.append(f"{row['t']:>8} {row['limit']:>8} {row['completed']:>8} {row['qps']:>8} {success_rate:>8} "
+                     f"{p95:>8} {row['new_limit']:>8}  {note}")
+    return "\n".join(lines)
@@ -1,9 +1,26 @@
 # coding=utf-8
 import streamlit as st
 import pandas as pd
+import io
+import os
 import json
+import tempfile
+import uuid
 from datetime import datetime
-from tester import OpenAITester
+from functools import partial
+from multiproc import multiprocess_test, make_tester
+from distributed import distributed_test
+from workload import JsonlWorkload, SAMPLING_MODES
+from transport import CLIENT_MODES
+from endpoints import ENDPOINTS
+from adaptive import ALGORITHMS, ConcurrencyController
+from profiler import profile_call
+from steady import SteadyState, describe
+from stats import RunStats
+from runstore import RunStore
+from regression import compare_runs, STATUS_TEXT
+from compare import parse_target, compare_test, summarize
+from jobs import JobManager
 
 st.set_page_config(page_title="OpenAI API 测试工具箱", page_icon="🧪", layout="wide")
 
@@ -56,6 +73,271 @@ if "history" not in st.session_state:
     st.session_state.history = []
 if "test_results" not in st.session_state:
     st.session_state.test_results = []
+if "tester_config" not in st.session_state:
+    st.session_state.tester_config = None
+if "collected_jobs" not in st.session_state:  # 已记入 test_results 的后台任务
+    st.session_state.collected_jobs = set()
+if "job_rows" not in st.session_state:  # 运行中任务已取到的时间窗口
+    st.session_state.job_rows = {}
+if "client_id" not in st.session_state:
+    # 浏览器标识记在页面 URL 的查询参数中：刷新或重新连接后会话状态清空，但仍能找回本浏览器提交的后台任务
+    st.session_state.client_id = st.query_params.get("client") or uuid.uuid4().hex[:12]
+if st.query_params.get("client") != st.session_state.client_id:
+    st.query_params["client"] = st.session_state.client_id
+
+
+def run_load_test(tester, config, processes, mode, profile=False, run=None, **params):
+    """
+    单进程直接调用 tester（profile 时同时采集客户端开销）；工作进程数 > 1 时拆分到多个子进程并合并结果。
+    run 提供时统计写入其中（保存到结果库时需要完整的延迟分布）
+    """
+    if processes > 1:
+        show_progress = params.pop("show_progress", True)
+        progress_callback = params.pop("progress_callback", None)
+        return multiprocess_test(config, mode, processes, params,
+                                 show_progress=show_progress, progress_callback=progress_callback, run=run)
+    if run is not None:
+        params["run"] = run
+    if profile:
+        return profile_call(tester, getattr(tester, mode), **params)
+    return getattr(tester, mode)(**params)
+
+
+@st.cache_resource
+def open_store(path):
+    """结果库在所有会话与重跑之间共用同一个连接"""
+    return RunStore(path)
+
+
+MODE_METHODS = {"固定时长": "duration_test", "固定请求数": "concurrent_test", "固定速率": "rate_test",
+                "自适应并发": "adaptive_test"}
+
+
+def save_run(mode, stats, run, params, label):
+    """按侧边栏设置把结果保存到结果库"""
+    if not save_runs:
+        return
+    try:
+        run_id = open_store(store_path).save(mode, stats, run, params=params, model=model, base_url=base_url,
+                                             label=label)
+        st.caption(f"💾 已保存到结果库 {store_path}: 运行 #{run_id}")
+    except Exception as e:
+        st.warning(f"保存到结果库失败: {e}")
+
+
+def timeseries_frame(data):
+    """把时间序列（按列的字典或逐行的列表）转为以 elapsed 秒为索引的 DataFrame"""
+    df = pd.DataFrame(data)
+    if df.empty:
+        return df
+    if "elapsed" not in df:
+        df["elapsed"] = df["t"] - df["t"].iloc[0]
+    return df.set_index("elapsed")
+
+
+def show_timeseries(data, container=None):
+    """逐秒时间序列图：左侧为吞吐与在途数，右侧为窗口内耗时分位"""
+    df = timeseries_frame(data)
+    if df.empty:
+        return
+    c1, c2 = (container or st).columns(2)
+    c1.caption("每秒完成 / 成功 / 失败 / 在途")
+    c1.line_chart(df[["completed", "success", "failed", "in_flight"]])
+    c2.caption("窗口内耗时 P50 / P95 / P99 (s)")
+    c2.line_chart(df[["p50", "p95", "p99"]])
+
+
+def show_load_result(test_mode, stats):
+    """压测结果：汇总指标，以及按模式与统计字段附加的各部分"""
+    if test_mode == "固定请求数":
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("总请求", stats["total"])
+        c2.metric("成功", stats["success"], f"{stats['success_rate']}%")
+        c3.metric("失败", stats["failed"])
+        c4.metric("QPS", stats["qps"])
+        c1, c2 = st.columns(2)
+        c1.metric("平均耗时", f"{stats['avg_time']}s")
+        c2.metric("P95 耗时", f"{stats['p95_time']}s")
+        c1, c2 = st.columns(2)
+        c1.metric("总耗时", f"{stats['total_wall_time']}s")
+    else:  # 固定时长
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("测试时长", f"{stats['duration']}s", f"目标: {stats['target_duration']}s")
+        c2.metric("总请求", stats["total"])
+        c3.metric("成功", stats["success"], f"{stats['success_rate']}%")
+        c4.metric("失败", stats["failed"])
+        c1, c2, c3 = st.columns(3)
+        c1.metric("QPS", stats["qps"])
+        c2.metric("平均耗时", f"{stats['avg_time']}s")
+        c3.metric("P95 耗时", f"{stats['p95_time']}s")
+        if "steady" in stats:
+            st.info("\n\n".join(describe(stats["steady"])))
+        if test_mode == "自适应并发":
+            adaptive = stats["adaptive"]
+            c1, c2, c3 = st.columns(3)
+            c1.metric("满足 SLO 的最大并发", adaptive["discovered_limit"] if adaptive["discovered_limit"] is not None else "-",
+                      help="满足 SLO 的控制周期中出现过的最大并发上限")
+            c2.metric("末段稳定并发", adaptive["steady_limit"], help="后半段控制周期并发上限的平均值")
+            c3.metric("最终并发上限", adaptive["final_limit"])
+            trajectory = pd.DataFrame(adaptive["trajectory"])
+            if not trajectory.empty:
+                st.markdown("**控制轨迹**")
+                c1, c2 = st.columns(2)
+                c1.line_chart(trajectory.set_index("t")[["limit", "qps"]])
+                c2.line_chart(trajectory.set_index("t")[["p95_time"]])
+                st.dataframe(trajectory, use_container_width=True)
+        if test_mode == "固定速率":
+            c1, c2, c3, c4 = st.columns(4)
+            c1.metric("实际发出速率", f"{stats['offered_rps']} req/s", f"目标: {stats['target_rps']}")
+            c2.metric("未能发出", stats["unsent"])
+            c3.metric("发送滞后 P95", f"{stats.get('send_lag_p95', 0)}s")
+            c4.metric("计划时刻起算 P95", f"{stats.get('intended_time_p95', 0)}s",
+                      help="从计划发送时刻算起的延迟，已修正协调遗漏")
+
+    c1, c2, c3, c4, c5 = st.columns(5)
+    c1.metric("P50 耗时", f"{stats['p50_time']}s")
+    c2.metric("P90 耗时", f"{stats['p90_time']}s")
+    c3.metric("P99 耗时", f"{stats['p99_time']}s")
+    c4.metric("P99.9 耗时", f"{stats['p999_time']}s")
+    c5.metric("最大耗时", f"{stats['max_time']}s", f"std {stats['std_time']}s", delta_color="off")
+
+    if "ttft_avg" in stats:
+        st.markdown("**流式延迟指标**")
+        for key, label, unit in (("ttft", "TTFT", "s"), ("itl", "Token 间隔", "s"), ("tps", "解码速度", " tok/s")):
+            c1, c2, c3, c4 = st.columns(4)
+            c1.metric(f"{label} 平均", f"{stats[key + '_avg']}{unit}")
+            c2.metric(f"{label} P50", f"{stats[key + '_p50']}{unit}")
+            c3.metric(f"{label} P95", f"{stats[key + '_p95']}{unit}")
+            c4.metric(f"{label} P99", f"{stats[key + '_p99']}{unit}")
+
+    if "output_tps" in stats:
+        st.markdown("**Token 吞吐**（服务端返回的 usage，未返回时为本地计数）")
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("输入 token/s", stats["input_tps"], f"共 {stats['input_tokens']}", delta_color="off")
+        c2.metric("输出 token/s", stats["output_tps"], f"共 {stats['output_tokens']}", delta_color="off")
+        c3.metric("推理 token", stats["reasoning_tokens"], help="包含在输出 token 中")
+        c4.metric("用量来自服务端", f"{stats['usage_reported_pct']}%", help="其余请求的 token 数为本地计数（近似值）")
+    if "goodput_slo" in stats:
+        c1, c2, c3 = st.columns(3)
+        c1.metric("SLO 达标率", f"{stats['slo_attainment']}%", f"耗时 ≤ {stats['goodput_slo']}s", delta_color="off")
+        c2.metric("Goodput (req/s)", stats["goodput_rps"])
+        c3.metric("Goodput (输出 token/s)", stats["goodput_tps"], help="只统计耗时达标的请求")
+
+    if "items" in stats:
+        st.markdown("**批量吞吐**（每个请求包含多条输入）")
+        c1, c2 = st.columns(2)
+        c1.metric("每请求输入条数", stats["avg_batch"])
+        c2.metric("items/s", stats["items_per_sec"])
+
+    if "pool_wait_avg" in stats:
+        st.markdown("**连接层指标**（客户端等待空闲连接与建连的时间，不属于服务端耗时）")
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("新建连接", stats["new_connections"])
+        c2.metric("池等待 P95", f"{stats['pool_wait_p95']}s", f"max {stats['pool_wait_max']}s",
+                  delta_color="off")
+        c3.metric("TCP 建连 P95", f"{stats.get('connect_time_p95', 0)}s")
+        c4.metric("TLS 握手 P95", f"{stats.get('tls_time_p95', 0)}s")
+
+    if "client" in stats:
+        client = stats["client"]
+        st.markdown("**客户端开销**（压测工具自身，开销过高时测得的延迟与 QPS 失真）")
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("CPU 占用", f"{client['cpu_util']} 核", f"每请求 {client['cpu_ms_per_req']}ms",
+                  delta_color="off")
+        lag = "loop_lag" if "loop_lag_p99_ms" in client else "sched_lag"
+        c2.metric("事件循环延迟 P99" if lag == "loop_lag" else "调度延迟 P99",
+                  f"{client.get(lag + '_p99_ms', 0)}ms", f"max {client.get(lag + '_max_ms', 0)}ms",
+                  delta_color="off")
+        c3.metric("GC 停顿", f"{client['gc_total_ms']}ms", f"{client['gc_count']} 次，最长 {client['gc_max_ms']}ms",
+                  delta_color="off")
+        c4.metric("解析占请求耗时", f"{client['parse_share']}%" if "parse_share" in client else "-",
+                  help="仅精简请求路径可测，其余时间为等待网络与服务端")
+        for warning in client["warnings"]:
+            st.warning(warning)
+
+    if stats.get("timeseries", {}).get("t"):
+        st.markdown("**逐秒时间序列**")
+        show_timeseries(stats["timeseries"])
+
+    if stats.get("failures"):
+        with st.expander("⚠️ 失败请求"):
+            for e in stats["failures"]:
+                st.error(e)
+
+
+@st.cache_resource
+def job_manager():
+    """后台任务在所有会话与重跑之间共用，测试线程不随脚本重跑或页面刷新中断（见 jobs.py）"""
+    return JobManager()
+
+
+JOB_STATUS = {"queued": "排队中", "running": "运行中", "done": "已完成", "failed": "失败", "cancelled": "已取消"}
+
+
+def run_job(job, tester, config, processes, mode, profile, params, run, save=None):
+    """
+    后台任务的执行体（在任务线程中运行，不能调用 st.*）
+
+    Args:
+        save: 保存到结果库的函数（RunStore.save 绑定参数后的 partial），运行 id 或失败原因记在 job.meta 中
+    """
+    if mode != "concurrent_test" or processes > 1:
+        params = {**params, "progress_callback": job.report}
+    stats = run_load_test(tester, config, processes, mode, profile=profile, run=run, **params)
+    if save is not None:
+        steady = params.get("steady")
+        try:
+            job.meta["run_id"] = save(mode, stats, steady.measured if steady is not None else run)
+        except Exception as e:
+            job.meta["save_error"] = str(e)
+    return stats
+
+
+def show_job_progress(manager, job):
+    """运行中任务的实时文本与逐秒曲线：只向任务取上次之后新增的时间窗口，累积在会话中"""
+    rows = st.session_state.job_rows.setdefault(job.id, [])
+    update = job.updates(len(rows))
+    rows.extend(update["rows"])
+    if update["status"] == "queued":
+        c1, c2 = st.columns([4, 1])
+        c1.info(f"⏳ #{job.id} {job.name}：排队中")
+        if c2.button("取消", key=f"cancel_job_{job.id}"):
+            manager.cancel(job.id)
+            st.rerun()
+        return
+    progress = update["progress"]
+    elapsed, requests, success = progress["elapsed"], progress.get("requests", 0), progress.get("success", 0)
+    qps = progress.get("qps", success / elapsed if elapsed else 0.0)
+    if "total_requests" in job.meta:
+        head = f"{elapsed:.2f}s, requests={requests}/{job.meta['total_requests']}"
+    else:
+        # 纠正显示范围，避免 62/60 误差
+        target = progress.get("target", job.meta["duration"])
+        head = f"{min(elapsed, float(target)):.2f}s/{int(target)}s, requests={requests}"
+    extra = f", limit={progress['limit']}" if progress.get("limit") is not None else ""
+    extra += f", phase={progress['phase']}" if progress.get("phase") is not None else ""
+    st.info(f"⏱️ #{job.id} {job.name}: {head}, success={success}, qps={qps:.2f}{extra}")
+    show_timeseries(rows)
+
+
+def job_panel(manager, owner):
+    """任务面板（按 1 秒周期单独重跑的 fragment）：只列出 owner 提交的任务，任务结束后记入测试历史并整页重跑以展示结果"""
+    finished = False
+    for job in manager.jobs(owner):
+        if job.active:
+            show_job_progress(manager, job)
+        elif job.id not in st.session_state.collected_jobs:
+            st.session_state.collected_jobs.add(job.id)
+            st.session_state.job_rows.pop(job.id, None)
+            if job.status == "done":
+                st.session_state.test_results.append({
+                    "timestamp": datetime.fromtimestamp(job.finished).strftime("%Y-%m-%d %H:%M:%S"),
+                    **job.meta,
+                    "stats": job.result
+                })
+            finished = True
+    if finished:
+        st.rerun()
 
 # 侧边栏：直接输入配置
 with st.sidebar:
@@ -67,20 +349,50 @@ with st.sidebar:
     temperature = st.slider("Temperature", 0.0, 2.0, 0.7, 0.1)
     max_tokens = st.number_input("Max Tokens", 1, 16384, 4096)
     system_prompt = st.text_area("System Prompt", "You are a helpful assistant.", height=80)
+    engine = st.selectbox("压测引擎", ["thread", "async"], help="async 基于 asyncio，适合数百以上并发")
+    processes = st.number_input("工作进程数", 1, 64, 1, help="大于 1 时并发数/请求数/速率均分到多个进程，突破单核瓶颈")
+    endpoint = st.selectbox("接口", list(ENDPOINTS), help="chat：/chat/completions；completions：旧版文本补全；"
+                                                         "embeddings：嵌入。后两者可以一个请求发送一批输入")
+    batch_size = st.number_input("每请求输入条数", 1, 4096, 1, disabled=endpoint == "chat",
+                                 help="同一 prompt 重复组成一批，结果中给出 items/s 与输入 token/s")
+    with st.expander("🔌 连接设置"):
+        pool_size = st.number_input("连接池上限", 0, 100000, 0,
+                                    help="0 表示默认（thread 1000、async 10000）；应不小于并发数，否则请求会在客户端排队")
+        keepalive = st.checkbox("复用连接（keep-alive）", True, help="关闭后每个请求重新建连，可用于测量建连开销")
+        http2 = st.checkbox("HTTP/2", False, help="需安装 h2：pip install 'httpx[http2]'")
+        client_mode = st.selectbox("客户端", list(CLIENT_MODES),
+                                   help="shared：所有 worker 共享一个客户端；per_worker：每个 worker 独立的客户端与连接池")
+        raw_path = st.checkbox("精简请求路径", False, help="预编码请求体 + 增量 SSE 解析，不经过 openai SDK，"
+                                                             "降低客户端 CPU；不自动重试 429/5xx")
+        keep_text = st.checkbox("保留回答文本", True, help="关闭后只统计 token 数与字节数，减少压测时的内存与拼接开销")
+        stream_usage = st.checkbox("流式请求返回用量", True,
+                                   help="携带 stream_options.include_usage 让服务端返回 token 用量；"
+                                        "服务端不接受该参数时关闭，token 数改为本地计数")
+    with st.expander("💾 结果库"):
+        store_path = st.text_input("结果库文件", "runs.db", help="SQLite 文件，保存每次测试的参数、统计与延迟分布，"
+                                                                  "命令行使用 --store 指向同一文件即可共用")
+        save_runs = st.checkbox("自动保存压测结果", True)
+    connection_config = {"pool_size": pool_size or None, "keepalive": keepalive, "http2": http2,
+                         "client_mode": client_mode, "request_path": "raw" if raw_path else "sdk",
+                         "keep_text": keep_text, "endpoint": endpoint,
+                         "batch_size": 1 if endpoint == "chat" else batch_size, "stream_usage": stream_usage}
 
     if st.button("🔄 初始化客户端"):
         if not base_url or not api_key or not model:
             st.error("Base URL、API Key、Model 不能为空！")
         else:
             try:
-                st.session_state.tester = OpenAITester(base_url, api_key, model, timeout)
+                config = {"base_url": base_url, "api_key": api_key, "model": model, "timeout": timeout,
+                          "engine": engine, **connection_config}
+                st.session_state.tester = make_tester(config)
+                st.session_state.tester_config = config
                 st.success("✅ 客户端初始化成功！")
                 st.session_state.history = []
             except Exception as e:
                 st.error(f"初始化失败: {str(e)}")
 
 # 主界面
-tab1, tab2 = st.tabs(["💬 单轮测试", "🚀 并发压测"])
+tab1, tab2, tab3, tab4, tab5 = st.tabs(["💬 单轮测试", "🚀 并发压测", "🌐 分布式压测", "⚖️ 对比压测", "📚 结果库"])
 
 with tab1:
     if st.session_state.tester is None:
@@ -120,175 +432,366 @@ with tab1:
                     st.error(f"错误: {h['error']}")
 
 with tab2:
+    manager = job_manager()
     if st.session_state.tester is None:
         st.warning("请先初始化客户端。")
     else:
         st.subheader("并发压力测试")
         test_prompt = st.text_input("测试问题", "你好，请告诉我今天的天气。")
+        workload_file = st.file_uploader("数据集（可选，JSONL）", type=["jsonl"],
+                                         help="每行 {prompt, [system_prompt], [max_tokens], [temperature], [weight]}，"
+                                              "上传后代替固定测试问题")
+        workload_mode = st.radio("数据集采样", list(SAMPLING_MODES), horizontal=True) if workload_file else None
         
         # 测试模式选择
-        test_mode = st.radio("测试模式", ["固定时长", "固定请求数"], horizontal=True)
+        test_mode = st.radio("测试模式", ["固定时长", "固定请求数", "固定速率", "自适应并发"], horizontal=True)
         
         if test_mode == "固定请求数":
             total = st.number_input("总请求数", 1, 1000, 50)
             concur = st.number_input("并发数", 1, 100, 10)
+        elif test_mode == "固定速率":  # 开环：按时间表发送，不等待前一个请求返回
+            duration = st.number_input("测试时长（秒）", 10, 3600, 60, help="持续测试指定时长")
+            rps = st.number_input("目标速率（req/s）", 0.1, 10000.0, 5.0, help="每秒计划发送的请求数")
+            arrival = st.radio("到达间隔", ["constant", "poisson"], horizontal=True,
+                               help="constant 为等间隔，poisson 为指数分布间隔")
+            concur = st.number_input("在途请求上限", 1, 10000, 100, help="占满后新请求排队，排队时间计入发送滞后")
+        elif test_mode == "自适应并发":  # 按延迟与错误信号自动调整并发，找出满足 SLO 的最大并发
+            duration = st.number_input("测试时长（秒）", 10, 86400, 300, help="时间越长，控制器越能收敛到稳定的并发")
+            algorithm = st.radio("控制算法", list(ALGORITHMS), horizontal=True,
+                                 help="aimd：满足 SLO 时加性增长、违反时乘性收缩；gradient：按延迟梯度调整（Gradient2）")
+            c1, c2, c3 = st.columns(3)
+            concur = c1.number_input("初始并发", 1, 10000, 4)
+            min_concur = c2.number_input("并发下限", 1, 10000, 1)
+            max_concur = c3.number_input("并发上限", 1, 10000, 256)
+            c1, c2, c3 = st.columns(3)
+            slo_success_rate = c1.number_input("SLO 成功率下限（%）", 0.0, 100.0, 99.0)
+            slo_p95 = c2.number_input("SLO P95 上限（秒，0 为不限）", 0.0, 600.0, 0.0)
+            control_interval = c3.number_input("控制周期（秒）", 1.0, 60.0, 5.0)
+            st.caption("自适应模式只在单进程内运行；openai SDK 会自动重试 429，建议勾选「精简请求路径」让控制器直接看到限流")
         else:  # 固定时长
             duration = st.number_input("测试时长（秒）", 10, 3600, 60, help="持续测试指定时长")
             concur = st.number_input("并发数", 1, 100, 10)
+            with st.expander("⏳ 预热与稳态"):
+                c1, c2, c3 = st.columns(3)
+                warmup = c1.number_input("预热时长（秒）", 0, 3600, 0, help="期间的请求不计入统计")
+                steady_detect = c2.checkbox("自动检测稳态", False,
+                                            help="预热后比较相邻窗口的吞吐与 P50，变化都小于 10% 时开始统计")
+                ci_target = c3.number_input("置信区间目标（%，0 为不启用）", 0.0, 50.0, 0.0,
+                                            help="QPS 与 P95 的 95% 置信区间相对半宽都小于该值时提前结束，测试时长作为上限")
+                if processes > 1:
+                    st.caption("多进程模式下不支持预热与稳态检测，将忽略以上设置")
+                elif steady_detect:
+                    try:
+                        SteadyState(warmup=warmup, detect=True).resolve_max_warmup(duration)
+                    except ValueError as e:
+                        st.warning(str(e))
         
+        stream_load = st.checkbox("流式压测（统计 TTFT / token 间隔 / 解码速度）", False)
+        goodput_slo = st.number_input("Goodput 延迟 SLO（秒，0 为不统计）", 0.0, 3600.0, 0.0,
+                                      help="额外统计耗时不超过该值的请求的达标率、req/s 与输出 token/s")
+        profile_client = st.checkbox("客户端开销分析", False,
+                                     help="采集压测进程自身的 CPU、调度/事件循环延迟、GC 停顿与解析耗时，"
+                                          "客户端可能成为瓶颈时给出警告（仅单进程）")
+
+        max_jobs = st.number_input("同时运行的测试数", 1, 16, manager.max_running,
+                                   help="所有浏览器会话共用，超出上限的测试排队等待")
+        manager.set_limit(max_jobs)
+
         run_btn = st.button("🚀 开始测试")
 
+        workload = None
+        if run_btn and workload_file is not None:
+            # 上传内容落盘后按行流式读取（多进程时子进程按路径各自打开）
+            workload_path = os.path.join(tempfile.gettempdir(), f"workload_{workload_file.file_id}.jsonl")
+            with open(workload_path, "wb") as f:
+                f.write(workload_file.getbuffer())
+            try:
+                workload = JsonlWorkload(workload_path, mode=workload_mode)
+            except ValueError as e:
+                st.error(str(e))
+                run_btn = False
+
         if run_btn and test_prompt:
+            # 测试在后台任务中运行，脚本立即返回；进度与结果由下方的任务面板展示，重跑或刷新页面不影响测试
+            params = {"prompt": test_prompt, "system_prompt": system_prompt, "temperature": temperature,
+                      "max_tokens": max_tokens, "show_progress": False, "stream": stream_load, "workload": workload}
             if test_mode == "固定请求数":
-                with st.spinner("测试中..."):
-                    stats = st.session_state.tester.concurrent_test(
-                        prompt=test_prompt,
-                        total=total,
-                        concurrency=concur,
-                        system_prompt=system_prompt,
-                        temperature=temperature,
-                        max_tokens=max_tokens
-                    )
-                st.markdown('<div class="success-message">✅ 测试完成！</div>', unsafe_allow_html=True)
-            else:  # 固定时长
-                # 创建状态显示容器
-                status_container = st.empty()
-                live_text_container = st.empty()
-                
-                # 显示测试开始信息
-                status_container.info(f"🚀 开始固定时长测试: {duration}秒 / {concur} 并发")
-                
-                try:
-                    # 使用多线程来实时更新界面显示，同时避免闪烁，展示文本统计
-                    import threading
-                    import time
-                    
-                    # 从主线程捕获 tester 引用
-                    tester_ref = st.session_state.tester
-                    if tester_ref is None:
-                        status_container.error("请先在左侧初始化客户端后再开始测试")
-                        stats = None
-                        raise RuntimeError("Tester not initialized")
-                    
-                    # 存储测试结果与实时进度
-                    test_result = {"stats": None, "error": None}
-                    latest = {"elapsed": 0.0, "target": duration, "requests": 0, "success": 0, "qps": 0.0}
-                    latest_lock = __import__('threading').Lock()
-                    
-                    def progress_cb(data: dict):
-                        with latest_lock:
-                            latest.update(data)
-                    
-                    def run_test():
-                        try:
-                            result = tester_ref.duration_test(
-                                prompt=test_prompt,
-                                duration=duration,
-                                concurrency=concur,
-                                system_prompt=system_prompt,
-                                temperature=temperature,
-                                max_tokens=max_tokens,
-                                show_progress=False,  # 关闭终端进度条，使用UI文本
-                                progress_callback=progress_cb
-                            )
-                            test_result["stats"] = result
-                        except Exception as e:
-                            test_result["error"] = str(e)
-                    
-                    # 启动测试线程
-                    test_thread = threading.Thread(target=run_test)
-                    test_thread.start()
-                    
-                    # 实时更新界面文本（不使用进度条）
-                    while test_thread.is_alive():
-                        with latest_lock:
-                            elapsed = latest.get("elapsed", 0.0)
-                            target = latest.get("target", duration)
-                            requests = latest.get("requests", 0)
-                            success = latest.get("success", 0)
-                            qps = latest.get("qps", 0.0)
-                        # 纠正显示范围，避免 2/60 或 62/60 误差
-                        show_elapsed = min(max(elapsed, 0.0), float(target))
-                        live_text_container.info(f"⏱️ {show_elapsed:.2f}s/{int(target)}s, requests={requests}, success={success}, qps={qps:.2f}")
-                        time.sleep(1)
-                    
-                    # 等待测试完成
-                    test_thread.join()
-                    
-                    if test_result["error"]:
-                        status_container.error(f"测试执行失败: {test_result['error']}")
-                        live_text_container.empty()
-                        stats = None
-                    else:
-                        stats = test_result["stats"]
-                        status_container.success("✅ 固定时长测试完成！")
-                        # 最终再展示一次摘要
-                        with latest_lock:
-                            elapsed = latest.get("elapsed", stats.get('duration', 0.0))
-                            target = latest.get("target", stats.get('target_duration', duration))
-                            requests = stats.get('total', 0)
-                            success = stats.get('success', 0)
-                            qps = stats.get('qps', 0.0)
-                        live_text_container.success(f"⏱️ {min(elapsed, target):.2f}s/{int(target)}s, requests={requests}, success={success}, qps={qps:.2f}")
-                        st.markdown('<div class="success-message">✅ 固定时长测试完成！</div>', unsafe_allow_html=True)
-                    
-                except Exception as e:
-                    status_container.error(f"测试执行失败: {str(e)}")
-                    live_text_container.empty()
-                    stats = None
-            
-            # 只有在测试成功时才存储和显示结果
+                params.update(total=total, concurrency=concur)
+            elif test_mode == "固定速率":  # 开环：按时间表发送，不等待前一个请求返回
+                params.update(rps=rps, duration=duration, concurrency=concur, arrival=arrival)
+            elif test_mode == "自适应并发":
+                params.update(duration=duration, controller=ConcurrencyController(
+                    initial=concur, min_limit=min_concur, max_limit=max_concur, algorithm=algorithm,
+                    min_success_rate=slo_success_rate, max_p95=slo_p95 or None, interval=control_interval))
+            else:
+                params.update(duration=duration, concurrency=concur)
+                if processes == 1 and (warmup > 0 or steady_detect or ci_target > 0):
+                    params["steady"] = SteadyState(warmup=warmup, detect=steady_detect,
+                                                   ci_target=ci_target / 100 if ci_target > 0 else None)
+            # 历史记录与结果库中的测试参数
+            meta = {"test_mode": test_mode, "prompt": test_prompt, "concurrency": concur}
+            if test_mode == "固定请求数":
+                meta["total_requests"] = total
+            else:
+                meta["duration"] = duration
+            if test_mode == "固定速率":
+                meta["rps"] = rps
+            save = None
+            if save_runs:
+                save = partial(open_store(store_path).save,
+                               params={**meta, "engine": engine, "processes": processes, "stream": stream_load,
+                                       "goodput_slo": goodput_slo or None},
+                               model=model, base_url=base_url, label=test_mode)
+            mode = MODE_METHODS[test_mode]
+            run = RunStats()
+            run.goodput_slo = goodput_slo or None
+            # 单进程的固定请求数没有进度回调，由任务面板每秒读取 RunStats 的快照
+            poll = run.snapshot if mode == "concurrent_test" and processes == 1 else None
+            job = manager.submit(f"{test_mode} / {concur} 并发", partial(
+                run_job, tester=st.session_state.tester, config=st.session_state.tester_config,
+                processes=1 if mode == "adaptive_test" else processes, mode=mode, profile=profile_client,
+                params=params, run=run, save=save), meta=meta, poll=poll, owner=st.session_state.client_id)
+            if job.status == "queued":
+                st.info(f"⏳ 已有 {manager.max_running} 个测试在运行，任务 #{job.id} 排队中")
+
+    # 任务面板与结果不依赖客户端：刷新页面后无需重新初始化即可看到仍在运行的测试
+    job_counts = manager.counts(st.session_state.client_id)
+    st.fragment(run_every=1 if job_counts["queued"] + job_counts["running"] else None)(job_panel)(
+        manager, st.session_state.client_id)
+
+    finished_jobs = [job for job in manager.jobs(st.session_state.client_id) if not job.active]
+    if finished_jobs:
+        st.markdown("---")
+        job_names = {job.id: f"#{job.id} {job.name}（{JOB_STATUS[job.status]}，"
+                             f"{datetime.fromtimestamp(job.finished).strftime('%H:%M:%S')}）"
+                     for job in finished_jobs}
+        job_id = st.selectbox("测试结果", list(job_names), format_func=job_names.get)
+        job = manager.get(job_id)
+        if job is None:
+            st.info("该任务已被清理")
+        elif job.status == "done":
+            st.markdown(f'<div class="success-message">✅ {job.meta["test_mode"]}测试完成！</div>',
+                        unsafe_allow_html=True)
+            if "run_id" in job.meta:
+                st.caption(f"💾 已保存到结果库: 运行 #{job.meta['run_id']}")
+            elif "save_error" in job.meta:
+                st.warning(f"保存到结果库失败: {job.meta['save_error']}")
+            show_load_result(job.meta["test_mode"], job.result)
+        elif job.status == "failed":
+            st.error(f"测试执行失败: {job.error}")
+        else:
+            st.info("任务在开始前已取消")
+
+with tab3:
+    st.subheader("分布式压测（本页作为协调者）")
+    st.caption("在每台压测机上运行 `python cli_tester.py --agent --listen 0.0.0.0:8765 --agent-token xxx`，"
+               "负载按代理数均分，使用左侧的 Base URL / API Key / Model / 压测引擎 / 工作进程数配置。")
+    agent_text = st.text_area("代理地址（每行一个）", "127.0.0.1:8765")
+    agent_token = st.text_input("代理口令", type="password", help="与代理的 --agent-token 一致，未设置可留空")
+    dist_prompt = st.text_input("测试问题", "你好，请告诉我今天的天气。", key="dist_prompt")
+    dist_mode = st.radio("测试模式", ["固定时长", "固定请求数", "固定速率"], horizontal=True, key="dist_mode")
+    dist_params = {"concurrency": st.number_input("总并发数 / 在途上限", 1, 100000, 50, key="dist_concur")}
+    if dist_mode == "固定请求数":
+        dist_params["total"] = st.number_input("总请求数", 1, 10000000, 500, key="dist_total")
+    else:
+        dist_params["duration"] = st.number_input("测试时长（秒）", 10, 86400, 60, key="dist_duration")
+    if dist_mode == "固定速率":
+        dist_params["rps"] = st.number_input("总目标速率（req/s）", 0.1, 1000000.0, 50.0, key="dist_rps")
+        dist_params["arrival"] = st.radio("到达间隔", ["constant", "poisson"], horizontal=True, key="dist_arrival")
+    start_delay = st.number_input("同步开始延迟（秒）", 1.0, 60.0, 3.0, help="下发任务到各代理同时开始之间预留的时间")
+
+    if st.button("🌐 开始分布式测试"):
+        agents = [a.strip() for a in agent_text.splitlines() if a.strip()]
+        if not agents or not base_url or not api_key or not model:
+            st.error("代理地址、Base URL、API Key、Model 不能为空！")
+        else:
+            mode_name = {"固定时长": "duration_test", "固定请求数": "concurrent_test", "固定速率": "rate_test"}[dist_mode]
+            config = {"base_url": base_url, "api_key": api_key, "model": model, "timeout": timeout, "engine": engine,
+                      **connection_config}
+            live = st.empty()
+
+            def dist_progress(data: dict):
+                target = f"/{int(data['target'])}s" if data.get("target") else ""
+                live.info(f"⏱️ {data['elapsed']:.2f}s{target}, requests={data['requests']}, "
+                          f"success={data['success']}, qps={data['qps']:.2f}")
+
+            try:
+                params = dict(dist_params, prompt=dist_prompt, system_prompt=system_prompt,
+                              temperature=temperature, max_tokens=max_tokens)
+                stats = distributed_test(agents, config, mode_name, params, token=agent_token or None,
+                                         processes_per_agent=processes, start_delay=start_delay,
+                                         show_progress=False, progress_callback=dist_progress)
+            except Exception as e:
+                live.empty()
+                st.error(f"分布式测试失败: {e}")
+                stats = None
             if stats is not None:
-                # 存储测试结果
-                test_result = {
+                live.success(f"✅ 分布式测试完成：{len(stats['agents'])} 个代理")
+                c1, c2, c3, c4 = st.columns(4)
+                c1.metric("总请求", stats["total"])
+                c2.metric("成功", stats["success"], f"{stats['success_rate']}%")
+                c3.metric("QPS", stats["qps"])
+                c4.metric("P95 耗时", f"{stats['p95_time']}s")
+                c1, c2, c3, c4 = st.columns(4)
+                c1.metric("平均耗时", f"{stats['avg_time']}s")
+                c2.metric("P50 耗时", f"{stats['p50_time']}s")
+                c3.metric("P99 耗时", f"{stats['p99_time']}s")
+                c4.metric("最大耗时", f"{stats['max_time']}s")
+                st.dataframe(pd.DataFrame(stats["agents"]), use_container_width=True)
+                if stats.get("timeseries", {}).get("t"):
+                    show_timeseries(stats["timeseries"])
+                if stats.get("failures"):
+                    with st.expander("⚠️ 失败请求"):
+                        for e in stats["failures"]:
+                            st.error(e)
+                dist_result = {
                     "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "test_mode": test_mode,
-                    "prompt": test_prompt,
-                    "concurrency": concur,
+                    "test_mode": f"分布式{dist_mode}",
+                    "prompt": dist_prompt,
+                    "concurrency": dist_params["concurrency"],
                     "stats": stats
                 }
-                if test_mode == "固定请求数":
-                    test_result["total_requests"] = total
+                if dist_mode == "固定请求数":
+                    dist_result["total_requests"] = dist_params["total"]
                 else:
-                    test_result["duration"] = duration
-                
-                st.session_state.test_results.append(test_result)
-                
-                # 显示测试结果
-                if test_mode == "固定请求数":
-                    c1, c2, c3, c4 = st.columns(4)
-                    c1.metric("总请求", stats["total"])
-                    c2.metric("成功", stats["success"], f"{stats['success_rate']}%")
-                    c3.metric("失败", stats["failed"])
-                    c4.metric("QPS", stats["qps"])
-                    c1, c2 = st.columns(2)
-                    c1.metric("平均耗时", f"{stats['avg_time']}s")
-                    c2.metric("P95 耗时", f"{stats['p95_time']}s")
-                    c1, c2 = st.columns(2)
-                    c1.metric("总耗时", f"{stats['total_wall_time']}s")
-                else:  # 固定时长
-                    c1, c2, c3, c4 = st.columns(4)
-                    c1.metric("测试时长", f"{stats['duration']}s", f"目标: {stats['target_duration']}s")
-                    c2.metric("总请求", stats["total"])
-                    c3.metric("成功", stats["success"], f"{stats['success_rate']}%")
-                    c4.metric("失败", stats["failed"])
-                    c1, c2, c3 = st.columns(3)
-                    c1.metric("QPS", stats["qps"])
-                    c2.metric("平均耗时", f"{stats['avg_time']}s")
-                    c3.metric("P95 耗时", f"{stats['p95_time']}s")
+                    dist_result["duration"] = dist_params["duration"]
+                st.session_state.test_results.append(dist_result)
+                # 代理不回传直方图，结果库只保存汇总统计与逐秒序列
+                save_run(mode_name, stats, None, {**dist_params, "agents": len(agents), "engine": engine},
+                         dist_result["test_mode"])
 
-                if stats.get("failures"):
-                    with st.expander("⚠️ 失败请求"):
-                        for e in stats["failures"]:
-                            st.error(e)
-            else:
-                st.error("测试失败，无法显示结果")
+with tab4:
+    st.subheader("多端点对比压测")
+    st.caption("所有目标在同一次测试中交替发送相同的请求（每轮顺序随机），避免分开测试时网络与时段差异混入对比；"
+               "每个目标独立的客户端与连接池，使用左侧的超时 / 压测引擎 / 连接设置。第一个目标为基线。")
+    target_text = st.text_area("目标（每行一个，至少两个）",
+                               f"name=A,base_url={base_url},model={model}\nname=B,base_url={base_url},model={model}",
+                               help="name=...,base_url=...,model=...,api_key=...；缺省字段取左侧配置（API Key 建议留在左侧）")
+    cmp_prompt = st.text_input("测试问题", "你好，请告诉我今天的天气。", key="cmp_prompt")
+    cmp_mode = st.radio("调度方式", ["固定时长", "固定速率"], horizontal=True, key="cmp_mode",
+                        help="固定时长：虚拟用户每轮向每个目标各发一次；固定速率：每个目标各自承受相同的开环速率")
+    c1, c2, c3 = st.columns(3)
+    cmp_duration = c1.number_input("测试时长（秒）", 10, 86400, 60, key="cmp_duration")
+    cmp_concur = c2.number_input("虚拟用户数" if cmp_mode == "固定时长" else "每个目标的在途上限", 1, 10000, 10,
+                                 key="cmp_concur")
+    cmp_rps = c3.number_input("每个目标的速率（req/s）", 0.1, 10000.0, 5.0, key="cmp_rps") \
+        if cmp_mode == "固定速率" else None
+    cmp_stream = st.checkbox("流式压测（对比 TTFT / 解码速度）", True, key="cmp_stream")
+
+    if st.button("⚖️ 开始对比测试"):
+        testers = {}
+        try:
+            targets = [parse_target(line, {"base_url": base_url, "api_key": api_key, "model": model})
+                       for line in target_text.splitlines() if line.strip()]
+            if len(targets) < 2 or len({t["name"] for t in targets}) < len(targets):
+                raise ValueError("至少需要两个目标，且 name 不能重复")
+            for t in targets:
+                testers[t["name"]] = make_tester({"base_url": t["base_url"], "api_key": t["api_key"],
+                                                  "model": t["model"], "timeout": timeout, "engine": engine,
+                                                  **connection_config})
+        except ValueError as e:
+            st.error(str(e))
+            testers = {}
+        if testers:
+            live = st.empty()
+
+            def cmp_progress(data: dict):
+                live.info(f"⏱️ {data['elapsed']:.2f}s/{int(data['target'])}s, requests={data['requests']}, "
+                          f"success={data['success']}, qps={data['qps']:.2f}")
+
+            try:
+                result = compare_test(testers, duration=cmp_duration, concurrency=cmp_concur, prompt=cmp_prompt,
+                                      rps=cmp_rps, system_prompt=system_prompt, temperature=temperature,
+                                      max_tokens=max_tokens, show_progress=False, progress_callback=cmp_progress,
+                                      stream=cmp_stream)
+            except Exception as e:
+                live.empty()
+                st.error(f"对比测试失败: {e}")
+                result = None
+            finally:
+                for tester in testers.values():
+                    tester.close()
+            if result is not None:
+                live.success(f"✅ 对比测试完成：{len(result['targets'])} 个目标，共 {result['total']} 个请求")
+                st.dataframe(pd.DataFrame([
+                    {"目标": t["name"], "请求数": t["stats"]["total"], "成功率(%)": t["stats"]["success_rate"],
+                     "QPS": t["stats"]["qps"], "平均耗时(s)": t["stats"]["avg_time"],
+                     "P50(s)": t["stats"]["p50_time"], "P95(s)": t["stats"]["p95_time"],
+                     "P99(s)": t["stats"]["p99_time"], "TTFT P50(s)": t["stats"].get("ttft_p50")}
+                    for t in result["targets"]]), use_container_width=True)
+                names = [t["name"] for t in result["targets"]]
+                st.markdown(f"**相对基线 {result['baseline']} 的变化（%）**")
+                st.dataframe(pd.DataFrame([
+                    {"指标": row["label"], **{n: row[n] for n in names},
+                     **{f"{n} 变化(%)": row.get(f"{n}_change") for n in names[1:]}}
+                    for row in result["diff"]]), use_container_width=True)
+                for line in summarize(result):
+                    st.info(line)
+                frames = [timeseries_frame(t["stats"]["timeseries"])["p95"].rename(t["name"])
+                          for t in result["targets"] if t["stats"]["timeseries"].get("t")]
+                if frames:
+                    st.caption("各目标窗口内 P95 (s)")
+                    st.line_chart(pd.concat(frames, axis=1))
+                st.session_state.test_results.append({
+                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "test_mode": f"对比压测（{cmp_mode}）",
+                    "prompt": cmp_prompt,
+                    "concurrency": cmp_concur,
+                    "duration": cmp_duration,
+                    "stats": result
+                })
 
 # 导出功能和历史记录（移到测试区域外）
+with tab5:
+    st.subheader("结果库与回归对比")
+    st.caption(f"结果库文件: {store_path}。对比使用自助法（bootstrap）估计 P50 / P95 / QPS / 成功率变化的置信区间，"
+               "显著变差且超过阈值时判定为回归；命令行可用 `--gate <标签>` 在发布后自动检查。")
+    try:
+        store = open_store(store_path)
+        runs = store.list(200)
+    except Exception as e:
+        st.error(f"无法打开结果库: {e}")
+        runs = []
+    if not runs:
+        st.info("结果库中还没有运行，完成一次并发压测后会自动保存。")
+    else:
+        st.dataframe(pd.DataFrame(runs), use_container_width=True, hide_index=True)
+        names = {r["id"]: f"#{r['id']} {r['time']} {r['mode']} {r['model']}"
+                 + (f" [{r['tags']}]" if r["tags"] else "") + (f" {r['label']}" if r["label"] else "") for r in runs}
+        ids = list(names)
+        c1, c2 = st.columns(2)
+        base_id = c1.selectbox("基线", ids, index=min(1, len(ids) - 1), format_func=names.get, key="store_base")
+        new_id = c2.selectbox("新运行", ids, index=0, format_func=names.get, key="store_new")
+        c1, c2, c3 = st.columns(3)
+        threshold = c1.number_input("回归阈值（%）", 0.0, 100.0, 5.0, help="显著变差且变化超过该值时判定为回归")
+        confidence = c2.selectbox("置信水平", [0.9, 0.95, 0.99], index=1)
+        resamples = c3.number_input("重抽样次数", 200, 20000, 2000, step=200)
+        if st.button("🔬 对比", key="store_compare"):
+            result = compare_runs(store.get(base_id), store.get(new_id), resamples=resamples,
+                                  confidence=confidence, threshold=threshold)
+            table = pd.DataFrame(result["rows"])
+            table["status"] = table["status"].map(STATUS_TEXT)
+            st.dataframe(table[["label", "base", "new", "change", "low", "high", "status"]].rename(columns={
+                "label": "指标", "base": f"基线 #{base_id}", "new": f"新 #{new_id}", "change": "变化%",
+                "low": "区间下限%", "high": "区间上限%", "status": "结论"}), use_container_width=True, hide_index=True)
+            if result["passed"]:
+                st.success("✅ 未发现显著回归")
+            else:
+                st.error(f"❌ 显著回归: {', '.join(result['regressions'])}")
+        c1, c2 = st.columns(2)
+        tag_id = c1.selectbox("运行", ids, format_func=names.get, key="store_tag_run")
+        tag_name = c2.text_input("标签", "baseline", help="同名标签会从原来的运行上移走")
+        if st.button("🏷️ 打标签", key="store_tag"):
+            try:
+                store.tag(tag_id, tag_name)
+                st.rerun()
+            except ValueError as e:
+                st.error(str(e))
+
 st.markdown("---")
 st.subheader("📊 导出测试报告")
 
-col1, col2, col3 = st.columns(3)
+col1, col2, col3, col4 = st.columns(4)
 
 with col1:
     # 导出为Excel
@@ -307,14 +810,39 @@ with col1:
                         "成功率(%)": result["stats"]["success_rate"],
                         "平均耗时(s)": result["stats"]["avg_time"],
                         "P95耗时(s)": result["stats"]["p95_time"],
+                        "P99耗时(s)": result["stats"].get("p99_time", 0),
                         "QPS": result["stats"]["qps"]
                     }
-                    if result["test_mode"] == "固定请求数":
+                    if result["test_mode"].endswith("固定请求数"):
                         row["总请求数"] = result.get("total_requests", 0)
                         row["总耗时(s)"] = result["stats"].get("total_wall_time", 0)
                     else:
                         row["测试时长(s)"] = result.get("duration", 0)
                         row["实际时长(s)"] = result["stats"].get("duration", 0)
+                    if result["test_mode"].endswith("固定速率"):
+                        row["目标速率(req/s)"] = result["stats"]["target_rps"]
+                        row["实际发出速率(req/s)"] = result["stats"]["offered_rps"]
+                        row["发送滞后P95(s)"] = result["stats"].get("send_lag_p95", 0)
+                        row["计划时刻起算P95(s)"] = result["stats"].get("intended_time_p95", 0)
+                    if "ttft_avg" in result["stats"]:
+                        row["TTFT P50(s)"] = result["stats"]["ttft_p50"]
+                        row["TTFT P95(s)"] = result["stats"]["ttft_p95"]
+                        row["Token间隔 P95(s)"] = result["stats"]["itl_p95"]
+                        row["解码速度 P50(tok/s)"] = result["stats"]["tps_p50"]
+                    if "output_tps" in result["stats"]:
+                        row["输入token/s"] = result["stats"]["input_tps"]
+                        row["输出token/s"] = result["stats"]["output_tps"]
+                        row["推理token数"] = result["stats"]["reasoning_tokens"]
+                        row["用量来自服务端(%)"] = result["stats"]["usage_reported_pct"]
+                    if "goodput_slo" in result["stats"]:
+                        row["Goodput SLO(s)"] = result["stats"]["goodput_slo"]
+                        row["SLO达标率(%)"] = result["stats"]["slo_attainment"]
+                        row["Goodput(req/s)"] = result["stats"]["goodput_rps"]
+                        row["Goodput(输出token/s)"] = result["stats"]["goodput_tps"]
+                    if "pool_wait_avg" in result["stats"]:
+                        row["新建连接数"] = result["stats"]["new_connections"]
+                        row["池等待P95(s)"] = result["stats"]["pool_wait_p95"]
+                        row["TCP建连P95(s)"] = result["stats"].get("connect_time_p95", 0)
                     df_data.append(row)
             
             if df_data:
@@ -348,6 +876,36 @@ with col2:
             st.warning("暂无测试数据可导出")
 
 with col3:
+    # 导出逐秒时间序列（所有测试记录拼接为一张表，以测试时间区分）
+    ts_format = st.selectbox("时间序列格式", ["CSV", "Parquet", "JSON"], label_visibility="collapsed")
+    if st.button("📈 导出时间序列"):
+        series = [r for r in st.session_state.test_results if r.get("stats", {}).get("timeseries", {}).get("t")]
+        if series:
+            file_name = f"api_test_timeseries_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            if ts_format == "JSON":
+                data = json.dumps([{"timestamp": r["timestamp"], "test_mode": r["test_mode"],
+                                    "timeseries": r["stats"]["timeseries"]} for r in series], ensure_ascii=False)
+                mime, ext = "application/json", "json"
+            else:
+                df = pd.concat([pd.DataFrame(r["stats"]["timeseries"]).assign(测试时间=r["timestamp"],
+                                                                              测试模式=r["test_mode"])
+                                for r in series], ignore_index=True)
+                if ts_format == "CSV":
+                    data, mime, ext = df.to_csv(index=False, encoding='utf-8-sig'), "text/csv", "csv"
+                else:
+                    buf = io.BytesIO()
+                    try:
+                        df.to_parquet(buf, index=False)
+                    except ImportError:
+                        buf = None
+                        st.warning("导出 Parquet 需要安装 pyarrow：pip install pyarrow")
+                    data, mime, ext = (buf.getvalue() if buf else None), "application/octet-stream", "parquet"
+            if data is not None:
+                st.download_button(label="💾 下载时间序列", data=data, file_name=f"{file_name}.{ext}", mime=mime)
+        else:
+            st.warning("暂无时间序列可导出")
+
+with col4:
     # 清空历史记录
     if st.button("🗑️ 清空测试记录"):
         st.session_state.test_results = []
@@ -370,7 +928,7 @@ if st.session_state.test_results:
                     st.write(f"**平均耗时**: {result['stats']['avg_time']}s")
                     st.write(f"**P95耗时**: {result['stats']['p95_time']}s")
                     st.write(f"**QPS**: {result['stats']['qps']}")
-                    if result['test_mode'] == "固定请求数":
+                    if result['test_mode'].endswith("固定请求数"):
                         st.write(f"**总耗时**: {result['stats'].get('total_wall_time', 0)}s")
                     else:
                         st.write(f"**测试时长**: {result.get('duration', 0)}s")
@@ -0,0 +1,208 @@
+# coding=utf-8
+"""
+压测客户端自测：用本地模拟服务（mock_server.py）测量压测工具自身的性能上限
+
+服务端零延迟、不限速时，测得的最大 QPS 与每请求 CPU 时间就是压测客户端的天花板：
+对真实服务压出的 QPS 接近这个值时，瓶颈在客户端而不是被测服务。
+结果可保存为基线（--out），之后用 --baseline 对比，QPS 下降或 CPU/请求 上升超过阈值即判定为回归（退出码 1）。
+测试前先校验精简请求路径（raw）与 openai SDK 路径对同一请求的结果一致（回答、推理内容、token 数）。
+
+用法：
+    python bench.py                                    # 默认矩阵：thread/async × sdk/raw × 非流式/流式 × 固定时长/固定请求数
+    python bench.py --engines async --concurrency 64,256 --out baseline.json
+    python bench.py --baseline baseline.json --threshold 10
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+from typing import Dict, Any, List
+from multiproc import make_tester
+
+MODES = ("duration", "concurrent")
+
+
+def start_mock_server(port: int, output_tokens: int, chunk_tokens: int) -> subprocess.Popen:
+    """在独立进程中启动零延迟的模拟服务，避免与被测客户端争抢 CPU（计入 CPU 时间）"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_server.py")
+    proc = subprocess.Popen([sys.executable, script, "--port", str(port), "--latency-mean", "0",
+                             "--output-tokens", str(output_tokens), "--chunk-tokens", str(chunk_tokens)],
+                            stdout=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError(f"模拟服务未能在端口 {port} 上启动")
+
+
+def bench_config(base_url: str, engine: str, path: str) -> Dict[str, Any]:
+    return {"base_url": base_url, "api_key": "mock", "model": "mock", "timeout": 30, "engine": engine,
+            "request_path": path}
+
+
+def validate_paths(base_url: str, engines: List[str]) -> List[str]:
+    """对同一请求分别走 SDK 与精简路径，比较回答、推理内容与 token 数，返回不一致项"""
+    problems = []
+    for engine in engines:
+        testers = {path: make_tester(bench_config(base_url, engine, path)) for path in ("sdk", "raw")}
+        for stream in (False, True):
+            results = {path: t.single_chat("validate", "You are a helpful assistant.", 0, 64, stream)
+                       for path, t in testers.items()}
+            for field in ("success", "response", "reasoning", "output_tokens", "error"):
+                if results["sdk"].get(field) != results["raw"].get(field):
+                    problems.append(f"{engine}/{'stream' if stream else 'chat'}: {field} 不一致 "
+                                    f"(sdk={results['sdk'].get(field)!r}, raw={results['raw'].get(field)!r})")
+        for t in testers.values():
+            t.close()
+    return problems
+
+
+def run_case(base_url: str, engine: str, path: str, mode: str, stream: bool, concurrency: int,
+             duration: int, total: int) -> Dict[str, Any]:
+    """执行一个基准用例，返回 QPS、每请求 CPU 时间与延迟分位"""
+    tester = make_tester(bench_config(base_url, engine, path))
+    # 预热：建立连接池，避免把建连开销计入稳态
+    tester.concurrent_test("warmup", concurrency, concurrency, show_progress=False, stream=stream)
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    if mode == "duration":
+        stats = tester.duration_test("benchmark", duration, concurrency, show_progress=False, stream=stream)
+    else:
+        stats = tester.concurrent_test("benchmark", total, concurrency, show_progress=False, stream=stream)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    if hasattr(tester, "close"):
+        tester.close()
+
+    return {
+        "engine": engine,
+        "path": path,
+        "mode": mode,
+        "stream": stream,
+        "concurrency": concurrency,
+        "requests": stats["total"],
+        "success_rate": stats["success_rate"],
+        "qps": stats["qps"],
+        "cpu_ms_per_req": round(cpu / max(1, stats["total"]) * 1000, 3),
+        "cpu_util": round(cpu / wall, 2),
+        "p50_time": stats["p50_time"],
+        "p99_time": stats["p99_time"]
+    }
+
+
+def case_key(row: Dict[str, Any]) -> str:
+    return (f"{row['engine']}/{row.get('path', 'sdk')}/{row['mode']}/{'stream' if row['stream'] else 'chat'}"
+            f"/c{row['concurrency']}")
+
+
+def compare(rows: List[Dict[str, Any]], baseline: List[Dict[str, Any]], threshold: float) -> List[str]:
+    """与基线逐用例对比，返回回归描述（QPS 下降或 CPU/请求 上升超过 threshold%）"""
+    base = {case_key(r): r for r in baseline}
+    regressions = []
+    for row in rows:
+        old = base.get(case_key(row))
+        if old is None:
+            continue
+        qps_change = (row["qps"] - old["qps"]) / old["qps"] * 100 if old["qps"] else 0
+        cpu_change = (row["cpu_ms_per_req"] - old["cpu_ms_per_req"]) / old["cpu_ms_per_req"] * 100 \
+            if old["cpu_ms_per_req"] else 0
+        row["qps_change"] = round(qps_change, 1)
+        row["cpu_change"] = round(cpu_change, 1)
+        if qps_change < -threshold:
+            regressions.append(f"{case_key(row)}: QPS {old['qps']} -> {row['qps']} ({qps_change:+.1f}%)")
+        if cpu_change > threshold:
+            regressions.append(f"{case_key(row)}: CPU/请求 {old['cpu_ms_per_req']}ms -> "
+                               f"{row['cpu_ms_per_req']}ms ({cpu_change:+.1f}%)")
+    return regressions
+
+
+def format_table(rows: List[Dict[str, Any]]) -> str:
+    lines = [f"{'用例':<36} {'请求数':>8} {'成功率%':>8} {'QPS':>9} {'CPU/请求(ms)':>12} {'CPU占用':>7} "
+             f"{'P50(s)':>7} {'P99(s)':>7}"]
+    for row in rows:
+        change = f"  QPS {row['qps_change']:+}% CPU {row['cpu_change']:+}%" if "qps_change" in row else ""
+        lines.append(f"{case_key(row):<36} {row['requests']:>8} {row['success_rate']:>8} {row['qps']:>9} "
+                     f"{row['cpu_ms_per_req']:>12} {row['cpu_util']:>7} {row['p50_time']:>7} "
+                     f"{row['p99_time']:>7}{change}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="压测客户端自测：对本地模拟服务测量最大 QPS 与每请求 CPU 时间")
+    parser.add_argument("--engines", default="thread,async", help="参与测试的引擎，逗号分隔")
+    parser.add_argument("--paths", default="sdk,raw", help="请求路径：sdk（openai SDK）、raw（精简路径）")
+    parser.add_argument("--modes", default=",".join(MODES), help="测试模式：duration（固定时长）、concurrent（固定请求数）")
+    parser.add_argument("--stream", choices=["both", "off", "on"], default="both", help="是否测试流式请求")
+    parser.add_argument("--concurrency", default="32", help="并发数列表，逗号分隔")
+    parser.add_argument("--duration", type=int, default=5, help="固定时长用例的时长（秒）")
+    parser.add_argument("--total", type=int, default=2000, help="固定请求数用例的请求数")
+    parser.add_argument("--output-tokens", type=int, default=16, help="模拟服务每个回答的 token 数")
+    parser.add_argument("--chunk-tokens", type=int, default=1, help="模拟服务流式输出每块 token 数")
+    parser.add_argument("--port", type=int, default=18999, help="模拟服务端口")
+    parser.add_argument("--base-url", help="使用已启动的模拟服务（不自动启动）")
+    parser.add_argument("--out", help="把结果保存为 JSON 基线")
+    parser.add_argument("--baseline", help="与之前保存的基线对比")
+    parser.add_argument("--threshold", type=float, default=10.0, help="判定回归的变化阈值（%%）")
+    args = parser.parse_args()
+
+    streams = {"both": [False, True], "off": [False], "on": [True]}[args.stream]
+    engines = args.engines.split(",")
+    cases = [(engine, path, mode, stream, int(c))
+             for engine in engines
+             for path in args.paths.split(",")
+             for mode in args.modes.split(",")
+             for stream in streams
+             for c in args.concurrency.split(",")]
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = start_mock_server(args.port, args.output_tokens, args.chunk_tokens)
+        base_url = f"http://127.0.0.1:{args.port}/v1"
+    rows = []
+    try:
+        mismatches = validate_paths(base_url, engines)
+        if mismatches:
+            print("❌ 精简请求路径与 SDK 路径结果不一致:")
+            for line in mismatches:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("✅ 精简请求路径与 SDK 路径结果一致")
+        for engine, path, mode, stream, concurrency in cases:
+            print(f"⏱️ {engine}/{path}/{mode}/{'stream' if stream else 'chat'}/c{concurrency} ...")
+            rows.append(run_case(base_url, engine, path, mode, stream, concurrency, args.duration, args.total))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=5)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(rows, json.load(f)["results"], args.threshold)
+    print("\n📊 压测客户端自测结果:")
+    print(format_table(rows))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"created": time.strftime("%Y-%m-%d %H:%M:%S"), "python": sys.version.split()[0],
+                       "cpu_count": os.cpu_count(), "results": rows}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 基线已保存到 {args.out}")
+    if regressions:
+        print("\n❌ 检测到性能回归:")
+        for line in regressions:
+            print(f"  - {line}")
+        sys.exit(1)
+    elif args.baseline:
+        print(f"\n✅ 与基线相比无超过 {args.threshold}% 的回归")
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,8 @@ python cli_tester.py --base-url xxx --api-key sk-xxx --model xxx --concurrency 1
 python cli_tester.py --base-url xxx --api-key sk-xxx --model xxx --concurrency 10 --duration 120
 python cli_tester.py --base-url xxx --api-key sk-xxx --model xxx --concurrency 20 --duration 120
 ...
+也可以一条命令自动跑完全部阶梯，SLO 失败或 QPS 不再线性增长时自动停止：
+python cli_tester.py --base-url xxx --api-key sk-xxx --model xxx --ramp 10,20,35,50 --duration 120 --slo-p95 15
 
 
 第3步：分析数据，得出结论
@@ -43,26 +45,593 @@ QPS 相比基线有显著提升
 
 '''
 
+import sys
 import argparse
-from tester import OpenAITester
+from ramp import parse_stages, ramp_test, format_ramp_table
+from sweep import (SyntheticPrompts, parse_sizes, sweep_test, format_sweep_table, format_sweep_matrix, sweep_columns,
+                   batch_sweep_test, format_batch_table, format_batch_matrix)
+from endpoints import ENDPOINTS, check_batch, describe_endpoint
+from compare import parse_target, compare_test, format_diff_table, summarize
+from steady import SteadyState, describe
+from sessions import PREFIX_MODES, SessionScript, compare_prefix_modes, format_session_table, format_compare_table
+from adaptive import ALGORITHMS, ConcurrencyController, format_adaptive_table
+from multiproc import multiprocess_test, make_tester
+from distributed import LoadAgent, distributed_test
+from workload import JsonlWorkload, SAMPLING_MODES
+from stats import RunStats, write_timeseries
+from soak import soak_test, analyze_log
+from profiler import profile_call
+from runstore import RunStore, check_tag, format_runs_table
+from regression import compare_runs, format_regression_table
+from metrics import MetricsServer
+from tracing import SpanRecorder, TRACE_FORMATS
+from transport import CLIENT_MODES
+
+
+def print_latency_stats(stats):
+    """打印完整延迟分布（由直方图估算，相对误差约 1%）"""
+    print(f"  延迟分布: p50={stats['p50_time']}s p90={stats['p90_time']}s p99={stats['p99_time']}s "
+          f"p99.9={stats['p999_time']}s min={stats['min_time']}s max={stats['max_time']}s std={stats['std_time']}s")
+
+
+def print_stream_stats(stats):
+    """打印流式压测的 TTFT / token 间隔 / 解码速度分布"""
+    if "ttft_avg" not in stats:
+        return
+    for key, label, unit in (("ttft", "TTFT 首token", "s"), ("itl", "Token 间隔", "s"), ("tps", "解码速度", " tok/s")):
+        print(f"  {label}: avg={stats[key + '_avg']}{unit} p50={stats[key + '_p50']}{unit} "
+              f"p95={stats[key + '_p95']}{unit} p99={stats[key + '_p99']}{unit}")
+
+
+def print_connection_stats(stats):
+    """打印连接层指标：新建连接数、连接池等待与建连耗时"""
+    if "pool_wait_avg" not in stats:
+        return
+    line = (f"  连接: 新建 {stats['new_connections']} 个, 池等待 avg={stats['pool_wait_avg']}s "
+            f"p95={stats['pool_wait_p95']}s p99={stats['pool_wait_p99']}s max={stats['pool_wait_max']}s")
+    if "connect_time_avg" in stats:
+        line += f", TCP 建连 avg={stats['connect_time_avg']}s p95={stats['connect_time_p95']}s"
+    if "tls_time_avg" in stats:
+        line += f", TLS 握手 avg={stats['tls_time_avg']}s p95={stats['tls_time_p95']}s"
+    print(line)
+
+
+def print_token_stats(stats):
+    """打印 token 吞吐（服务端 usage，未返回时为本地计数）与 goodput（--goodput-slo）"""
+    if "output_tps" in stats:
+        reasoning = f"（其中推理 {stats['reasoning_tokens']}）" if stats["reasoning_tokens"] else ""
+        print(f"  Token: 输入 {stats['input_tokens']} / 输出 {stats['output_tokens']}{reasoning}，"
+              f"输入 {stats['input_tps']} tok/s，输出 {stats['output_tps']} tok/s，合计 {stats['total_tps']} tok/s")
+        if stats["usage_reported_pct"] < 100:
+            print(f"  ⚠️ 仅 {stats['usage_reported_pct']}% 的请求由服务端返回 usage，其余 token 数为本地计数（近似值）")
+    if "goodput_slo" in stats:
+        print(f"  Goodput（耗时 ≤ {stats['goodput_slo']}s）: 达标 {stats['slo_attainment']}%，"
+              f"{stats['goodput_rps']} req/s，输出 {stats['goodput_tps']} tok/s")
+
+
+def print_batch_stats(stats):
+    """打印非聊天端点的批量吞吐：每秒处理的输入条数"""
+    if "items" not in stats:
+        return
+    print(f"  批量: 每请求 {stats['avg_batch']} 条输入，items/s {stats['items_per_sec']}")
+
+
+def print_client_stats(stats):
+    """打印压测客户端自身开销（--profile）与告警"""
+    client = stats.get("client")
+    if client is None:
+        return
+    line = (f"  客户端: CPU {client['cpu_util']} 核（每请求 {client['cpu_ms_per_req']}ms，共 {client['cpu_count']} 核）")
+    if "sched_lag_p99_ms" in client:
+        line += f", 线程调度延迟 p50={client['sched_lag_p50_ms']}ms p99={client['sched_lag_p99_ms']}ms"
+    if "loop_lag_p99_ms" in client:
+        line += f", 事件循环延迟 p50={client['loop_lag_p50_ms']}ms p99={client['loop_lag_p99_ms']}ms"
+    line += f", GC {client['gc_count']} 次共 {client['gc_total_ms']}ms（最长 {client['gc_max_ms']}ms）"
+    if "parse_share" in client:
+        line += f", 解析占请求耗时 {client['parse_share']}%"
+    print(line)
+    for warning in client["warnings"]:
+        print(f"  ⚠️ {warning}")
+    if not client["warnings"]:
+        print("  ✅ 客户端开销正常，测得的延迟与 QPS 未受压测工具本身限制")
+
+
+def analyze(path, timeseries=None):
+    """离线分析长稳测试日志并打印统计"""
+    header, stats = analyze_log(path)
+    params = header["params"]
+    print(f"📂 {path}: {header['mode']} / 并发 {params.get('concurrency')} / 目标时长 {params.get('duration')}s，"
+          f"{stats['sessions']} 次运行{'，已结束' if stats['ended'] else '，未结束（可 --resume 续跑）'}")
+    print("\n📊 长稳测试结果:")
+    print(f"  有效时长: {stats['duration']}s (目标: {stats['target_duration']}s)")
+    print(f"  总请求: {stats['total']}")
+    print(f"  成功: {stats['success']} ({stats['success_rate']}%)")
+    print(f"  失败: {stats['failed']}")
+    print(f"  平均耗时: {stats['avg_time']}s")
+    print(f"  P95 耗时: {stats['p95_time']}s")
+    print(f"  QPS: {stats['qps']}")
+    print_latency_stats(stats)
+    print_stream_stats(stats)
+    print_token_stats(stats)
+    print_connection_stats(stats)
+    print_batch_stats(stats)
+    if stats["failures"]:
+        print("  部分错误:")
+        for e in stats["failures"]:
+            print(f"    - {e}")
+    if timeseries:
+        write_timeseries(stats["timeseries"], timeseries)
+        print(f"📈 逐秒时间序列已写入 {timeseries}（{len(stats['timeseries']['t'])} 个窗口）")
+
+
+def run_regression(args, store, base_ref, new_ref):
+    """对比结果库中的两次运行并打印回归表，返回是否通过（没有回归）"""
+    result = compare_runs(store.get(base_ref), store.get(new_ref), resamples=args.bootstrap,
+                          threshold=args.regress_threshold)
+    print(f"\n🔬 回归对比: 基线 #{result['base_id']} ({base_ref}) → 新 #{result['new_id']} ({new_ref})，"
+          f"自助法 {result['resamples']} 次，回归阈值 {result['threshold']}%")
+    print(format_regression_table(result))
+    if result["passed"]:
+        print("✅ 未发现显著回归")
+    else:
+        print(f"❌ 显著回归: {', '.join(result['regressions'])}")
+    return result["passed"]
+
+
+def run_compare(args, targets, workload):
+    """多端点对比模式：每个目标独立的 tester 与连接池，连通性测试后交替压测并打印差异表"""
+    testers = {}
+    for target in targets:
+        config = {"base_url": target["base_url"], "api_key": target["api_key"], "model": target["model"],
+                  "timeout": args.timeout, "engine": args.engine, "pool_size": args.pool_size,
+                  "keepalive": not args.no_keepalive, "http2": args.http2, "client_mode": args.client_mode,
+                  "request_path": "raw" if args.raw else "sdk", "keep_text": not args.no_text,
+                  "endpoint": args.endpoint, "batch_size": args.batch_size, "stream_usage": not args.no_stream_usage}
+        tester = make_tester(config)
+        res = tester.single_chat(args.prompt, temperature=args.temperature, max_tokens=args.max_tokens)
+        if not res["success"]:
+            print(f"❌ {target['name']} 连通失败: {res['error']}")
+            return
+        print(f"✅ {target['name']} 连通成功（{target['model']} @ {target['base_url']}），响应时间: {res['time']}s")
+        testers[target["name"]] = tester
+
+    result = compare_test(
+        testers,
+        duration=args.duration,
+        concurrency=args.concurrency,
+        prompt=args.prompt,
+        rps=args.rps,
+        arrival=args.arrival,
+        temperature=args.temperature,
+        max_tokens=args.max_tokens,
+        stream=args.stream,
+        workload=workload
+    )
+
+    print("\n📊 对比测试结果:")
+    for target in result["targets"]:
+        stats = target["stats"]
+        print(f"  {target['name']}: 请求 {stats['total']}，成功 {stats['success']} ({stats['success_rate']}%)，"
+              f"QPS {stats['qps']}，P50 {stats['p50_time']}s，P95 {stats['p95_time']}s")
+        for e in stats["failures"][:3]:
+            print(f"    - {e}")
+    print()
+    print(format_diff_table(result))
+    print()
+    for line in summarize(result):
+        print(f"  {line}")
+    if args.timeseries:
+        # 各目标的逐秒序列纵向拼接，以 target 列区分
+        columns = {}
+        for target in result["targets"]:
+            series = target["stats"]["timeseries"]
+            n = len(series["t"])
+            columns.setdefault("target", []).extend([target["name"]] * n)
+            for key, values in series.items():
+                columns.setdefault(key, []).extend(values)
+        write_timeseries(columns, args.timeseries)
+        print(f"📈 各目标的逐秒时间序列已写入 {args.timeseries}")
+    for tester in testers.values():
+        tester.close()
+
 
 def main():
     parser = argparse.ArgumentParser(description="OpenAI API 快速连通性 & 并发测试")
-    parser.add_argument("--base-url", required=True, help="API 地址，如 https://api.openai.com/v1")
-    parser.add_argument("--api-key", required=True, help="API Key")
-    parser.add_argument("--model", required=True, help="模型名，如 gpt-3.5-turbo")
+    parser.add_argument("--base-url", help="（必填）API 地址，如 https://api.openai.com/v1")
+    parser.add_argument("--api-key", help="（必填）API Key")
+    parser.add_argument("--model", help="（必填）模型名，如 gpt-3.5-turbo")
     parser.add_argument("--timeout", type=int, default=30, help="超时时间（秒）")
     parser.add_argument("--prompt", default="你好，ChatGPT", help="测试问题")
+    parser.add_argument("--workload", help="JSONL 数据集：每行 {prompt, [system_prompt], [max_tokens], [temperature], "
+                                           "[weight]}，压测时代替固定的 --prompt")
+    parser.add_argument("--workload-mode", choices=SAMPLING_MODES, default="sequential",
+                        help="数据集采样方式：sequential（顺序）、shuffle（打乱）、weighted（按 weight 加权）")
+    parser.add_argument("--workload-seed", type=int, help="数据集采样随机种子")
     parser.add_argument("--total", type=int, default=10, help="并发总请求数")
     parser.add_argument("--concurrency", type=int, default=5, help="并发数")
     parser.add_argument("--duration", type=int, help="固定时长测试模式（秒），与--total互斥")
     parser.add_argument("--temperature", type=float, default=0.7, help="温度")
     parser.add_argument("--max-tokens", type=int, default=4096, help="最大 tokens")
+    parser.add_argument("--engine", choices=["thread", "async"], default="thread",
+                        help="压测引擎：thread（线程池）或 async（asyncio，适合数百以上并发）")
+    parser.add_argument("--stream", action="store_true", help="流式压测，统计 TTFT、token 间隔与解码速度")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="工作进程数：并发数/总请求数/目标速率均分到各进程，结果合并（阶梯模式不适用）")
+    parser.add_argument("--agent", action="store_true", help="以压测代理身份运行，等待协调者下发任务")
+    parser.add_argument("--listen", default="127.0.0.1:8765", help="代理模式的监听地址 HOST:PORT")
+    parser.add_argument("--agents", help="协调者模式：代理地址列表，如 10.0.0.2:8765,10.0.0.3:8765，"
+                                         "负载均分到各代理（每个代理使用 --processes 个进程）")
+    parser.add_argument("--agent-token", help="代理共享口令（代理与协调者需一致）")
+    parser.add_argument("--start-delay", type=float, default=3.0,
+                        help="协调者模式：下发任务到各代理同步开始之间预留的秒数")
+    parser.add_argument("--rps", type=float, help="固定速率（开环）模式：目标每秒请求数，需配合 --duration，"
+                                                   "此时 --concurrency 为在途请求上限")
+    parser.add_argument("--arrival", choices=["constant", "poisson"], default="constant",
+                        help="固定速率模式的到达间隔：constant（等间隔）或 poisson（指数分布）")
+    parser.add_argument("--ramp", help="阶梯增压模式：并发阶梯，如 10,20,35,50 或 10:100:10（起始:上限:步长），"
+                                       "每阶梯时长取 --duration")
+    parser.add_argument("--slo-success-rate", type=float, default=100.0, help="阶梯/自适应模式 SLO：成功率下限（%%）")
+    parser.add_argument("--slo-p95", type=float, help="阶梯/自适应模式 SLO：P95 耗时上限（秒）")
+    parser.add_argument("--min-efficiency", type=float, default=0.5,
+                        help="阶梯模式：QPS 增长倍数/并发增长倍数 低于该值视为饱和")
+    parser.add_argument("--no-stop", action="store_true", help="阶梯模式：达到饱和或 SLO 失败后继续跑完剩余阶梯")
+    parser.add_argument("--sweep-input", help="长度扫描模式：输入 token 数列表，如 128,1024,4096（合成 prompt），"
+                                              "与 --sweep-output 组成网格，每格时长取 --duration")
+    parser.add_argument("--sweep-output", default="256", help="长度扫描模式：max_tokens 列表，如 64,256,1024")
+    parser.add_argument("--sweep-concurrency", help="长度/批量扫描模式：并发数列表，默认取 --concurrency")
+    parser.add_argument("--tokenizer", help="长度扫描/会话模式：用于生成精确 token 数 prompt 的 tokenizer，"
+                                            "tiktoken 编码名（如 cl100k_base）或 HuggingFace 模型名；默认按单词近似")
+    parser.add_argument("--sweep-reuse-prompt", action="store_true",
+                        help="长度扫描模式：所有请求使用同一 prompt（默认每个请求唯一前缀，避免命中服务端前缀缓存）")
+    parser.add_argument("--sweep-out", help="长度/批量扫描模式：把结果矩阵写入 .csv 或 .json 文件")
+    parser.add_argument("--endpoint", choices=ENDPOINTS, default="chat",
+                        help="压测的接口：chat（/chat/completions）、completions（旧版文本补全）或 embeddings（嵌入）")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="completions / embeddings：每个请求包含的输入条数（同一 prompt 重复），报告 items/s 与输入 token/s")
+    parser.add_argument("--batch-sweep", help="批量扫描模式（completions / embeddings）：批量列表，如 1,8,32,128，"
+                                              "与 --sweep-concurrency 组成网格，每格时长取 --duration")
+    parser.add_argument("--min-batch-gain", type=float, default=0.1,
+                        help="批量扫描：items/s 相对上一个批量的提升低于该比例时视为饱和")
+    parser.add_argument("--session-turns", type=int,
+                        help="多轮会话模式：每个虚拟用户（--concurrency）循环进行该轮数的对话，每轮追加之前的回答，"
+                             "按轮次统计耗时与 TTFT（始终流式），需配合 --duration")
+    parser.add_argument("--think-time", type=float, default=0.0, help="会话模式：轮与轮之间的平均思考时间（秒）")
+    parser.add_argument("--prefix-mode", default="shared",
+                        help="会话模式：shared（共享系统提示词）、unique（每个会话唯一前缀）、nocache（每个请求唯一前缀），"
+                             "逗号分隔多个时依次运行并对比每轮 TTFT，如 shared,nocache")
+    parser.add_argument("--system-tokens", type=int, default=0,
+                        help="会话模式：合成系统提示词的 token 数（越长前缀缓存收益越明显），默认只用空系统提示词")
+    parser.add_argument("--user-tokens", type=int, default=0,
+                        help="会话模式：每轮合成用户消息的 token 数，默认使用 --prompt 或数据集")
+    parser.add_argument("--target", action="append",
+                        help="对比模式（可重复，至少两个）：name=gw-a,base_url=...,model=...,api_key=...，"
+                             "缺省字段取 --base-url / --model / --api-key；所有目标在同一次测试中交替发送相同的请求，"
+                             "需配合 --duration（可加 --rps，此时为每个目标的速率），第一个目标为基线")
+    parser.add_argument("--warmup", type=float, default=0.0,
+                        help="固定时长/阶梯模式：预热时长（秒），期间的请求不计入统计")
+    parser.add_argument("--steady", action="store_true",
+                        help="固定时长/阶梯模式：预热后自动检测稳态（相邻窗口的吞吐与 P50 变化都小于容差），"
+                             "只统计稳态之后的请求")
+    parser.add_argument("--steady-window", type=int, default=5, help="稳态检测的窗口长度（秒）")
+    parser.add_argument("--steady-tolerance", type=float, default=0.1, help="稳态检测：相邻窗口的相对变化上限")
+    parser.add_argument("--ci-target", type=float,
+                        help="固定时长/阶梯模式：QPS 与 P95 置信区间的相对半宽都小于该值（如 0.05）时提前结束，"
+                             "--duration 作为上限")
+    parser.add_argument("--ci-confidence", type=float, default=0.95, help="置信区间的置信水平")
+    parser.add_argument("--adaptive", choices=ALGORITHMS,
+                        help="自适应并发模式：按延迟与错误信号自动调整并发，找出满足 SLO（--slo-success-rate / --slo-p95）"
+                             "的最大并发，需配合 --duration，--concurrency 为初始并发")
+    parser.add_argument("--min-concurrency", type=int, default=1, help="自适应模式：并发下限")
+    parser.add_argument("--max-concurrency", type=int, default=256, help="自适应模式：并发上限")
+    parser.add_argument("--control-interval", type=float, default=5.0, help="自适应模式：控制周期（秒）")
+    parser.add_argument("--pool-size", type=int, help="HTTP 连接池上限，默认 thread 引擎 1000、async 引擎 10000；"
+                                                      "应不小于并发数，否则请求会在客户端排队")
+    parser.add_argument("--no-keepalive", action="store_true", help="关闭连接复用，每个请求重新建连")
+    parser.add_argument("--http2", action="store_true", help="启用 HTTP/2（需 pip install 'httpx[http2]'）")
+    parser.add_argument("--client-mode", choices=CLIENT_MODES, default="shared",
+                        help="shared：所有 worker 共享一个客户端；per_worker：每个 worker 独立的客户端与连接池")
+    parser.add_argument("--raw", action="store_true", help="精简请求路径：预编码请求体 + 增量 SSE 解析，不经过 openai SDK"
+                                                         "（降低客户端 CPU；不自动重试 429/5xx）")
+    parser.add_argument("--no-text", action="store_true", help="不保留回答文本，只统计 token 数与字节数")
+    parser.add_argument("--no-stream-usage", action="store_true",
+                        help="流式请求不携带 stream_options.include_usage（服务端不接受该参数时使用），token 数改为本地计数")
+    parser.add_argument("--goodput-slo", type=float,
+                        help="goodput 的延迟 SLO（秒）：额外统计耗时不超过该值的请求的达标率、req/s 与输出 token/s")
+    parser.add_argument("--soak-log", help="长稳测试：把逐请求记录追加写入 JSONL 日志（.gz 结尾时压缩），"
+                                           "需配合 --duration，仅单进程")
+    parser.add_argument("--resume", action="store_true", help="长稳测试：日志已存在时恢复统计并跑完剩余时长")
+    parser.add_argument("--log-text", type=int, default=0, help="长稳测试：每条记录保留的回答文本字符数（默认不保留）")
+    parser.add_argument("--analyze", help="离线分析 --soak-log 写出的日志（无需连接服务），可配合 --timeseries")
+    parser.add_argument("--profile", action="store_true",
+                        help="采集压测客户端自身开销（CPU、调度/事件循环延迟、GC 停顿、解析耗时），"
+                             "客户端可能成为瓶颈时给出警告（仅单进程）")
+    parser.add_argument("--metrics-port", type=int,
+                        help="在该端口提供 Prometheus /metrics（请求计数、按类型的失败数、在途数、耗时/TTFT 直方图），"
+                             "测试期间实时更新（仅单进程）")
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="/metrics 监听地址，Prometheus 在其他机器上时设为 0.0.0.0")
+    parser.add_argument("--trace", help="逐请求时间线：把采样请求的各阶段（排队、拿连接、发送、首字节、首 token、解码）"
+                                        "写入 JSON 文件，可在 Perfetto 中按工作线程查看（仅单进程）")
+    parser.add_argument("--trace-format", choices=TRACE_FORMATS, default="chrome",
+                        help="时间线格式：chrome（Chrome trace，Perfetto / chrome://tracing）或 otlp（OTLP JSON）")
+    parser.add_argument("--trace-sample", type=float, default=1.0, help="时间线采样率（0~1）")
+    parser.add_argument("--trace-max", type=int, default=10000, help="时间线最多保留的请求数（蓄水池抽样）")
+    parser.add_argument("--store", help="结果库（SQLite 文件，如 runs.db）：保存本次测试的参数、统计与延迟分布，"
+                                        "也用于 --list-runs / --compare-runs / --gate")
+    parser.add_argument("--label", help="结果库：本次运行的备注")
+    parser.add_argument("--tag", action="append", help="结果库：给本次运行打标签（可重复），同名标签从旧运行上移走")
+    parser.add_argument("--tag-run", help="结果库：不运行测试，把 --tag 打在已有的运行上（id / 标签 / latest）")
+    parser.add_argument("--list-runs", type=int, nargs="?", const=20, help="结果库：列出最近 N 次运行（默认 20）")
+    parser.add_argument("--compare-runs", help="结果库：对比两次运行，如 baseline,latest 或 12,15；有回归时退出码为 1")
+    parser.add_argument("--gate", help="结果库：测试结束后与该运行（通常为标签）对比，有显著回归时退出码为 1")
+    parser.add_argument("--regress-threshold", type=float, default=5.0,
+                        help="回归对比：显著变差且变化超过该百分比时判定为回归")
+    parser.add_argument("--bootstrap", type=int, default=2000, help="回归对比：自助法重抽样次数")
+    parser.add_argument("--timeseries", help="把逐秒时间序列（吞吐、在途数、窗口内 P50/P95/P99、失败类型）"
+                                             "写入文件，.csv 或 .json")
 
     args = parser.parse_args()
+    if args.agent:
+        host, port = args.listen.rsplit(":", 1)
+        agent = LoadAgent(host, int(port), token=args.agent_token)
+        print(f"🛰️ 压测代理已启动，监听 {agent.address}，等待协调者下发任务（Ctrl+C 退出）")
+        try:
+            agent.serve_forever()
+        except KeyboardInterrupt:
+            agent.shutdown()
+        return
+    if args.analyze:
+        analyze(args.analyze, args.timeseries)
+        return
+    store = None
+    if args.store:
+        store = RunStore(args.store)
+    elif args.list_runs or args.compare_runs or args.gate or args.tag or args.tag_run:
+        parser.error("--list-runs / --compare-runs / --gate / --tag / --tag-run 需要配合 --store")
+    if args.list_runs or args.compare_runs or args.tag_run:
+        try:
+            if args.tag_run:
+                if not args.tag:
+                    parser.error("--tag-run 需要配合 --tag")
+                for name in args.tag:
+                    run_id = store.tag(args.tag_run, name)
+                    print(f"🏷️ 已给运行 #{run_id} 打上标签 {name}")
+            if args.list_runs:
+                print(format_runs_table(store.list(args.list_runs)))
+            if args.compare_runs:
+                refs = [r.strip() for r in args.compare_runs.split(",")]
+                if len(refs) != 2:
+                    parser.error("--compare-runs 需要两个运行，如 baseline,latest")
+                if not run_regression(args, store, *refs):
+                    sys.exit(1)
+        except ValueError as e:
+            parser.error(str(e))
+        return
+    if args.target:
+        if len(args.target) < 2:
+            parser.error("对比模式至少需要两个 --target")
+        if not args.duration or args.ramp or args.adaptive or args.sweep_input or args.session_turns is not None \
+                or args.agents or args.processes > 1 or args.soak_log or args.metrics_port is not None \
+                or args.trace or args.profile:
+            parser.error("--target 需要配合 --duration（可加 --rps），不支持 --ramp / --adaptive / --sweep-input / "
+                         "--session-turns / --agents / --processes / --soak-log / --metrics-port / --trace / --profile")
+        defaults = {"base_url": args.base_url, "api_key": args.api_key, "model": args.model}
+        try:
+            targets = [parse_target(spec, defaults) for spec in args.target]
+        except ValueError as e:
+            parser.error(str(e))
+        if len({t["name"] for t in targets}) < len(targets):
+            parser.error("--target 的 name 不能重复")
+        workload = None
+        if args.workload:
+            workload = JsonlWorkload(args.workload, mode=args.workload_mode, seed=args.workload_seed)
+        try:
+            run_compare(args, targets, workload)
+        except ValueError as e:
+            parser.error(str(e))
+        return
+    if not (args.base_url and args.api_key and args.model):
+        parser.error("--base-url、--api-key、--model 为必填参数")
+    if args.rps and not args.duration:
+        parser.error("--rps 需要配合 --duration 使用")
+    if args.goodput_slo is not None and args.goodput_slo <= 0:
+        parser.error(f"--goodput-slo 需为正数: {args.goodput_slo}")
+    try:
+        check_batch(args.endpoint, args.batch_size)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.endpoint != "chat" and (args.session_turns is not None or args.sweep_input):
+        parser.error("--session-turns / --sweep-input 只适用于 chat 端点")
+    if args.ramp:
+        if not args.duration:
+            parser.error("--ramp 需要配合 --duration（每阶梯时长）使用")
+        try:
+            stages = parse_stages(args.ramp)
+        except ValueError as e:
+            parser.error(str(e))
+    sweep = None
+    if args.sweep_input:
+        if not args.duration or args.ramp or args.rps or args.adaptive or args.agents or args.processes > 1 \
+                or args.soak_log or args.metrics_port is not None or args.trace:
+            parser.error("--sweep-input 需要配合 --duration（每格时长），不支持 --ramp / --rps / --adaptive / --agents / "
+                         "--processes / --soak-log / --metrics-port / --trace")
+        try:
+            sweep = (parse_sizes(args.sweep_input), parse_sizes(args.sweep_output),
+                     parse_sizes(args.sweep_concurrency) if args.sweep_concurrency else [args.concurrency],
+                     SyntheticPrompts(args.tokenizer, unique=not args.sweep_reuse_prompt))
+        except ValueError as e:
+            parser.error(str(e))
+    batch_sweep = None
+    if args.batch_sweep:
+        if args.endpoint == "chat":
+            parser.error("--batch-sweep 需要配合 --endpoint completions 或 embeddings")
+        if not args.duration or args.ramp or args.rps or args.adaptive or args.agents or args.processes > 1 \
+                or args.soak_log or args.metrics_port is not None or args.trace or args.warmup > 0 or args.steady \
+                or args.ci_target is not None:
+            parser.error("--batch-sweep 需要配合 --duration（每格时长），不支持 --ramp / --rps / --adaptive / --agents / "
+                         "--processes / --soak-log / --metrics-port / --trace / --warmup / --steady / --ci-target")
+        try:
+            batch_sweep = (parse_sizes(args.batch_sweep),
+                           parse_sizes(args.sweep_concurrency) if args.sweep_concurrency else [args.concurrency])
+        except ValueError as e:
+            parser.error(str(e))
+    session_modes = None
+    if args.session_turns is not None:
+        if not args.duration or args.ramp or args.rps or args.adaptive or args.sweep_input or args.agents \
+                or args.processes > 1 or args.soak_log:
+            parser.error("--session-turns 需要配合 --duration，不支持 --ramp / --rps / --adaptive / --sweep-input / "
+                         "--agents / --processes / --soak-log")
+        if args.no_text:
+            parser.error("--session-turns 需要保留回答文本以追加到对话历史，不能与 --no-text 同时使用")
+        session_modes = [m.strip() for m in args.prefix_mode.split(",") if m.strip()]
+        if not session_modes or any(m not in PREFIX_MODES for m in session_modes):
+            parser.error(f"--prefix-mode 的取值需为 {' / '.join(PREFIX_MODES)}: {args.prefix_mode}")
+        if len(session_modes) > 1 and (args.metrics_port is not None or args.trace or args.timeseries):
+            parser.error("对比多个 --prefix-mode 时不支持 --metrics-port / --trace / --timeseries，请逐个模式运行")
+        try:
+            script = SessionScript(args.session_turns, args.think_time, session_modes[0], args.system_tokens,
+                                   args.user_tokens, SyntheticPrompts(args.tokenizer))
+        except ValueError as e:
+            parser.error(str(e))
+    controller = None
+    if args.adaptive:
+        if not args.duration or args.ramp or args.rps or args.agents or args.processes > 1 or args.soak_log:
+            parser.error("--adaptive 需要配合 --duration，不支持 --ramp / --rps / --agents / --processes / --soak-log")
+        try:
+            controller = ConcurrencyController(
+                initial=args.concurrency, min_limit=args.min_concurrency, max_limit=args.max_concurrency,
+                algorithm=args.adaptive, min_success_rate=args.slo_success_rate, max_p95=args.slo_p95,
+                interval=args.control_interval)
+        except ValueError as e:
+            parser.error(str(e))
+    steady_options = None
+    if args.warmup > 0 or args.steady or args.ci_target is not None:
+        if not args.duration or args.rps or args.adaptive or args.session_turns is not None or args.sweep_input \
+                or args.agents or args.processes > 1 or args.soak_log:
+            parser.error("--warmup / --steady / --ci-target 需要配合 --duration（可加 --ramp），不支持 --rps / --adaptive / "
+                         "--session-turns / --sweep-input / --agents / --processes / --soak-log")
+        steady_options = {"warmup": args.warmup, "detect": args.steady, "window": args.steady_window,
+                          "tolerance": args.steady_tolerance, "ci_target": args.ci_target,
+                          "confidence": args.ci_confidence}
+        try:
+            SteadyState(**steady_options).resolve_max_warmup(args.duration)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.profile and (args.ramp or args.agents or args.processes > 1):
+        parser.error("--profile 只统计当前进程，不支持 --ramp / --agents / --processes")
+    if args.metrics_port is not None and (args.ramp or args.agents or args.processes > 1):
+        parser.error("--metrics-port 只导出当前进程的统计，不支持 --ramp / --agents / --processes")
+    recorder = None
+    if args.trace:
+        if args.ramp or args.agents or args.processes > 1:
+            parser.error("--trace 只记录当前进程的请求，不支持 --ramp / --agents / --processes")
+        try:
+            recorder = SpanRecorder(args.trace_sample, args.trace_max)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.soak_log and (not args.duration or args.ramp or args.agents or args.processes > 1):
+        parser.error("--soak-log 需要配合 --duration（可加 --rps），不支持 --ramp / --agents / --processes")
+    gate_base = None
+    if store is not None:
+        if args.ramp or args.sweep_input or args.batch_sweep or (session_modes is not None and len(session_modes) > 1):
+            parser.error("--store 只保存单次测试，不支持 --ramp / --sweep-input / --batch-sweep / 多个 --prefix-mode")
+        try:
+            gate_base = store.resolve(args.gate) if args.gate else None
+            for name in args.tag or []:
+                check_tag(name)
+        except ValueError as e:
+            parser.error(str(e))
+    saved = []
 
     print("🚀 正在初始化客户端...")
-    tester = OpenAITester(args.base_url, args.api_key, args.model, args.timeout)
+    config = {"base_url": args.base_url, "api_key": args.api_key, "model": args.model,
+              "timeout": args.timeout, "engine": args.engine, "pool_size": args.pool_size,
+              "keepalive": not args.no_keepalive, "http2": args.http2, "client_mode": args.client_mode,
+              "request_path": "raw" if args.raw else "sdk", "keep_text": not args.no_text,
+              "endpoint": args.endpoint, "batch_size": args.batch_size, "stream_usage": not args.no_stream_usage}
+    try:
+        tester = make_tester(config)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"🔌 {tester.connection} / 请求路径 {tester.request_path}")
+    if describe_endpoint(args.endpoint, args.batch_size):
+        print(f"📮 {describe_endpoint(args.endpoint, args.batch_size)}")
+
+    workload = None
+    if args.workload:
+        workload = JsonlWorkload(args.workload, mode=args.workload_mode, seed=args.workload_seed)
+        print(f"📂 已加载数据集 {args.workload}（{args.workload_mode}），跳过无效行 {workload.skipped}")
+
+    def run_local(func, *func_args, **kwargs):
+        """在当前进程内执行测试，--profile 时同时采集客户端开销"""
+        return profile_call(tester, func, *func_args, **kwargs) if args.profile else func(*func_args, **kwargs)
+
+    def start_metrics(mode, run, params):
+        """--metrics-port：启动 /metrics 导出，附带目标并发 / 目标速率 / 自适应并发上限等 gauge"""
+        try:
+            server = MetricsServer(run, args.metrics_host, args.metrics_port, labels={"mode": mode, "model": args.model})
+        except OSError as e:
+            parser.error(f"无法在 {args.metrics_host}:{args.metrics_port} 启动 /metrics: {e}")
+        server.gauge("concurrency", "并发数（固定速率模式为在途请求上限）", lambda: params.get("concurrency"))
+        server.gauge("target_rps", "固定速率模式的目标每秒请求数", lambda: params.get("rps"))
+        if controller is not None:
+            server.gauge("concurrency_limit", "自适应模式当前的并发上限", lambda: controller.limit)
+        print(f"📡 Prometheus 指标: http://{server.address}/metrics")
+        return server.start()
+
+    def run_test(mode, **params):
+        """单进程直接调用 tester；--processes > 1 时拆分到多个工作进程，--agents 时分发到多台代理"""
+        if workload is not None:
+            params["workload"] = workload
+        run = RunStats() if (args.metrics_port is not None or recorder is not None or store is not None
+                             or args.goodput_slo is not None) else None
+        if run is not None:
+            run.goodput_slo = args.goodput_slo
+        if recorder is not None:
+            run.tracer = recorder
+        server = start_metrics(mode, run, params) if args.metrics_port is not None else None
+        try:
+            stats = dispatch(mode, params, run)
+        finally:
+            if server is not None:
+                server.shutdown()
+        if recorder is not None:
+            recorder.write(args.trace, args.trace_format, {"mode": mode, "model": args.model, "engine": args.engine})
+            print(f"🧵 {len(recorder.requests)} 个请求的时间线已写入 {args.trace}（{args.trace_format}，"
+                  f"采样率 {args.trace_sample}，共选中 {recorder.sampled} 个）")
+        if args.timeseries:
+            write_timeseries(stats["timeseries"], args.timeseries)
+            print(f"📈 逐秒时间序列已写入 {args.timeseries}（{len(stats['timeseries']['t'])} 个窗口）")
+        if store is not None:
+            # 分布式测试不回传直方图，只保存汇总统计；稳态模式保存统计阶段的分布
+            steady = params.get("steady")
+            source = None if args.agents else (steady.measured if steady is not None else run)
+            run_id = store.save(mode, stats, source, params={**params, "engine": args.engine, "stream": args.stream,
+                                                             "processes": args.processes, "agents": args.agents},
+                                model=args.model, base_url=args.base_url, label=args.label, tags=args.tag)
+            print(f"💾 已保存到结果库 {args.store}: 运行 #{run_id}" + (f"，标签 {', '.join(args.tag)}" if args.tag else ""))
+            saved.append(run_id)
+        return stats
+
+    def dispatch(mode, params, run):
+        if args.soak_log:
+            try:
+                stats = run_local(soak_test, tester, mode, params, args.soak_log, resume=args.resume,
+                                  text_chars=args.log_text, config=config, run=run)
+            except ValueError as e:
+                parser.error(str(e))
+            print(f"📝 逐请求记录 {stats['log_records']} 条已写入 {args.soak_log}")
+        elif args.agents:
+            agents = [a.strip() for a in args.agents.split(",") if a.strip()]
+            stats = distributed_test(agents, config, mode, params, token=args.agent_token,
+                                     processes_per_agent=args.processes, start_delay=args.start_delay,
+                                     goodput_slo=args.goodput_slo)
+        elif args.processes > 1:
+            stats = multiprocess_test(config, mode, args.processes, params, run=run)
+        elif run is not None:
+            stats = run_local(getattr(tester, mode), **params, run=run)
+        else:
+            stats = run_local(getattr(tester, mode), **params)
+        return stats
 
     # 步骤1：连通性测试
     print("🔍 正在进行连通性测试...")
@@ -71,26 +640,204 @@ def main():
         print(f"✅ 连通成功！响应时间: {res['time']}s")
         if res["reasoning"]:
             print(f"🔍 推理内容: {res['reasoning']}")
-        print(f"📝 回答: {res['response'][:100]}...")
+        if args.endpoint == "embeddings":
+            print(f"📝 返回 {res['items']} 个向量，输入 tokens: {res['input_tokens']}")
+        else:
+            print(f"📝 回答: {res['response'][:100]}...")
     else:
         print(f"❌ 连通失败: {res['error']}")
         return
 
     # 步骤2：并发测试
-    if args.duration:
+    if batch_sweep is not None:
+        # 批量 × 并发扫描模式
+        batch_sizes, concurrencies = batch_sweep
+        print(f"\n📦 开始批量扫描: 批量 {batch_sizes} × 并发 {concurrencies} / 每格 {args.duration}秒（{args.endpoint}）")
+        result = batch_sweep_test(
+            tester,
+            batch_sizes=batch_sizes,
+            concurrencies=concurrencies,
+            cell_duration=args.duration,
+            prompt=args.prompt,
+            temperature=args.temperature,
+            max_tokens=args.max_tokens,
+            stream=args.stream,
+            workload=workload,
+            min_gain=args.min_batch_gain
+        )
+
+        print("\n📊 批量扫描结果:")
+        print(format_batch_table(result))
+        for metric, label in (("items_per_sec", "items/s"), ("qps", "QPS（请求/秒）"), ("p95_time", "P95 耗时（秒）")):
+            print(f"\n{label}:")
+            print(format_batch_matrix(result, metric))
+        print()
+        for concurrency, batch_size in result["saturation"].items():
+            if batch_size is None:
+                print(f"  并发 {concurrency}: 批量增大到 {max(batch_sizes)} 时 items/s 仍在提升")
+            else:
+                print(f"  并发 {concurrency}: 批量超过 {batch_size} 后 items/s 提升不足 {round(args.min_batch_gain * 100)}%，"
+                      f"批量在此饱和")
+        best = result["best"]
+        if best is not None:
+            print(f"  最高吞吐: 批量 {best['batch_size']} / 并发 {best['concurrency']}，{best['items_per_sec']} items/s")
+        if args.sweep_out:
+            write_timeseries(sweep_columns(result), args.sweep_out)
+            print(f"\n💾 扫描结果已写入 {args.sweep_out}")
+        return
+    elif sweep is not None:
+        # 输入长度 × 输出长度扫描模式
+        input_sizes, output_sizes, concurrencies, prompts = sweep
+        print(f"\n📐 开始长度扫描: 输入 {input_sizes} × max_tokens {output_sizes} × 并发 {concurrencies} / "
+              f"每格 {args.duration}秒（{'tokenizer ' + args.tokenizer if prompts.exact else '按单词近似 token 数'}）")
+        result = sweep_test(
+            tester,
+            input_sizes=input_sizes,
+            output_sizes=output_sizes,
+            concurrencies=concurrencies,
+            cell_duration=args.duration,
+            prompts=prompts,
+            temperature=args.temperature
+        )
+
+        print("\n📊 长度扫描结果:")
+        print(format_sweep_table(result))
+        for metric, label in (("ttft_p50", "TTFT P50（秒）"), ("tps_p50", "解码速度 P50（token/s）"),
+                              ("qps", "QPS"), ("prefill_tps", "prefill 速度（输入 token / TTFT）")):
+            print(f"\n{label}:")
+            print(format_sweep_matrix(result, metric))
+        if args.sweep_out:
+            write_timeseries(sweep_columns(result), args.sweep_out)
+            print(f"\n💾 扫描结果已写入 {args.sweep_out}")
+        return
+    elif session_modes is not None:
+        # 多轮会话测试模式
+        results = {}
+        for mode in session_modes:
+            stats = run_test(
+                "session_test",
+                prompt=args.prompt,
+                duration=args.duration,
+                concurrency=args.concurrency,
+                script=script.with_mode(mode),
+                temperature=args.temperature,
+                max_tokens=args.max_tokens,
+                stream=True
+            )
+            sessions = stats["sessions"]
+            results[mode] = stats
+            print(f"\n📊 多轮会话测试结果（前缀 {mode}）:")
+            print(format_session_table(sessions))
+            print(f"\n  测试时长: {stats['duration']}s (目标: {stats['target_duration']}s)")
+            print(f"  总请求: {stats['total']}")
+            print(f"  成功: {stats['success']} ({stats['success_rate']}%)")
+            print(f"  QPS: {stats['qps']}")
+            print(f"  完成的会话: {sessions['completed_sessions']}，中断（失败或测试结束）: {sessions['aborted_sessions']}")
+        if len(results) > 1:
+            print("\n📊 前缀模式对比（每轮）:")
+            print(format_compare_table(compare_prefix_modes(results), session_modes))
+            return
+    elif args.ramp:
+        # 阶梯增压测试模式
+        print(f"\n🪜 开始阶梯增压测试: 阶梯 {stages} / 每阶梯 {args.duration}秒")
+        result = ramp_test(
+            tester,
+            prompt=args.prompt,
+            stages=stages,
+            stage_duration=args.duration,
+            temperature=args.temperature,
+            max_tokens=args.max_tokens,
+            min_success_rate=args.slo_success_rate,
+            max_p95=args.slo_p95,
+            min_efficiency=args.min_efficiency,
+            stop_on_knee=not args.no_stop,
+            stream=args.stream,
+            workload=workload,
+            steady_options=steady_options
+        )
+
+        print("\n📊 阶梯增压测试结果:")
+        print(format_ramp_table(result))
+        if steady_options is not None:
+            for row in result["stages"]:
+                print(f"  并发 {row['concurrency']}: " + "；".join(describe(row["stats"]["steady"])))
+        print(f"\n  满足 SLO 的最大并发: {result['max_ok_concurrency']}")
+        if result["knee_concurrency"] is not None:
+            print(f"  饱和/失败点: {result['stop_reason']}")
+        else:
+            print("  所有阶梯均满足 SLO 且 QPS 线性增长，可继续提高并发上限")
+        return
+    elif controller is not None:
+        # 自适应并发测试模式
+        stats = run_test(
+            "adaptive_test",
+            prompt=args.prompt,
+            duration=args.duration,
+            controller=controller,
+            temperature=args.temperature,
+            max_tokens=args.max_tokens,
+            stream=args.stream
+        )
+        adaptive = stats["adaptive"]
+
+        print("\n📊 自适应并发测试结果:")
+        print(format_adaptive_table(adaptive))
+        print(f"\n  测试时长: {stats['duration']}s (目标: {stats['target_duration']}s)")
+        print(f"  总请求: {stats['total']}")
+        print(f"  成功: {stats['success']} ({stats['success_rate']}%)")
+        print(f"  QPS: {stats['qps']}")
+        if adaptive["discovered_limit"] is not None:
+            print(f"  满足 SLO 的最大并发: {adaptive['discovered_limit']}")
+        else:
+            print("  没有任何控制周期满足 SLO，可降低 --min-concurrency 或放宽 SLO")
+        print(f"  末段稳定并发: {adaptive['steady_limit']}（最终上限 {adaptive['final_limit']}）")
+    elif args.rps:
+        # 固定速率（开环）测试模式
+        stats = run_test(
+            "rate_test",
+            prompt=args.prompt,
+            rps=args.rps,
+            duration=args.duration,
+            concurrency=args.concurrency,
+            arrival=args.arrival,
+            temperature=args.temperature,
+            max_tokens=args.max_tokens,
+            stream=args.stream
+        )
+
+        print("\n📊 固定速率测试结果:")
+        print(f"  测试时长: {stats['duration']}s (目标: {stats['target_duration']}s)")
+        print(f"  目标速率: {stats['target_rps']} req/s ({stats['arrival']})，实际发出: {stats['offered_rps']} req/s")
+        print(f"  总请求: {stats['total']}（未能发出: {stats['unsent']}）")
+        print(f"  成功: {stats['success']} ({stats['success_rate']}%)")
+        print(f"  失败: {stats['failed']}")
+        print(f"  平均耗时: {stats['avg_time']}s")
+        print(f"  P95 耗时: {stats['p95_time']}s")
+        print(f"  QPS: {stats['qps']}")
+        if "send_lag_avg" in stats:
+            print(f"  发送滞后: avg={stats['send_lag_avg']}s p95={stats['send_lag_p95']}s "
+                  f"p99={stats['send_lag_p99']}s max={stats['send_lag_max']}s")
+            print(f"  计划时刻起算耗时: avg={stats['intended_time_avg']}s p50={stats['intended_time_p50']}s "
+                  f"p95={stats['intended_time_p95']}s p99={stats['intended_time_p99']}s")
+    elif args.duration:
         # 固定时长测试模式
         if args.total != 10:  # 如果用户同时指定了total和duration
             print("⚠️  警告: 固定时长模式下忽略--total参数")
         print(f"\n🚀 开始固定时长测试: {args.duration}秒 / {args.concurrency} 并发")
-        stats = tester.duration_test(
+        stats = run_test(
+            "duration_test",
             prompt=args.prompt,
             duration=args.duration,
             concurrency=args.concurrency,
             temperature=args.temperature,
-            max_tokens=args.max_tokens
+            max_tokens=args.max_tokens,
+            stream=args.stream,
+            **({"steady": SteadyState(**steady_options)} if steady_options is not None else {})
         )
         
         print("\n📊 固定时长测试结果:")
+        for line in describe(stats["steady"]) if "steady" in stats else []:
+            print(f"  {line}")
         print(f"  测试时长: {stats['duration']}s (目标: {stats['target_duration']}s)")
         print(f"  总请求: {stats['total']}")
         print(f"  成功: {stats['success']} ({stats['success_rate']}%)")
@@ -101,12 +848,14 @@ def main():
     else:
         # 固定请求数测试模式
         print(f"\n🚀 开始并发测试: {args.total} 请求 / {args.concurrency} 并发")
-        stats = tester.concurrent_test(
+        stats = run_test(
+            "concurrent_test",
             prompt=args.prompt,
             total=args.total,
             concurrency=args.concurrency,
             temperature=args.temperature,
-            max_tokens=args.max_tokens
+            max_tokens=args.max_tokens,
+            stream=args.stream
         )
         
         print("\n📊 测试结果:")
@@ -117,11 +866,21 @@ def main():
         print(f"  P95 耗时: {stats['p95_time']}s")
         print(f"  QPS: {stats['qps']}")
         print(f"  总耗时: {stats['total_wall_time']}s")
+    print_latency_stats(stats)
+    print_stream_stats(stats)
+    print_token_stats(stats)
+    print_connection_stats(stats)
+    print_batch_stats(stats)
+    print_client_stats(stats)
     
     if stats["failures"]:
         print("  部分错误:")
         for e in stats["failures"]:
             print(f"    - {e}")
+    if gate_base is not None and saved:
+        # 发布后的回归门禁：与基线相比有显著回归时以退出码 1 结束
+        if not run_regression(args, store, str(gate_base), str(saved[-1])):
+            sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,240 @@
+# coding=utf-8
+"""
+多端点对比压测：同一个调度器交替向多个目标（base_url / model / api_key）发送请求，在相同负载下对比
+
+分两次、在不同时间分别压测两个网关或部署时，网络抖动与不同时段的负载差异会混进对比结果。
+对比模式把所有目标放进同一次测试：
+    - 请求按“轮”分配：每一轮向每个目标各发送一次相同的请求（数据集负载时为同一行），目标顺序每轮随机打乱，
+      避免固定先后顺序带来的偏差；各目标拿到的请求数与内容相同，时间上交织在一起
+    - 固定时长（闭环）：concurrency 个虚拟用户各自循环执行上述轮次，各目标的请求数相同，
+      但慢的目标会拖慢整轮，因此吞吐的对比以延迟为主
+    - 固定速率（开环，rps）：统一的到达时间表，每个目标各自承受 rps 的请求速率，互不等待；
+      每个目标有独立的在途上限（concurrency），慢的目标不会占用其他目标的发送线程
+每个目标使用各自的 tester（独立的客户端与连接池），结果给出每个目标的完整统计，
+以及相对基线（第一个目标）的差异表。
+"""
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+from stats import RunStats
+from workload import resolve_request
+from tester import _arrival_times, _mark_schedule, _watch_progress, _rate_stats
+
+TARGET_FIELDS = ("name", "base_url", "model", "api_key")
+
+# 差异表的指标：(键, 名称, 数值越大越好)
+DIFF_METRICS = (
+    ("success_rate", "成功率%", True),
+    ("qps", "QPS", True),
+    ("avg_time", "平均耗时(s)", False),
+    ("p50_time", "P50(s)", False),
+    ("p95_time", "P95(s)", False),
+    ("p99_time", "P99(s)", False),
+    ("ttft_p50", "TTFT P50(s)", False),
+    ("ttft_p95", "TTFT P95(s)", False),
+    ("tps_p50", "解码速度 P50(tok/s)", True),
+    ("send_lag_p95", "发送滞后 P95(s)", False),
+)
+
+
+def parse_target(spec: str, defaults: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    解析目标描述，如 name=gw-a,base_url=http://10.0.0.2/v1,model=qwen2.5；缺省的字段取 defaults
+
+    Returns:
+        含 name / base_url / model / api_key 的字典（name 缺省时为 model@base_url）
+    """
+    target = {key: defaults.get(key) for key in TARGET_FIELDS}
+    target["name"] = None
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        key, sep, value = part.partition("=")
+        key = key.strip()
+        if not sep or key not in TARGET_FIELDS:
+            raise ValueError(f"无法解析的目标: {spec}（应为 {'/'.join(TARGET_FIELDS)}=值，以逗号分隔）")
+        target[key] = value.strip()
+    missing = [key for key in ("base_url", "model", "api_key") if not target[key]]
+    if missing:
+        raise ValueError(f"目标 {spec} 缺少 {', '.join(missing)}")
+    target["name"] = target["name"] or f"{target['model']}@{target['base_url']}"
+    return target
+
+
+def compare_test(testers: Dict[str, Any], duration: int, concurrency: int, prompt: str = "",
+                 rps: Optional[float] = None, arrival: str = "constant", system_prompt: str = "",
+                 temperature: float = 0.7, max_tokens: int = 4096, show_progress: bool = True,
+                 progress_callback: Any = None, stream: bool = False, run: Optional[RunStats] = None,
+                 workload: Any = None, seed: Optional[int] = None) -> Dict[str, Any]:
+    """
+    多目标交替对比测试
+
+    Args:
+        testers: 目标名 -> tester（OpenAITester 或 AsyncOpenAITester），第一个为基线
+        duration: 测试时长（秒）
+        concurrency: 固定时长模式为虚拟用户数；固定速率模式为每个目标的在途请求上限
+        rps: 每个目标的目标速率（开环），None 表示固定时长（闭环）
+        arrival: 固定速率模式的到达模型，constant 或 poisson
+        run: 所有目标合计的 RunStats（进度、/metrics、时间线使用），默认新建
+        seed: 每轮目标顺序的随机种子
+        其余参数同 duration_test
+
+    Returns:
+        targets: [{name, stats}]（stats 与 duration_test / rate_test 结构相同），baseline、diff（见 diff_rows）、
+        以及合计的 total / success / qps 等与 duration / target_duration
+    """
+    if len(testers) < 2:
+        raise ValueError("对比测试至少需要两个目标")
+    names = list(testers)
+    runs = {name: RunStats() for name in names}
+    run = run if run is not None else RunStats()
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    start_time = time.time()
+    end_time = start_time + duration
+
+    def shuffled() -> List[str]:
+        order = list(names)
+        with rng_lock:
+            rng.shuffle(order)
+        return order
+
+    def send(name, args, intended=None):
+        sent_at = time.time()
+        if intended is not None and sent_at >= end_time:
+            runs[name].record_unsent()
+            run.record_unsent()
+            return
+        run.begin()
+        runs[name].begin()
+        result = testers[name].single_chat(*args, stream)
+        if intended is not None:
+            result = _mark_schedule(result, intended, sent_at)
+        run.record(result)
+        runs[name].record(result)
+
+    if rps is None:
+        stop_flag = threading.Event()
+
+        def worker():
+            while not stop_flag.is_set() and time.time() < end_time:
+                args = resolve_request(workload, prompt, system_prompt, temperature, max_tokens)
+                for name in shuffled():
+                    if stop_flag.is_set() or time.time() >= end_time:
+                        break
+                    send(name, args)
+
+        print(f"🚀 开始对比测试: {len(names)} 个目标 / {duration}秒 / {concurrency} 个虚拟用户（每轮各目标一次，顺序随机）")
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        _watch_progress(run, start_time, end_time, duration, show_progress, progress_callback)
+        stop_flag.set()
+        for thread in threads:
+            thread.join(timeout=1)
+    else:
+        executors = {name: ThreadPoolExecutor(max_workers=concurrency) for name in names}
+
+        def dispatch():
+            # 合计速率 rps × 目标数，每 len(names) 个到达时刻为一轮，分给各目标同一个请求
+            pending = []
+            args = None
+            for intended in _arrival_times(start_time, end_time, rps * len(names), arrival):
+                if not pending:
+                    pending = shuffled()
+                    args = resolve_request(workload, prompt, system_prompt, temperature, max_tokens)
+                delay = intended - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                name = pending.pop()
+                executors[name].submit(send, name, args, intended)
+
+        print(f"🚀 开始对比测试: {len(names)} 个目标 / 每个目标 {rps} req/s ({arrival}) / {duration}秒 / "
+              f"每个目标在途上限 {concurrency}")
+        dispatcher = threading.Thread(target=dispatch, daemon=True)
+        dispatcher.start()
+        _watch_progress(run, start_time, end_time, duration, show_progress, progress_callback)
+        dispatcher.join()
+        for executor in executors.values():
+            executor.shutdown(wait=True)
+
+    actual_duration = time.time() - start_time
+    targets = []
+    for name in names:
+        if rps is None:
+            stats = runs[name].summary(actual_duration)
+            stats["duration"] = round(actual_duration, 3)
+            stats["target_duration"] = duration
+        else:
+            stats = _rate_stats(runs[name], actual_duration, duration, rps, arrival)
+        targets.append({"name": name, "stats": stats})
+    result = run.summary(actual_duration)
+    result["duration"] = round(actual_duration, 3)
+    result["target_duration"] = duration
+    result.update({"targets": targets, "baseline": names[0], "diff": diff_rows(targets),
+                   "schedule": "closed" if rps is None else "open", "rps": rps})
+    return result
+
+
+def diff_rows(targets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    各指标在每个目标上的值，以及相对基线（第一个目标）的变化
+
+    Returns:
+        每个指标一行：metric、label、各目标名 -> 值，以及 <目标名>_change（相对基线的变化 %）
+        与 <目标名>_better（是否优于基线，变化为 0 或无法比较时为 None）
+    """
+    baseline = targets[0]
+    rows = []
+    for key, label, higher_better in DIFF_METRICS:
+        if all(t["stats"].get(key) is None for t in targets):
+            continue
+        row = {"metric": key, "label": label}
+        base = baseline["stats"].get(key)
+        for t in targets:
+            value = t["stats"].get(key)
+            row[t["name"]] = value
+            if t is baseline:
+                continue
+            change = round((value - base) / base * 100, 1) if value is not None and base else None
+            row[f"{t['name']}_change"] = change
+            row[f"{t['name']}_better"] = None if not change else (change > 0) == higher_better
+        rows.append(row)
+    return rows
+
+
+def format_diff_table(result: Dict[str, Any]) -> str:
+    """差异表：每行一个指标，非基线目标附带相对基线的变化"""
+    names = [t["name"] for t in result["targets"]]
+    table = []
+    for row in result["diff"]:
+        cells = []
+        for name in names:
+            value = "-" if row[name] is None else str(row[name])
+            change = row.get(f"{name}_change")
+            if change is not None:
+                mark = {True: "✓", False: "✗"}.get(row[f"{name}_better"], "")
+                value += f" ({change:+}%{mark})"
+            cells.append(value)
+        table.append((row["label"], cells))
+    widths = [max([len(name)] + [len(cells[i]) for _, cells in table]) + 2 for i, name in enumerate(names)]
+    lines = [f"{'指标':<18}" + "".join(f"{n:>{w}}" for n, w in zip(names, widths))]
+    for label, cells in table:
+        lines.append(f"{label:<18}" + "".join(f"{c:>{w}}" for c, w in zip(cells, widths)))
+    return f"（括号内为相对基线 {result['baseline']} 的变化，✓ 优于基线 / ✗ 差于基线）\n" + "\n".join(lines)
+
+
+def summarize(result: Dict[str, Any]) -> List[str]:
+    """每个非基线目标一句话的对比结论（P95、TTFT P50、QPS、成功率）"""
+    lines = []
+    for target in result["targets"][1:]:
+        name = target["name"]
+        parts = []
+        for row in result["diff"]:
+            if row["metric"] in ("p95_time", "ttft_p50", "qps", "success_rate") and \
+                    row.get(f"{name}_change") is not None:
+                parts.append(f"{row['label']} {row[f'{name}_change']:+}%")
+        lines.append(f"{name} 相对 {result['baseline']}: " + ("，".join(parts) if parts else "无可比较的指标"))
+    return lines
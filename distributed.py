@@ -0,0 +1,311 @@
+# coding=utf-8
+"""
+分布式压测：协调者（coordinator）+ 压测代理（agent）
+
+单台机器即便占满所有核心也可能压不动大型推理集群。每台压测机运行一个 agent，
+监听本地端口、接收测试任务；协调者把一次测试的并发数 / 总请求数 / 目标速率拆分给 N 个 agent，
+约定统一的开始时刻，逐秒接收各 agent 的计数器流，最后取回可合并的 RunStats 汇总。
+
+agent 接口（JSON over HTTP）：
+    GET  /health               存活检查
+    POST /runs                 提交任务 {config, mode, params, start_at, processes}，返回 {run_id}
+    GET  /runs/<id>/events     NDJSON 流，每秒一行 {state, elapsed, requests, success, window}，任务结束后关闭
+    GET  /runs/<id>            任务状态与结果 {state, error, start_skew, stats, run}
+
+使用数据集负载（workload）时，JSONL 文件路径需在每台 agent 上都存在，各 agent 回放互不重叠的行。
+可在同一台机器上启动多个 agent（不同端口）进行本地验证；
+开始时刻依赖各机器时钟同步（NTP），实际开始偏差以 start_skew 返回。
+"""
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List, Optional
+import requests
+from tqdm import tqdm
+from stats import RunStats
+from multiproc import make_tester, multiprocess_test, shard_params, report_progress, build_stats
+from workload import load_workload
+
+MODES = ("concurrent_test", "duration_test", "rate_test")
+
+
+class _AgentRun:
+    """agent 上的一次测试任务"""
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.spec = spec
+        self.state = "pending"
+        self.error = None
+        self.run = RunStats()
+        self.stats = None
+        self.started_at = None
+        self.start_skew = None
+        # 多进程执行时计数器快照来自进度回调，单进程时直接读取 RunStats
+        self.progress = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        snap = self.progress if self.progress is not None else self.run.snapshot()
+        elapsed = time.time() - self.started_at if self.started_at else 0
+        return {"state": self.state, "elapsed": round(elapsed, 2),
+                "requests": snap["requests"], "success": snap["success"], "window": snap.get("window")}
+
+    def execute(self) -> None:
+        spec = self.spec
+        start_at = spec.get("start_at", time.time())
+        try:
+            processes = spec.get("processes", 1)
+            if processes > 1:
+                # 工作进程在开始时刻之前完成启动，由 multiprocess_test 负责等待统一开始
+                def on_progress(data):
+                    self.progress = data
+                self.started_at = start_at
+                self.state = "running"
+                self.stats = multiprocess_test(spec["config"], spec["mode"], processes, spec["params"],
+                                               show_progress=False, progress_callback=on_progress,
+                                               run=self.run, start_at=start_at)
+                self.start_skew = self.stats["start_skew"]
+                self.progress = None
+            else:
+                tester = make_tester(spec["config"])
+                params = spec["params"]
+                if params.get("workload") is not None:
+                    params = dict(params, workload=load_workload(params["workload"]))
+                if start_at > time.time():
+                    time.sleep(start_at - time.time())
+                self.started_at = time.time()
+                self.start_skew = round(self.started_at - start_at, 4)
+                self.state = "running"
+                self.stats = getattr(tester, spec["mode"])(**params, show_progress=False, run=self.run)
+                if hasattr(tester, "close"):
+                    tester.close()
+            self.state = "done"
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self.state = "error"
+
+
+class LoadAgent:
+    """
+    压测代理：在本地端口上接收协调者下发的测试任务
+
+    Args:
+        host: 监听地址，默认仅本机；跨机器使用时设为 0.0.0.0 并配合 token
+        port: 监听端口
+        token: 共享口令，设置后请求须携带 X-Agent-Token 头
+        keep_runs: 保留的历史任务数
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, token: Optional[str] = None,
+                 keep_runs: int = 20):
+        self.token = token
+        self.keep_runs = keep_runs
+        self.runs: "OrderedDict[str, _AgentRun]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def serve_forever(self) -> None:
+        self.server.serve_forever()
+
+    def start(self) -> "LoadAgent":
+        """在后台线程中运行（便于同一进程内启动多个 agent 做本地验证）"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def shutdown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def submit(self, spec: Dict[str, Any]) -> str:
+        if spec.get("mode") not in MODES:
+            raise ValueError(f"不支持的测试模式: {spec.get('mode')}")
+        run_id = uuid.uuid4().hex[:12]
+        agent_run = _AgentRun(spec)
+        with self._lock:
+            self.runs[run_id] = agent_run
+            while len(self.runs) > self.keep_runs:
+                self.runs.popitem(last=False)
+        threading.Thread(target=agent_run.execute, daemon=True).start()
+        return run_id
+
+    def _make_handler(self):
+        agent = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, code: int, data: Dict[str, Any]) -> None:
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _authorized(self) -> bool:
+                if agent.token and self.headers.get("X-Agent-Token") != agent.token:
+                    self._send_json(401, {"error": "unauthorized"})
+                    return False
+                return True
+
+            def _get_run(self, run_id: str) -> Optional[_AgentRun]:
+                with agent._lock:
+                    agent_run = agent.runs.get(run_id)
+                if agent_run is None:
+                    self._send_json(404, {"error": f"run {run_id} not found"})
+                return agent_run
+
+            def do_GET(self):
+                if not self._authorized():
+                    return
+                parts = self.path.strip("/").split("/")
+                if parts == ["health"]:
+                    self._send_json(200, {"ok": True, "runs": len(agent.runs)})
+                elif len(parts) == 3 and parts[0] == "runs" and parts[2] == "events":
+                    agent_run = self._get_run(parts[1])
+                    if agent_run is None:
+                        return
+                    # 每秒推送一行计数器快照，任务结束后关闭连接（HTTP/1.0，无需分块编码）
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.end_headers()
+                    while True:
+                        snap = agent_run.snapshot()
+                        self.wfile.write((json.dumps(snap) + "\n").encode("utf-8"))
+                        self.wfile.flush()
+                        if snap["state"] in ("done", "error"):
+                            break
+                        time.sleep(1)
+                elif len(parts) == 2 and parts[0] == "runs":
+                    agent_run = self._get_run(parts[1])
+                    if agent_run is None:
+                        return
+                    self._send_json(200, {
+                        "state": agent_run.state,
+                        "error": agent_run.error,
+                        "start_skew": agent_run.start_skew,
+                        "stats": agent_run.stats,
+                        "run": agent_run.run.to_dict() if agent_run.state == "done" else None
+                    })
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                if not self._authorized():
+                    return
+                if self.path.strip("/") != "runs":
+                    self._send_json(404, {"error": "not found"})
+                    return
+                try:
+                    spec = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    self._send_json(200, {"run_id": agent.submit(spec)})
+                except (ValueError, KeyError) as e:
+                    self._send_json(400, {"error": str(e)})
+
+        return Handler
+
+
+def _agent_url(agent: str) -> str:
+    return agent.rstrip("/") if agent.startswith("http") else f"http://{agent.rstrip('/')}"
+
+
+def distributed_test(agents: List[str], config: Dict[str, Any], mode: str, params: Dict[str, Any],
+                     token: Optional[str] = None, processes_per_agent: int = 1, start_delay: float = 2.0,
+                     show_progress: bool = True, progress_callback: Any = None,
+                     goodput_slo: Optional[float] = None) -> Dict[str, Any]:
+    """
+    协调者：把一次测试分发给多个 agent，同步开始并合并结果
+
+    Args:
+        agents: agent 地址列表，如 ["10.0.0.2:8765", "10.0.0.3:8765"]
+        config: tester 配置，包含 base_url / api_key / model / timeout / engine
+        mode: "concurrent_test"、"duration_test" 或 "rate_test"
+        params: 对应测试方法的参数（concurrency / total / rps 为全局值，会被拆分到各 agent）
+        token: agent 共享口令
+        processes_per_agent: 每个 agent 使用的工作进程数
+        start_delay: 下发任务到统一开始之间预留的秒数
+        show_progress: 是否显示进度条
+        progress_callback: 每秒一次的进度回调，字段同 duration_test
+        goodput_slo: goodput 的延迟 SLO（秒），见 RunStats.goodput_slo
+
+    Returns:
+        与单机测试方法结构相同的统计字典，额外包含 agents（各 agent 的请求数与开始偏差）
+    """
+    headers = {"X-Agent-Token": token} if token else {}
+    shards = shard_params(mode, params, len(agents))
+    agents = agents[:len(shards)]
+    start_at = time.time() + start_delay
+
+    run_ids = []
+    for agent, shard in zip(agents, shards):
+        spec = {"config": config, "mode": mode, "params": shard, "start_at": start_at,
+                "processes": processes_per_agent}
+        try:
+            resp = requests.post(f"{_agent_url(agent)}/runs", json=spec, headers=headers, timeout=10)
+            resp.raise_for_status()
+        except requests.RequestException as e:
+            raise RuntimeError(f"向 agent {agent} 下发任务失败: {e}")
+        run_ids.append(resp.json()["run_id"])
+
+    print(f"🌐 已向 {len(agents)} 个 agent 下发任务，{start_delay}s 后同步开始")
+    snapshots = [{"requests": 0, "success": 0} for _ in agents]
+    results: List[Optional[Dict[str, Any]]] = [None] * len(agents)
+
+    def follow(i: int) -> None:
+        # 读取 agent 的逐秒计数器流，结束后取回最终结果
+        url = f"{_agent_url(agents[i])}/runs/{run_ids[i]}"
+        try:
+            with requests.get(f"{url}/events", headers=headers, stream=True, timeout=(10, 60)) as resp:
+                # 逐字节读取：默认按 512 字节分块时每秒一行的事件会攒成一批，进度延迟数秒且成批跳变
+                for line in resp.iter_lines(chunk_size=1):
+                    if line:
+                        snapshots[i] = json.loads(line)
+            results[i] = requests.get(url, headers=headers, timeout=30).json()
+        except requests.RequestException as e:
+            results[i] = {"state": "error", "error": str(e)}
+
+    followers = [threading.Thread(target=follow, args=(i,), daemon=True) for i in range(len(agents))]
+    for t in followers:
+        t.start()
+
+    duration = params.get("duration")
+    pbar = None
+    if show_progress and progress_callback is None:
+        pbar = tqdm(total=duration, desc="分布式测试", unit="s") if duration else \
+            tqdm(total=params["total"], desc="分布式测试")
+    while any(t.is_alive() for t in followers):
+        time.sleep(1)
+        if time.time() >= start_at:
+            report_progress(pbar, progress_callback, snapshots, start_at, duration)
+    if pbar is not None:
+        pbar.close()
+
+    errors = [f"{agents[i]}: {r.get('error')}" for i, r in enumerate(results) if r.get("state") != "done"]
+    if errors:
+        raise RuntimeError("agent 执行失败: " + "; ".join(errors))
+    # 以最早开始的 agent 为起点、最晚结束的 agent 为终点，用各 agent 自测的时长避免轮询间隔带来的误差
+    first_start = min(r["start_skew"] for r in results)
+    elapsed = max(r["start_skew"] + r["stats"].get("duration", r["stats"].get("total_wall_time", 0))
+                  for r in results) - first_start
+
+    merged = RunStats()
+    merged.goodput_slo = goodput_slo
+    for r in results:
+        merged.merge(RunStats.from_dict(r["run"]))
+    stats = build_stats(mode, merged, elapsed, params)
+    stats["agents"] = [
+        {"agent": agent, "requests": r["stats"]["total"], "qps": r["stats"]["qps"], "start_skew": r["start_skew"]}
+        for agent, r in zip(agents, results)
+    ]
+    return stats
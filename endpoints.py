@@ -0,0 +1,184 @@
+# coding=utf-8
+"""
+非聊天端点：/embeddings 与 /completions（旧版文本补全）的请求构建与结果解析，支持一个请求发送一批输入
+
+聊天接口每个请求只有一条输入，嵌入与文本补全接口的 input / prompt 可以是列表。批量越大，
+每个请求的固定开销（网络往返、调度、tokenize、kernel 启动）摊得越薄，但单个请求的耗时随之上升，
+超过某个批量后（算力打满或服务端自身的 max_batch 限制）吞吐不再提升。因此除了 QPS（请求/秒）还需要看：
+    items/s          每秒成功处理的输入条数（QPS × 批量）
+    input tokens/s   每秒处理的输入 token 数（取响应 usage.prompt_tokens，服务端未返回时按输入文本估算，见 usage.py）
+批内每条输入都是同一条 prompt（或从数据集取到的 prompt），请求体按 (prompt, 批量, 参数) 缓存，只编码一次。
+结果结构与 single_chat 相同，额外包含 items（本请求的输入条数）；token 用量字段同聊天端点（嵌入请求的输出为 0）。
+嵌入请求固定使用 encoding_format=float（所有兼容服务都支持），sdk 与 raw 两条路径的请求体一致。
+"""
+import json
+import time
+from functools import partial
+from typing import Dict, Any, Optional, Union, List
+from stats import stream_metrics
+from rawhttp import RequestEncoder, StreamAccumulator, raw_chat, araw_chat, _failure
+from usage import get_field, usage_fields
+
+ENDPOINTS = ("chat", "completions", "embeddings")
+
+ENDPOINT_PATHS = {"chat": "/chat/completions", "completions": "/completions", "embeddings": "/embeddings"}
+
+
+def check_batch(endpoint: str, batch_size: int) -> None:
+    """校验端点与批量，不合法时抛出 ValueError"""
+    if endpoint not in ENDPOINTS:
+        raise ValueError(f"不支持的端点: {endpoint}")
+    if batch_size < 1:
+        raise ValueError(f"批量需为正整数: {batch_size}")
+    if endpoint == "chat" and batch_size != 1:
+        raise ValueError("聊天端点每个请求只有一条输入，批量仅适用于 completions / embeddings")
+
+
+def batch_input(prompt: str, batch_size: int) -> Union[str, List[str]]:
+    """批量为 1 时直接发送字符串，否则发送 batch_size 条相同输入组成的列表"""
+    return prompt if batch_size == 1 else [prompt] * batch_size
+
+
+class BatchEncoder(RequestEncoder):
+    """
+    在 RequestEncoder 的基础上增加非聊天端点的请求体（同样按参数缓存编码结果）
+
+    Args:
+        model: 模型名
+        endpoint: chat / completions / embeddings
+    """
+
+    def __init__(self, model: str, endpoint: str = "chat", **kwargs):
+        super().__init__(model, **kwargs)
+        self.endpoint = endpoint
+
+    def payload(self, prompt: str, batch_size: int, temperature: float, max_tokens: int,
+                stream: bool) -> Dict[str, Any]:
+        """请求参数字典（sdk 路径直接作为 create() 的参数）"""
+        if self.endpoint == "embeddings":
+            return {"model": self.model, "input": batch_input(prompt, batch_size), "encoding_format": "float"}
+        return {"model": self.model, "prompt": batch_input(prompt, batch_size), "temperature": temperature,
+                "max_tokens": max_tokens, "stream": stream, **self.stream_options(stream)}
+
+    def batch_body(self, prompt: str, batch_size: int, temperature: float, max_tokens: int, stream: bool) -> bytes:
+        return self.cached(("batch", prompt, batch_size, temperature, max_tokens, stream),
+                           lambda: json.dumps(self.payload(prompt, batch_size, temperature, max_tokens, stream),
+                                              ensure_ascii=False).encode("utf-8"))
+
+
+def response_fields(endpoint: str, data: Any, keep_text: bool) -> Dict[str, Any]:
+    """从非流式响应（dict 或 SDK 对象）中取出 response / items 与 token 用量（见 usage.usage_fields）"""
+    usage = get_field(data, "usage")
+    if endpoint == "embeddings":
+        return {"response": "", "items": len(get_field(data, "data") or []), **usage_fields(usage)}
+    choices = get_field(data, "choices") or []
+    text = "\n".join(get_field(c, "text") or "" for c in choices)
+    return {"response": text if keep_text else "", "items": len(choices), **usage_fields(usage, text)}
+
+
+def _result(fields: Dict[str, Any], start_time: float) -> Dict[str, Any]:
+    return {"success": True, "reasoning": "", "time": round(time.time() - start_time, 3), "error": None, **fields}
+
+
+def raw_result(endpoint: str, data: bytes, start_time: float, keep_text: bool) -> Dict[str, Any]:
+    """raw 路径的非流式解析（raw_chat 的 parse 参数）"""
+    parse_start = time.perf_counter()
+    fields = response_fields(endpoint, json.loads(data), keep_text)
+    parse_time = time.perf_counter() - parse_start
+    return {**_result(fields, start_time), "output_bytes": len(data), "parse_time": parse_time}
+
+
+class TextStreamAccumulator(StreamAccumulator):
+    """累积 /completions 的流式响应：每个事件可能包含批内多条输入（按 choices[].index 区分）的 text 增量"""
+
+    def __init__(self, keep_text: bool = True):
+        super().__init__(keep_text)
+        self.indices = set()
+
+    def add(self, payload: bytes) -> None:
+        if payload == b"[DONE]":
+            self.done = True
+            return
+        self.add_event(json.loads(payload))
+
+    def add_event(self, event: Any) -> None:
+        """处理一个事件（raw 路径解析后的 dict 或 SDK 的 Completion 块）"""
+        if get_field(event, "usage"):
+            self.usage = get_field(event, "usage")
+        for choice in get_field(event, "choices") or []:
+            self.indices.add(get_field(choice, "index") or 0)
+            text = get_field(choice, "text")
+            if text:
+                if self.keep_text:
+                    self.content.append(text)
+                self.chunk_times.append(time.time())
+
+    def fields(self) -> Dict[str, Any]:
+        return {"items": len(self.indices), **super().fields()}
+
+
+def _stream_result(acc: TextStreamAccumulator, start_time: float) -> Dict[str, Any]:
+    return _result({"response": "".join(acc.content), **stream_metrics(start_time, acc.chunk_times),
+                    **acc.fields()}, start_time)
+
+
+def _sdk_api(client: Any, endpoint: str) -> Any:
+    return client.embeddings if endpoint == "embeddings" else client.completions
+
+
+def _sdk_failure(e: Exception, start_time: float) -> Dict[str, Any]:
+    # 429/503 等响应携带的 Retry-After，供自适应并发控制退避
+    return _failure(str(e), start_time, get_field(get_field(e, "response"), "headers"))
+
+
+def raw_request(client: Any, url: str, headers: Dict[str, str], endpoint: str, body: bytes, stream: bool,
+                keep_text: bool = True) -> Dict[str, Any]:
+    """raw 路径：用 httpx.Client 发送一次预编码的请求"""
+    return raw_chat(client, url, headers, body, stream, keep_text, partial(raw_result, endpoint),
+                    TextStreamAccumulator)
+
+
+async def araw_request(client: Any, url: str, headers: Dict[str, str], endpoint: str, body: bytes, stream: bool,
+                       keep_text: bool = True) -> Dict[str, Any]:
+    """raw_request 的协程版本"""
+    return await araw_chat(client, url, headers, body, stream, keep_text, partial(raw_result, endpoint),
+                           TextStreamAccumulator)
+
+
+def sdk_request(client: Any, endpoint: str, payload: Dict[str, Any], stream: bool,
+                keep_text: bool = True) -> Dict[str, Any]:
+    """sdk 路径：client.embeddings.create / client.completions.create"""
+    start_time = time.time()
+    try:
+        response = _sdk_api(client, endpoint).create(**payload)
+        if not stream:
+            return _result(response_fields(endpoint, response, keep_text), start_time)
+        acc = TextStreamAccumulator(keep_text)
+        for chunk in response:
+            acc.add_event(chunk)
+        return _stream_result(acc, start_time)
+    except Exception as e:
+        return _sdk_failure(e, start_time)
+
+
+async def asdk_request(client: Any, endpoint: str, payload: Dict[str, Any], stream: bool,
+                       keep_text: bool = True) -> Dict[str, Any]:
+    """sdk_request 的协程版本（AsyncOpenAI）"""
+    start_time = time.time()
+    try:
+        response = await _sdk_api(client, endpoint).create(**payload)
+        if not stream:
+            return _result(response_fields(endpoint, response, keep_text), start_time)
+        acc = TextStreamAccumulator(keep_text)
+        async for chunk in response:
+            acc.add_event(chunk)
+        return _stream_result(acc, start_time)
+    except Exception as e:
+        return _sdk_failure(e, start_time)
+
+
+def describe_endpoint(endpoint: str, batch_size: int) -> Optional[str]:
+    """非聊天端点的一行说明，聊天端点返回 None"""
+    if endpoint == "chat":
+        return None
+    return f"端点 {ENDPOINT_PATHS[endpoint]} / 每请求 {batch_size} 条输入"
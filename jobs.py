@@ -0,0 +1,199 @@
+# coding=utf-8
+"""
+后台任务管理：让 Web 界面的压测在 Streamlit 脚本的生命周期之外运行
+
+Streamlit 每次交互都会从头重跑脚本。原先的实现在脚本里启动测试线程后用 while 循环阻塞等待：
+测试期间界面完全冻结，刷新页面或重跑会让测试线程成为孤儿（结果丢失），同一时间也只能跑一个测试。
+JobManager 由 st.cache_resource 持有（进程级单例，所有会话与重跑共用）：
+    - submit() 把测试放到后台线程执行并立即返回；同时运行的任务超过 max_running 个时排队，有任务结束后依次开始
+    - 每个任务保存最新进度与逐秒时间窗口（只追加），界面每秒调用 updates(cursor) 只取 cursor 之后新增的窗口，
+      实时图表在会话内累积这些增量，不必每秒复制整段序列
+    - 结果保存在任务上（保留最近 keep 个已结束的任务），页面刷新或重新连接后仍可查看
+    - 管理器在所有会话间共用，任务记录提交者 owner，界面只列出本浏览器提交的任务；并发上限与排队对所有任务生效
+测试方法本身不能中途停止，cancel() 只能取消仍在排队的任务。
+"""
+import time
+import itertools
+import threading
+from typing import Dict, Any, List, Optional, Callable
+
+STATUSES = ("queued", "running", "done", "failed", "cancelled")
+
+
+class Job:
+    """
+    一个后台测试任务（由 JobManager 创建）
+
+    Args:
+        job_id: 任务编号（进程内递增）
+        name: 显示名称
+        target: 在后台线程中调用 target(job)，返回统计字典；进度通过 job.report() 上报
+        meta: 附加信息（测试模式、参数等，供界面展示与导出）
+        poll: 可选，返回进度字典的函数；测试方法不支持 progress_callback 时（如固定请求数），
+              由 updates() 在任务运行期间调用（通常为 RunStats.snapshot）
+        owner: 提交者标识（如浏览器 id），用于按提交者列出任务
+    """
+
+    def __init__(self, job_id: int, name: str, target: Callable[["Job"], Dict[str, Any]],
+                 meta: Optional[Dict[str, Any]] = None, poll: Optional[Callable[[], Dict[str, Any]]] = None,
+                 owner: Optional[str] = None):
+        self.id = job_id
+        self.name = name
+        self.owner = owner
+        self.meta = meta or {}
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self._target = target
+        self._poll = poll
+        self._lock = threading.Lock()
+        self._latest: Dict[str, Any] = {}
+        self._rows: List[Dict[str, Any]] = []
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    @property
+    def elapsed(self) -> float:
+        """已运行的时长（秒，不含排队时间）"""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def report(self, data: Dict[str, Any]) -> None:
+        """进度回调（可直接作为测试方法的 progress_callback）：更新最新进度，新的时间窗口追加到序列"""
+        with self._lock:
+            self._latest.update(data)
+            window = data.get("window")
+            if window and (not self._rows or window["t"] > self._rows[-1]["t"]):
+                self._rows.append(window)
+
+    def updates(self, cursor: int = 0) -> Dict[str, Any]:
+        """
+        取 cursor 之后的增量
+
+        Args:
+            cursor: 调用方已经拿到的时间窗口数
+
+        Returns:
+            status、progress（最新进度，附带 elapsed 时缺省为任务已运行时长）、rows（新增的时间窗口）、
+            cursor（下次调用传入的值）、error
+        """
+        if self._poll is not None and self.status == "running":
+            self.report(self._poll())
+        with self._lock:
+            rows = self._rows[cursor:]
+            return {"status": self.status, "progress": {"elapsed": round(self.elapsed, 2), **self._latest},
+                    "rows": rows, "cursor": cursor + len(rows), "error": self.error}
+
+    def _run(self) -> None:
+        self.status = "running"
+        self.started = time.time()
+        try:
+            self.result = self._target(self)
+            status = "done"
+        except Exception as e:
+            self.error = str(e) or type(e).__name__
+            status = "failed"
+        # 其他线程以 active（即 status）判断任务是否结束并随即读取 finished，须先写 finished 再发布最终状态
+        self.finished = time.time()
+        self.status = status
+
+
+class JobManager:
+    """
+    后台任务管理器（线程安全）
+
+    Args:
+        max_running: 同时运行的任务数上限，超出的任务排队
+        keep: 保留的已结束任务数，超过后丢弃最早结束的
+    """
+
+    def __init__(self, max_running: int = 2, keep: int = 20):
+        if max_running < 1:
+            raise ValueError(f"同时运行的任务数需为正整数: {max_running}")
+        self.max_running = max_running
+        self.keep = keep
+        self._jobs: Dict[int, Job] = {}
+        self._queue: List[Job] = []
+        self._running = 0
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def submit(self, name: str, target: Callable[[Job], Dict[str, Any]], meta: Optional[Dict[str, Any]] = None,
+               poll: Optional[Callable[[], Dict[str, Any]]] = None, owner: Optional[str] = None) -> Job:
+        """提交任务，立即返回（参数见 Job）"""
+        with self._lock:
+            job = Job(next(self._ids), name, target, meta, poll, owner)
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            self._prune()
+        self._schedule()
+        return job
+
+    def set_limit(self, max_running: int) -> None:
+        """调整并发上限；调大时立即开始排队中的任务"""
+        if max_running < 1:
+            raise ValueError(f"同时运行的任务数需为正整数: {max_running}")
+        self.max_running = max_running
+        self._schedule()
+
+    def _schedule(self) -> None:
+        with self._lock:
+            while self._queue and self._running < self.max_running:
+                job = self._queue.pop(0)
+                self._running += 1
+                job.status = "running"
+                threading.Thread(target=self._execute, args=(job,), name=f"job-{job.id}", daemon=True).start()
+
+    def _execute(self, job: Job) -> None:
+        try:
+            job._run()
+        finally:
+            with self._lock:
+                self._running -= 1
+            self._schedule()
+
+    def _prune(self) -> None:
+        finished = [job for job in self._jobs.values() if not job.active]
+        for job in sorted(finished, key=lambda j: j.finished or 0)[:max(0, len(finished) - self.keep)]:
+            del self._jobs[job.id]
+
+    def cancel(self, job_id: int) -> bool:
+        """取消排队中的任务，已开始的任务无法取消，返回是否取消成功"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job not in self._queue:
+                return False
+            self._queue.remove(job)
+            job.finished = time.time()
+            job.status = "cancelled"
+            return True
+
+    def remove(self, job_id: int) -> None:
+        """从列表中移除已结束的任务"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and not job.active:
+                del self._jobs[job_id]
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self, owner: Optional[str] = None) -> List[Job]:
+        """全部任务（提供 owner 时只取该提交者的任务），新提交的在前"""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if owner is None or job.owner == owner]
+        return sorted(jobs, key=lambda j: j.id, reverse=True)
+
+    def counts(self, owner: Optional[str] = None) -> Dict[str, int]:
+        """各状态的任务数（提供 owner 时只统计该提交者的任务）"""
+        counts = dict.fromkeys(STATUSES, 0)
+        for job in self.jobs(owner):
+            counts[job.status] += 1
+        return counts
@@ -0,0 +1,169 @@
+# coding=utf-8
+"""
+实时指标导出：在本地端口上提供 Prometheus / OpenMetrics 文本格式的 /metrics，长时间测试时接入已有的 Grafana
+
+导出的值在抓取时直接读取 RunStats 的累计计数与对数分桶直方图（RunStats.export），
+请求热路径上没有任何额外开销，单次抓取耗时只与直方图桶数有关，与已完成的请求数无关。
+
+指标（前缀 llm_loadtest_，均带 mode / model 标签）：
+    requests_total                    已完成请求数
+    requests_success_total            成功请求数
+    requests_failed_total{type=...}   按类型（http_<状态码> / timeout / connection / other）统计的失败数
+    requests_unsent_total             开环模式下计划内但未能发出的请求数
+    input_tokens_total / output_tokens_total / reasoning_tokens_total
+                                      成功请求的输入 / 输出 / 推理 token 数（服务端 usage，未返回时为本地计数）
+    items_total                       非聊天端点（嵌入 / 文本补全）处理的输入条数
+    new_connections_total             新建连接数
+    in_flight                         在途请求数
+    request_duration_seconds          成功请求耗时直方图
+    ttft_seconds / itl_seconds        流式压测的首 token 耗时与 token 间隔直方图
+以及通过 gauge() 注册的附加指标（如目标并发、自适应模式的当前并发上限）。
+
+用法：
+    python cli_tester.py ... --duration 7200 --metrics-port 9464
+    # prometheus.yml: scrape_configs: [{job_name: llm-loadtest, static_configs: [{targets: ["127.0.0.1:9464"]}]}]
+"""
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List, Callable, Optional
+from stats import RunStats
+
+PREFIX = "llm_loadtest_"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 直方图名 -> (指标名, 说明, 上界)
+HISTOGRAMS = {
+    "latency": ("request_duration_seconds", "成功请求的端到端耗时",
+                [0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300]),
+    "ttft": ("ttft_seconds", "流式请求的首 token 耗时",
+             [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30]),
+    "itl": ("itl_seconds", "流式请求相邻 token 的间隔",
+            [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1]),
+}
+_COUNTERS = (("total", "requests_total", "已完成请求数"),
+             ("success", "requests_success_total", "成功请求数"),
+             ("unsent", "requests_unsent_total", "开环模式下计划内但未能发出的请求数"),
+             ("input_tokens", "input_tokens_total", "成功请求的输入 token 数"),
+             ("output_tokens", "output_tokens_total", "成功请求的输出 token 数"),
+             ("reasoning_tokens", "reasoning_tokens_total", "成功请求输出中的推理 token 数"),
+             ("items", "items_total", "非聊天端点成功请求包含的输入条数"),
+             ("new_connections", "new_connections_total", "新建连接数"))
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(data: Dict[str, Any], labels: Dict[str, Any], gauges: Dict[str, Any]) -> str:
+    """
+    把 RunStats.export() 的快照渲染为 Prometheus 文本格式
+
+    Args:
+        data: RunStats.export(...) 的返回值（histograms 需包含 HISTOGRAMS 中的全部直方图）
+        labels: 每个指标都带的常量标签
+        gauges: 附加 gauge，名称 -> (说明, 当前值)
+    """
+    lines: List[str] = []
+
+    def header(name: str, help_text: str, kind: str) -> str:
+        lines.append(f"# HELP {PREFIX}{name} {help_text}")
+        lines.append(f"# TYPE {PREFIX}{name} {kind}")
+        return PREFIX + name
+
+    for key, name, help_text in _COUNTERS:
+        metric = header(name, help_text, "counter")
+        lines.append(f"{metric}{_labels(labels)} {data[key]}")
+    metric = header("requests_failed_total", "按类型统计的失败请求数", "counter")
+    for kind, n in sorted(data["failed_by_type"].items()):
+        lines.append(f"{metric}{_labels(dict(labels, type=kind))} {n}")
+    metric = header("in_flight", "在途请求数", "gauge")
+    lines.append(f"{metric}{_labels(labels)} {data['in_flight']}")
+    for name, (help_text, value) in gauges.items():
+        if value is not None:
+            metric = header(name, help_text, "gauge")
+            lines.append(f"{metric}{_labels(labels)} {_number(value)}")
+
+    for key, (name, help_text, bounds) in HISTOGRAMS.items():
+        counts, count, total = data["histograms"][key]
+        metric = header(name, help_text, "histogram")
+        for bound, n in zip(bounds, counts):
+            lines.append(f"{metric}_bucket{_labels(dict(labels, le=_number(bound)))} {n}")
+        lines.append(f"{metric}_bucket{_labels(dict(labels, le='+Inf'))} {count}")
+        lines.append(f"{metric}_sum{_labels(labels)} {_number(round(total, 6))}")
+        lines.append(f"{metric}_count{_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    /metrics 导出服务（后台线程）
+
+    Args:
+        run: 被导出的 RunStats，作为 run 参数传给测试方法（或 soak_test）后即可实时读取
+        host: 监听地址，默认仅本机；Prometheus 在其他机器上时设为 0.0.0.0
+        port: 监听端口，0 表示随机端口
+        labels: 每个指标都带的常量标签，如 {"mode": "duration_test", "model": "gpt-4o"}
+    """
+
+    def __init__(self, run: RunStats, host: str = "127.0.0.1", port: int = 9464,
+                 labels: Optional[Dict[str, Any]] = None):
+        self.run = run
+        self.labels = dict(labels or {})
+        self._gauges: Dict[str, Any] = {}
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def gauge(self, name: str, help_text: str, func: Callable[[], Optional[float]]) -> "MetricsServer":
+        """注册附加 gauge，每次抓取时调用 func() 取值（返回 None 时不输出）"""
+        self._gauges[name] = (help_text, func)
+        return self
+
+    def render(self) -> str:
+        data = self.run.export({key: bounds for key, (_, _, bounds) in HISTOGRAMS.items()})
+        gauges = {name: (help_text, func()) for name, (help_text, func) in self._gauges.items()}
+        return render(data, self.labels, gauges)
+
+    def start(self) -> "MetricsServer":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def shutdown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _make_handler(self):
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
@@ -0,0 +1,456 @@
+# coding=utf-8
+"""
+本地模拟 OpenAI 兼容服务：/v1/chat/completions、/v1/completions、/v1/embeddings 与 /v1/models
+
+无需真实端点与 API Key 即可验证压测工具本身，也用于 bench.py 测量压测客户端的性能上限。
+基于 asyncio 的精简 HTTP/1.1 实现（keep-alive、chunked 流式输出），单进程即可承受数万 req/s，
+服务端自身不应成为被测瓶颈。
+
+可配置项：
+    延迟分布      首 token 前的等待时间：fixed / uniform / exponential / lognormal
+    token 速率    每秒输出 token 数（0 表示不限速，所有 token 立即发出）
+    prefill 速率  每秒处理的输入 token 数，首 token 前额外等待 输入 token 数 / 速率（用于验证长度扫描 sweep.py）
+    前缀缓存      按消息粒度记住见过的消息前缀，命中部分不计 prefill 时间，并在 usage 中返回 cached_tokens
+                  （用于验证多轮会话 sessions.py 的前缀模式对比）
+    流式分块      每个 SSE 块包含的 token 数
+    推理内容      先输出若干 reasoning_content token（模拟 deepseek-r1 等推理模型）
+    错误注入      按比例返回 429（附带 Retry-After）与 500/503
+    容量上限      同时处理的请求数有限，超出的请求排队（延迟随之上升），队列满时返回 429（附带 Retry-After），
+                  用于验证自适应并发（adaptive.py）能否找到服务的容量拐点
+    批量输入      /completions 的 prompt 与 /embeddings 的 input 可以是列表，耗时 = 固定等待 + 全部输入 token / prefill 速率，
+                  配合 --capacity 可以复现“批量增大到一定程度后 items/s 不再提升”（用于验证批量扫描）
+
+用法：
+    python mock_server.py --port 8000 --latency lognormal --latency-mean 0.2 --tokens-per-sec 50
+    python cli_tester.py --base-url http://127.0.0.1:8000/v1 --api-key mock --model mock --duration 60
+"""
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import threading
+from typing import Dict, Any, List, Optional
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+
+class MockOpenAIServer:
+    """
+    模拟 OpenAI 兼容服务
+
+    Args:
+        host: 监听地址
+        port: 监听端口，0 表示随机分配（实际端口见 port 属性）
+        latency: 首 token 前等待时间的分布，fixed / uniform / exponential / lognormal
+        latency_mean: 等待时间均值（秒）
+        latency_std: 等待时间标准差（秒），uniform 时为半宽，fixed / exponential 忽略
+        tokens_per_sec: 每秒输出 token 数，0 表示不限速
+        prefill_tokens_per_sec: 每秒处理的输入 token 数（按 4 字符 1 token 估算），0 表示不计 prefill 时间
+        prefix_cache: 是否模拟前缀缓存：与之前某个请求开头若干条消息完全相同时，这部分 token 不计 prefill 时间
+        prefix_cache_entries: 前缀缓存的条目上限，超过后清空重建
+        output_tokens: 每个回答的 token 数（不超过请求的 max_tokens）
+        chunk_tokens: 流式输出时每个 SSE 块包含的 token 数
+        reasoning_tokens: 回答前输出的 reasoning_content token 数
+        error_429: 返回 429 的比例（0~1）
+        error_5xx: 返回 500 / 503 的比例（0~1）
+        retry_after: 429 响应的 Retry-After 秒数
+        embedding_dim: /embeddings 返回的向量维度
+        capacity: 同时处理的请求数上限，0 表示不限
+        max_queue: 超出容量后允许排队的请求数，None 表示不限，队列满时返回 429
+        seed: 随机种子
+    """
+
+    # (端点, 路径后缀)：/chat/completions 需排在 /completions 之前匹配
+    ROUTES = (("chat", "/chat/completions"), ("completions", "/completions"), ("embeddings", "/embeddings"))
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8000, latency: str = "fixed",
+                 latency_mean: float = 0.05, latency_std: float = 0.0, tokens_per_sec: float = 0.0,
+                 output_tokens: int = 16, chunk_tokens: int = 1, reasoning_tokens: int = 0,
+                 error_429: float = 0.0, error_5xx: float = 0.0, retry_after: int = 1,
+                 capacity: int = 0, max_queue: Optional[int] = None, seed: Optional[int] = None,
+                 prefill_tokens_per_sec: float = 0.0, prefix_cache: bool = False,
+                 prefix_cache_entries: int = 100000, embedding_dim: int = 16):
+        if latency not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"不支持的延迟分布: {latency}")
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.latency_mean = latency_mean
+        self.latency_std = latency_std
+        self.tokens_per_sec = tokens_per_sec
+        self.prefill_tokens_per_sec = prefill_tokens_per_sec
+        self.prefix_cache = prefix_cache
+        self.prefix_cache_entries = prefix_cache_entries
+        self._prefixes = set()
+        self.output_tokens = output_tokens
+        self.embedding_dim = embedding_dim
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.reasoning_tokens = reasoning_tokens
+        self.error_429 = error_429
+        self.error_5xx = error_5xx
+        self.retry_after = retry_after
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.requests = 0
+        self.rejected = 0
+        self._queued = 0
+        self._slots = None
+        self._rng = random.Random(seed)
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def sample_latency(self) -> float:
+        """按配置的分布抽取一次首 token 前的等待时间（秒）"""
+        mean, std = self.latency_mean, self.latency_std
+        if mean <= 0:
+            return 0.0
+        if self.latency == "uniform":
+            return max(0.0, self._rng.uniform(mean - std, mean + std))
+        if self.latency == "exponential":
+            return self._rng.expovariate(1.0 / mean)
+        if self.latency == "lognormal" and std > 0:
+            # 由目标均值与标准差反推对数正态分布的参数
+            sigma2 = math.log(1 + (std / mean) ** 2)
+            mu = math.log(mean) - sigma2 / 2
+            return self._rng.lognormvariate(mu, sigma2 ** 0.5)
+        return mean
+
+    # ---------- HTTP ----------
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """一个连接上循环处理多个请求（keep-alive），对端关闭或要求 close 时退出"""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                method, path = lines[0].split(" ")[:2]
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+                await self._dispatch(method, path.split("?")[0], body, writer)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status: int, reason: str, body: bytes,
+                        extra_headers: str = "") -> None:
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n{extra_headers}\r\n".encode("latin-1") + body)
+
+    async def _dispatch(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter) -> None:
+        if method == "GET" and path.rstrip("/").endswith("/models"):
+            data = {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]}
+            self._write_response(writer, 200, "OK", json.dumps(data).encode())
+            await writer.drain()
+            return
+        route = path.rstrip("/")
+        endpoint = next((name for name, suffix in self.ROUTES if route.endswith(suffix)), None)
+        if method != "POST" or endpoint is None:
+            self._write_response(writer, 404, "Not Found", b'{"error": {"message": "not found"}}')
+            await writer.drain()
+            return
+
+        self.requests += 1
+        try:
+            request = json.loads(body)
+        except ValueError:
+            self._write_response(writer, 400, "Bad Request", b'{"error": {"message": "invalid json"}}')
+            await writer.drain()
+            return
+
+        if not self.capacity:
+            await self._complete(request, writer, endpoint)
+            return
+        if self._slots.locked() and self.max_queue is not None and self._queued >= self.max_queue:
+            self.rejected += 1
+            await self._reject(writer, "Server overloaded (mock)")
+            return
+        self._queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._queued -= 1
+        try:
+            await self._complete(request, writer, endpoint)
+        finally:
+            self._slots.release()
+
+    async def _reject(self, writer: asyncio.StreamWriter, message: str) -> None:
+        error = {"error": {"message": message, "type": "rate_limit_error"}}
+        self._write_response(writer, 429, "Too Many Requests", json.dumps(error).encode(),
+                             f"Retry-After: {self.retry_after}\r\n")
+        await writer.drain()
+
+    def _cached_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """查找已缓存的最长消息前缀，返回其 token 数，并登记本次请求的全部前缀"""
+        key, tokens, cached, hit = 0, 0, 0, True
+        keys = []
+        for m in messages:
+            content = str(m.get("content", ""))
+            key = hash((key, m.get("role"), content))
+            tokens += len(content) // 4
+            hit = hit and key in self._prefixes
+            if hit:
+                cached = tokens
+            keys.append(key)
+        if len(self._prefixes) + len(keys) > self.prefix_cache_entries:
+            self._prefixes.clear()
+        self._prefixes.update(keys)
+        return cached
+
+    async def _complete(self, request: Dict[str, Any], writer: asyncio.StreamWriter, endpoint: str = "chat") -> None:
+        """生成一次 chat/completions（或 completions / embeddings）响应（含错误注入）"""
+        latency = self.sample_latency()
+        roll = self._rng.random()
+        if roll < self.error_429:
+            await asyncio.sleep(latency)
+            await self._reject(writer, "Rate limit exceeded (mock)")
+            return
+        if roll < self.error_429 + self.error_5xx:
+            await asyncio.sleep(latency)
+            status, reason = (500, "Internal Server Error") if self._rng.random() < 0.5 else \
+                (503, "Service Unavailable")
+            error = {"error": {"message": f"{reason} (mock)", "type": "server_error"}}
+            self._write_response(writer, status, reason, json.dumps(error).encode())
+            await writer.drain()
+            return
+        if endpoint != "chat":
+            await self._complete_batch(request, writer, endpoint, latency)
+            return
+
+        max_tokens = request.get("max_tokens") or self.output_tokens
+        output_tokens = max(1, min(self.output_tokens, int(max_tokens)))
+        model = request.get("model", "mock")
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in request.get("messages", [])) // 4 + 1
+        # 与 OpenAI 一致：completion_tokens 包含推理 token，明细在 completion_tokens_details 中
+        completion_tokens = output_tokens + self.reasoning_tokens
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        if self.reasoning_tokens:
+            usage["completion_tokens_details"] = {"reasoning_tokens": self.reasoning_tokens}
+        cached = 0
+        if self.prefix_cache:
+            cached = min(prompt_tokens, self._cached_tokens(request.get("messages", [])))
+            usage["prompt_tokens_details"] = {"cached_tokens": cached}
+
+        if self.prefill_tokens_per_sec > 0:
+            latency += (prompt_tokens - cached) / self.prefill_tokens_per_sec
+        await asyncio.sleep(latency)
+        if request.get("stream"):
+            include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+            await self._stream(writer, model, output_tokens, usage if include_usage else None)
+            return
+
+        # 非流式：整段生成时间按 token 速率计算
+        if self.tokens_per_sec > 0:
+            await asyncio.sleep((self.reasoning_tokens + output_tokens) / self.tokens_per_sec)
+        message = {"role": "assistant", "content": "tok " * output_tokens}
+        if self.reasoning_tokens:
+            message["reasoning_content"] = "think " * self.reasoning_tokens
+        data = {
+            "id": f"chatcmpl-mock{self.requests}", "object": "chat.completion", "created": int(time.time()),
+            "model": model, "usage": usage,
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}]
+        }
+        self._write_response(writer, 200, "OK", json.dumps(data).encode())
+        await writer.drain()
+
+    async def _complete_batch(self, request: Dict[str, Any], writer: asyncio.StreamWriter, endpoint: str,
+                              latency: float) -> None:
+        """/completions 与 /embeddings：输入可以是字符串或列表，每条输入各自生成一个 choice / 向量"""
+        inputs = request.get("input" if endpoint == "embeddings" else "prompt", "")
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        model = request.get("model", "mock")
+        prompt_tokens = sum(len(str(x)) // 4 + 1 for x in inputs)
+        if self.prefill_tokens_per_sec > 0:
+            latency += prompt_tokens / self.prefill_tokens_per_sec
+        await asyncio.sleep(latency)
+        if endpoint == "embeddings":
+            vector = [round(math.sin(i + 1), 6) for i in range(self.embedding_dim)]
+            data = {"object": "list", "model": model,
+                    "data": [{"object": "embedding", "index": i, "embedding": vector} for i in range(len(inputs))],
+                    "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens}}
+            self._write_response(writer, 200, "OK", json.dumps(data).encode())
+            await writer.drain()
+            return
+
+        max_tokens = request.get("max_tokens") or self.output_tokens
+        output_tokens = max(1, min(self.output_tokens, int(max_tokens)))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": output_tokens * len(inputs),
+                 "total_tokens": prompt_tokens + output_tokens * len(inputs)}
+        if request.get("stream"):
+            include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+            await self._stream_text(writer, model, len(inputs), output_tokens, usage if include_usage else None)
+            return
+        if self.tokens_per_sec > 0:
+            await asyncio.sleep(output_tokens / self.tokens_per_sec)
+        data = {
+            "id": f"cmpl-mock{self.requests}", "object": "text_completion", "created": int(time.time()),
+            "model": model, "usage": usage,
+            "choices": [{"index": i, "text": "tok " * output_tokens, "finish_reason": "stop"}
+                        for i in range(len(inputs))]
+        }
+        self._write_response(writer, 200, "OK", json.dumps(data).encode())
+        await writer.drain()
+
+    @staticmethod
+    def _sse(data: Any) -> bytes:
+        """一个 SSE 事件（chunked 编码的一个分块）"""
+        payload = f"data: {json.dumps(data)}\n\n".encode()
+        return f"{len(payload):x}\r\n".encode() + payload + b"\r\n"
+
+    async def _stream_text(self, writer: asyncio.StreamWriter, model: str, n: int, output_tokens: int,
+                           usage: Optional[Dict[str, Any]]) -> None:
+        """/completions 的流式输出：批内 n 条输入同步解码，每步为每条输入各发一个 text 块"""
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\nTransfer-Encoding: chunked\r\n\r\n")
+        base = {"id": f"cmpl-mock{self.requests}", "object": "text_completion", "created": int(time.time()),
+                "model": model}
+        interval = self.chunk_tokens / self.tokens_per_sec if self.tokens_per_sec > 0 else 0
+        sent = 0
+        while sent < output_tokens:
+            k = min(self.chunk_tokens, output_tokens - sent)
+            sent += k
+            finish = "stop" if sent >= output_tokens else None
+            for i in range(n):
+                writer.write(self._sse({**base, "choices": [{"index": i, "text": "tok " * k,
+                                                             "finish_reason": finish}]}))
+            await writer.drain()
+            if interval:
+                await asyncio.sleep(interval)
+        if usage is not None:
+            writer.write(self._sse({**base, "choices": [], "usage": usage}))
+        payload = b"data: [DONE]\n\n"
+        writer.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n0\r\n\r\n")
+        await writer.drain()
+
+    async def _stream(self, writer: asyncio.StreamWriter, model: str, output_tokens: int,
+                      usage: Optional[Dict[str, Any]]) -> None:
+        """SSE 流式输出：先 reasoning_content，再 content，按 token 速率逐块发送（chunked 编码）"""
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\nTransfer-Encoding: chunked\r\n\r\n")
+        created = int(time.time())
+        chunk_id = f"chatcmpl-mock{self.requests}"
+
+        event = self._sse
+
+        def delta_chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> bytes:
+            return event({"id": chunk_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                          "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]})
+
+        writer.write(delta_chunk({"role": "assistant", "content": ""}))
+        interval = self.chunk_tokens / self.tokens_per_sec if self.tokens_per_sec > 0 else 0
+        for field, total, word in (("reasoning_content", self.reasoning_tokens, "think "),
+                                   ("content", output_tokens, "tok ")):
+            sent = 0
+            while sent < total:
+                n = min(self.chunk_tokens, total - sent)
+                writer.write(delta_chunk({field: word * n}))
+                sent += n
+                await writer.drain()
+                if interval:
+                    await asyncio.sleep(interval)
+        writer.write(delta_chunk({}, "stop"))
+        if usage is not None:
+            writer.write(event({"id": chunk_id, "object": "chat.completion.chunk", "created": created,
+                                "model": model, "choices": [], "usage": usage}))
+        payload = b"data: [DONE]\n\n"
+        writer.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n0\r\n\r\n")
+        await writer.drain()
+
+    # ---------- 生命周期 ----------
+
+    async def _start(self) -> None:
+        if self.capacity:
+            self._slots = asyncio.Semaphore(self.capacity)
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+
+    def serve_forever(self) -> None:
+        """在当前线程中运行（命令行模式）"""
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._start())
+        self._loop.run_forever()
+
+    def start(self) -> "MockOpenAIServer":
+        """在后台线程中运行，返回时已开始监听"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def shutdown(self) -> None:
+        if self._loop is None:
+            return
+
+        async def stop():
+            self._server.close()
+            await self._server.wait_closed()
+            self._loop.stop()
+
+        asyncio.run_coroutine_threadsafe(stop(), self._loop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 OpenAI 兼容服务（/v1/chat/completions、/completions、/embeddings）")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口")
+    parser.add_argument("--latency", choices=LATENCY_DISTRIBUTIONS, default="fixed", help="首 token 前等待时间的分布")
+    parser.add_argument("--latency-mean", type=float, default=0.05, help="等待时间均值（秒）")
+    parser.add_argument("--latency-std", type=float, default=0.0, help="等待时间标准差（秒），uniform 时为半宽")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0, help="每秒输出 token 数，0 表示不限速")
+    parser.add_argument("--prefill-tokens-per-sec", type=float, default=0.0,
+                        help="每秒处理的输入 token 数，首 token 前按输入长度额外等待，0 表示不计")
+    parser.add_argument("--prefix-cache", action="store_true",
+                        help="模拟前缀缓存：与之前请求相同的开头若干条消息不计 prefill 时间")
+    parser.add_argument("--output-tokens", type=int, default=16, help="每个回答的 token 数（不超过请求的 max_tokens）")
+    parser.add_argument("--chunk-tokens", type=int, default=1, help="流式输出时每个 SSE 块包含的 token 数")
+    parser.add_argument("--reasoning-tokens", type=int, default=0, help="回答前输出的 reasoning_content token 数")
+    parser.add_argument("--error-429", type=float, default=0.0, help="返回 429 的比例（0~1）")
+    parser.add_argument("--error-5xx", type=float, default=0.0, help="返回 500/503 的比例（0~1）")
+    parser.add_argument("--retry-after", type=int, default=1, help="429 响应的 Retry-After 秒数")
+    parser.add_argument("--embedding-dim", type=int, default=16, help="/embeddings 返回的向量维度")
+    parser.add_argument("--capacity", type=int, default=0, help="同时处理的请求数上限，0 表示不限")
+    parser.add_argument("--max-queue", type=int, help="超出容量后允许排队的请求数，队列满时返回 429，默认不限")
+    parser.add_argument("--seed", type=int, help="随机种子")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(args.host, args.port, latency=args.latency, latency_mean=args.latency_mean,
+                              latency_std=args.latency_std, tokens_per_sec=args.tokens_per_sec,
+                              output_tokens=args.output_tokens, chunk_tokens=args.chunk_tokens,
+                              reasoning_tokens=args.reasoning_tokens, error_429=args.error_429,
+                              error_5xx=args.error_5xx, retry_after=args.retry_after, capacity=args.capacity,
+                              max_queue=args.max_queue, seed=args.seed,
+                              prefill_tokens_per_sec=args.prefill_tokens_per_sec, prefix_cache=args.prefix_cache,
+                              embedding_dim=args.embedding_dim)
+    print(f"🧪 模拟服务已启动: http://{args.host}:{args.port}/v1（Ctrl+C 退出）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
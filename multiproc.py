@@ -0,0 +1,220 @@
+# coding=utf-8
+"""
+多进程压测：把并发数 / 总请求数 / 目标速率拆分到多个工作进程
+
+单个 Python 进程受限于一个 CPU 核（JSON 解析、TLS、SSE 解码），面对局域网内的高速后端时
+客户端自身会先成为瓶颈。每个子进程独立构建 tester 并运行原有的测试循环，
+每秒把计数器快照发回父进程用于实时进度，结束时回传可合并的 RunStats，
+父进程合并后生成与 concurrent_test / duration_test / rate_test 相同结构的统计字典。
+"""
+import time
+import queue
+import threading
+import multiprocessing as mp
+from typing import Dict, Any, List, Optional
+from tqdm import tqdm
+from stats import RunStats, merge_rows
+from tester import OpenAITester, AsyncOpenAITester, _rate_stats
+from workload import shard_spec, load_workload
+from transport import connection_options
+
+
+def split_evenly(value: float, parts: int, integer: bool = True) -> List[Any]:
+    """把 value 尽量均匀地拆成 parts 份（整数拆分时余数分给前几份）"""
+    if not integer:
+        return [value / parts] * parts
+    base, extra = divmod(int(value), parts)
+    return [base + (1 if i < extra else 0) for i in range(parts)]
+
+
+def make_tester(config: Dict[str, Any]):
+    """根据配置字典构建 tester（子进程中调用），可选的 pool_size / keepalive / http2 / client_mode /
+    request_path / keep_text / endpoint / batch_size 见 OpenAITester"""
+    tester_cls = AsyncOpenAITester if config.get("engine") == "async" else OpenAITester
+    return tester_cls(config["base_url"], config["api_key"], config["model"], config.get("timeout", 30),
+                      **connection_options(config))
+
+
+def _worker_main(index: int, config: Dict[str, Any], mode: str, params: Dict[str, Any],
+                 messages: Any, go: Any) -> None:
+    """子进程入口：初始化完成后等待统一开始信号，运行测试并回传统计"""
+    try:
+        tester = make_tester(config)
+        run = RunStats()
+        if params.get("workload") is not None:
+            params = dict(params, workload=load_workload(params["workload"]))
+        messages.put(("ready", index, None))
+        go.wait()
+
+        done = threading.Event()
+
+        def report():
+            # 每秒回传一次计数器快照（O(1)），父进程汇总后驱动进度显示
+            while not done.wait(1):
+                messages.put(("progress", index, run.snapshot()))
+
+        reporter = threading.Thread(target=report, daemon=True)
+        reporter.start()
+        getattr(tester, mode)(**params, show_progress=False, run=run)
+        done.set()
+        messages.put(("done", index, run.to_dict()))
+    except Exception as e:
+        messages.put(("error", index, f"{type(e).__name__}: {e}"))
+
+
+def shard_params(mode: str, params: Dict[str, Any], processes: int) -> List[Dict[str, Any]]:
+    """按模式拆分参数：concurrency 总是拆分，total / rps 分别在固定请求数 / 固定速率模式下拆分，workload 按行拆分"""
+    # 并发数（或总请求数）少于进程数时，多余的进程没有工作可做
+    processes = max(1, min(processes, params["concurrency"], params.get("total", processes)))
+    shards = [dict(params) for _ in range(processes)]
+    for shard, concurrency in zip(shards, split_evenly(params["concurrency"], processes)):
+        shard["concurrency"] = concurrency
+    if mode == "concurrent_test":
+        for shard, total in zip(shards, split_evenly(params["total"], processes)):
+            shard["total"] = total
+    if mode == "rate_test":
+        for shard, rps in zip(shards, split_evenly(params["rps"], processes, integer=False)):
+            shard["rps"] = rps
+    # 数据集负载按行号拆分，各进程回放互不重叠的行（以 spec 字典形式跨进程传递）
+    workload = params.get("workload")
+    if workload is not None:
+        spec = workload if isinstance(workload, dict) else workload.spec()
+        for i, shard in enumerate(shards):
+            shard["workload"] = shard_spec(spec, i, len(shards))
+    return shards
+
+
+def report_progress(pbar: Any, progress_callback: Any, snapshots: Any, start_time: float,
+                    duration: Optional[int]) -> None:
+    """汇总各工作单元的计数器快照（最近时间窗口按 merge_rows 合并），刷新进度条或调用进度回调（字段同 duration_test）"""
+    snapshots = list(snapshots)
+    requests = sum(s["requests"] for s in snapshots)
+    success = sum(s["success"] for s in snapshots)
+    elapsed = max(1e-6, time.time() - start_time)
+    if progress_callback is not None:
+        progress_callback({
+            'elapsed': round(elapsed, 2),
+            'target': duration,
+            'requests': requests,
+            'success': success,
+            'qps': round(success / elapsed, 2),
+            'window': merge_rows([s.get("window") for s in snapshots])
+        })
+    elif pbar is not None:
+        pbar.n = min(duration, int(elapsed)) if duration else requests
+        pbar.set_postfix({'requests': requests, 'success': success, 'qps': round(success / elapsed, 2)})
+
+
+def build_stats(mode: str, run: RunStats, elapsed: float, params: Dict[str, Any]) -> Dict[str, Any]:
+    """用合并后的 RunStats 生成与对应测试方法结构相同的统计字典"""
+    if mode == "rate_test":
+        return _rate_stats(run, elapsed, params["duration"], params["rps"], params.get("arrival", "constant"))
+    stats = run.summary(elapsed)
+    if mode == "duration_test":
+        stats["duration"] = round(elapsed, 3)
+        stats["target_duration"] = params["duration"]
+    else:
+        stats["total_wall_time"] = round(elapsed, 3)
+    return stats
+
+
+def multiprocess_test(config: Dict[str, Any], mode: str, processes: int, params: Dict[str, Any],
+                      show_progress: bool = True, progress_callback: Any = None,
+                      run: Optional[RunStats] = None, start_at: Optional[float] = None) -> Dict[str, Any]:
+    """
+    多进程执行一次测试并合并结果
+
+    Args:
+        config: tester 配置，包含 base_url / api_key / model / timeout / engine
+        mode: "concurrent_test"、"duration_test" 或 "rate_test"
+        processes: 工作进程数
+        params: 对应测试方法的参数（concurrency / total / rps 为全局值，会被拆分到各进程）
+        show_progress: 是否显示进度条
+        progress_callback: 每秒一次的进度回调，字段同 duration_test
+        run: 合并结果写入的 RunStats，默认新建
+        start_at: 统一开始时刻（时间戳），工作进程就绪后等到该时刻才开始；默认就绪即开始
+
+    Returns:
+        与单进程测试方法结构相同的统计字典，额外包含 processes
+    """
+    shards = shard_params(mode, params, processes)
+    ctx = mp.get_context("spawn")  # 父进程可能已有事件循环/UI 线程，fork 不安全
+    messages = ctx.Queue()
+    go = ctx.Event()
+    workers = [ctx.Process(target=_worker_main, args=(i, config, mode, shard, messages, go), daemon=True)
+               for i, shard in enumerate(shards)]
+    for p in workers:
+        p.start()
+    try:
+        return _collect(workers, messages, go, mode, params, show_progress, progress_callback,
+                        run if run is not None else RunStats(), start_at)
+    finally:
+        for p in workers:
+            if p.is_alive():
+                p.terminate()
+
+
+def _collect(workers: List[Any], messages: Any, go: Any, mode: str, params: Dict[str, Any],
+             show_progress: bool, progress_callback: Any, merged: RunStats,
+             start_at: Optional[float]) -> Dict[str, Any]:
+    """父进程：等待全部就绪后统一开始，汇总进度快照并合并最终统计"""
+    print(f"🧩 启动 {len(workers)} 个工作进程...")
+    ready = set()
+    while len(ready) < len(workers):
+        kind, index, payload = messages.get()
+        if kind == "error":
+            raise RuntimeError(f"工作进程 {index} 初始化失败: {payload}")
+        ready.add(index)
+
+    if start_at is not None and start_at > time.time():
+        time.sleep(start_at - time.time())
+    start_time = time.time()
+    go.set()
+
+    duration = params.get("duration")
+    snapshots = {i: {"requests": 0, "success": 0} for i in range(len(workers))}
+    parts = {}
+    errors = []
+    pbar = None
+    if show_progress and progress_callback is None:
+        if duration:
+            pbar = tqdm(total=duration, desc="持续测试", unit="s")
+        else:
+            pbar = tqdm(total=params["total"], desc="并发测试")
+    last_tick = start_time
+
+    while len(parts) + len(errors) < len(workers):
+        try:
+            kind, index, payload = messages.get(timeout=0.2)
+        except queue.Empty:
+            if not any(p.is_alive() for p in workers) and messages.empty():
+                errors.append("工作进程异常退出")
+                break
+            kind = None
+        if kind == "progress":
+            snapshots[index] = payload
+        elif kind == "done":
+            parts[index] = RunStats.from_dict(payload)
+            snapshots[index] = parts[index].snapshot()
+        elif kind == "error":
+            errors.append(f"工作进程 {index}: {payload}")
+
+        if time.time() - last_tick >= 1:
+            last_tick = time.time()
+            report_progress(pbar, progress_callback, snapshots.values(), start_time, duration)
+    if pbar is not None:
+        pbar.close()
+    for p in workers:
+        p.join(timeout=5)
+    if errors:
+        raise RuntimeError("; ".join(errors))
+
+    elapsed = time.time() - start_time
+    for part in parts.values():
+        merged.merge(part)
+
+    stats = build_stats(mode, merged, elapsed, params)
+    stats["processes"] = len(workers)
+    if start_at is not None:
+        stats["start_skew"] = round(start_time - start_at, 4)
+    return stats
@@ -0,0 +1,154 @@
+# coding=utf-8
+"""
+压测客户端自身开销分析：判断测得的延迟 / QPS 是否被压测工具本身扭曲
+
+开启后在测试期间采集：
+    CPU 占用       进程 CPU 时间 / 墙钟时间（单位：核）与每请求 CPU 时间；Python 受 GIL 限制，单进程约 1 核封顶
+    调度延迟       后台线程每 50ms 醒来一次，实际醒来时刻相对预期的滞后（GIL 争用、线程过多时变大）
+    事件循环延迟   asyncio 引擎额外在事件循环内做同样的测量（协程中有阻塞调用或循环过载时变大）
+    GC 停顿        gc.callbacks 记录的每次垃圾回收耗时
+    解析耗时       精简请求路径（request_path="raw"）下 JSON / SSE 解析占请求耗时的比例，其余时间为等待网络
+任一指标超过阈值时给出警告：此时压测客户端可能就是瓶颈，测得的延迟中包含客户端排队时间。
+"""
+import gc
+import os
+import time
+import asyncio
+import threading
+from typing import Dict, Any, List, Optional
+from stats import LatencyHistogram
+
+# 告警阈值
+CPU_UTIL_WARN = 0.85        # 进程 CPU 占用（核）
+LAG_WARN = 0.01             # 调度/事件循环延迟 p99（秒）
+GC_SHARE_WARN = 1.0         # GC 停顿占测试时长的比例（%）
+GC_PAUSE_WARN = 0.05        # 单次 GC 停顿（秒）
+PARSE_SHARE_WARN = 5.0      # 解析耗时占请求耗时的比例（%）
+SEND_LAG_WARN = 0.01        # 开环模式发送滞后 p99（秒）
+
+
+class ClientProfiler:
+    """
+    客户端开销采样器：start() 与 stop() 之间的 CPU、调度延迟、事件循环延迟与 GC 停顿
+
+    Args:
+        loop: asyncio 引擎的事件循环（AsyncOpenAITester._loop），线程引擎为 None
+        interval: 调度延迟采样间隔（秒）
+    """
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None, interval: float = 0.05):
+        self.loop = loop
+        self.interval = interval
+        self.sched_lag = LatencyHistogram(lowest=1e-6)
+        self.loop_lag = LatencyHistogram(lowest=1e-6)
+        self.gc_pause = LatencyHistogram(lowest=1e-6)
+        self._gc_start = None
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._loop_future = None
+        self._cpu_start = 0.0
+        self._wall_start = 0.0
+        self.cpu = 0.0
+        self.wall = 0.0
+
+    def _on_gc(self, phase: str, info: Dict[str, Any]) -> None:
+        if phase == "start":
+            self._gc_start = time.perf_counter()
+        elif self._gc_start is not None:
+            self.gc_pause.record(time.perf_counter() - self._gc_start)
+            self._gc_start = None
+
+    def _sample_threads(self) -> None:
+        while not self._stop.is_set():
+            expected = time.perf_counter() + self.interval
+            time.sleep(self.interval)
+            self.sched_lag.record(max(0.0, time.perf_counter() - expected))
+
+    async def _sample_loop(self) -> None:
+        while not self._stop.is_set():
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.loop_lag.record(max(0.0, time.perf_counter() - expected))
+
+    def start(self) -> "ClientProfiler":
+        self._cpu_start = time.process_time()
+        self._wall_start = time.perf_counter()
+        gc.callbacks.append(self._on_gc)
+        thread = threading.Thread(target=self._sample_threads, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        if self.loop is not None:
+            self._loop_future = asyncio.run_coroutine_threadsafe(self._sample_loop(), self.loop)
+        return self
+
+    def stop(self) -> None:
+        self.cpu = time.process_time() - self._cpu_start
+        self.wall = time.perf_counter() - self._wall_start
+        self._stop.set()
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+        for thread in self._threads:
+            thread.join(timeout=1)
+        if self._loop_future is not None:
+            try:
+                self._loop_future.result(timeout=1)
+            except Exception:
+                self._loop_future.cancel()
+
+    def report(self, stats: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        结合测试统计生成客户端开销报告
+
+        Args:
+            stats: 测试方法返回的统计字典（用于每请求 CPU 时间、解析占比与发送滞后）
+
+        Returns:
+            cpu_util / cpu_ms_per_req / cpu_count、sched_lag_*（毫秒）、loop_lag_*（asyncio 引擎）、
+            gc_count / gc_total_ms / gc_max_ms、parse_share（精简路径）与 warnings（告警列表）
+        """
+        wall = max(self.wall, 1e-6)
+        report = {
+            "cpu_util": round(self.cpu / wall, 2),
+            "cpu_ms_per_req": round(self.cpu / max(1, stats["total"]) * 1000, 3),
+            "cpu_count": os.cpu_count(),
+            "gc_count": self.gc_pause.count,
+            "gc_total_ms": round(self.gc_pause.sum * 1000, 2),
+            "gc_max_ms": round(self.gc_pause.max * 1000, 2) if self.gc_pause.count else 0,
+        }
+        for name, hist in (("sched_lag", self.sched_lag), ("loop_lag", self.loop_lag)):
+            if hist.count:
+                report[f"{name}_p50_ms"] = round(hist.percentile(50) * 1000, 2)
+                report[f"{name}_p99_ms"] = round(hist.percentile(99) * 1000, 2)
+                report[f"{name}_max_ms"] = round(hist.max * 1000, 2)
+        if "parse_share" in stats:
+            report["parse_share"] = stats["parse_share"]
+
+        warnings = []
+        if report["cpu_util"] >= CPU_UTIL_WARN:
+            warnings.append(f"压测进程 CPU 占用 {report['cpu_util']} 核（每请求 {report['cpu_ms_per_req']}ms），"
+                            f"单个 Python 进程约 1 核封顶，QPS 可能受客户端限制：增加工作进程数或使用精简请求路径")
+        for name, label, hist in (("sched_lag", "线程调度延迟", self.sched_lag),
+                                  ("loop_lag", "事件循环延迟", self.loop_lag)):
+            if hist.count and hist.percentile(99) > LAG_WARN:
+                warnings.append(f"{label} p99={report[name + '_p99_ms']}ms（max {report[name + '_max_ms']}ms），"
+                                f"测得的延迟中包含客户端排队时间")
+        if self.gc_pause.sum / wall * 100 > GC_SHARE_WARN or self.gc_pause.max > GC_PAUSE_WARN:
+            warnings.append(f"GC 停顿共 {report['gc_total_ms']}ms（{report['gc_count']} 次，"
+                            f"最长 {report['gc_max_ms']}ms），停顿期间所有请求的计时都被拉长")
+        if report.get("parse_share", 0) > PARSE_SHARE_WARN:
+            warnings.append(f"响应解析占请求耗时 {report['parse_share']}%，可使用 --no-text 减少文本处理")
+        if stats.get("send_lag_p99", 0) > SEND_LAG_WARN:
+            warnings.append(f"开环发送滞后 p99={stats['send_lag_p99']}s，客户端跟不上目标速率")
+        report["warnings"] = warnings
+        return report
+
+
+def profile_call(tester: Any, func: Any, *args, **kwargs) -> Dict[str, Any]:
+    """在开销采样下执行一次测试（如 tester.duration_test），把报告附加到返回的统计字典的 client 字段"""
+    profiler = ClientProfiler(getattr(tester, "_loop", None)).start()
+    try:
+        stats = func(*args, **kwargs)
+    finally:
+        profiler.stop()
+    stats["client"] = profiler.report(stats)
+    return stats
@@ -0,0 +1,132 @@
+# coding=utf-8
+"""
+阶梯增压测试：按并发阶梯依次执行固定时长测试，自动判断饱和点（拐点）
+
+替代手工执行 10 -> 20 -> 35 -> 50 的多次压测：每个阶梯结束后检查 SLO（成功率、P95）
+与 QPS 的扩展效率，一旦 SLO 被打破或 QPS 不再随并发增长就提前停止，并输出汇总表。
+各阶梯复用同一个 tester 实例（同一连接池），阶梯之间不重新建连。
+"""
+from typing import Dict, Any, List, Optional
+from steady import SteadyState
+
+
+def parse_stages(spec: str) -> List[int]:
+    """
+    解析阶梯定义
+
+    支持两种写法：
+        "10,20,35,50"   逐个列出并发数
+        "10:100:10"     起始:上限:步长，等价于 10,20,...,100
+    """
+    if ":" in spec:
+        start, stop, step = (int(x) for x in spec.split(":"))
+        if start <= 0 or step <= 0 or stop < start:
+            raise ValueError(f"无效的阶梯定义: {spec}")
+        return list(range(start, stop + 1, step))
+    stages = [int(x) for x in spec.split(",") if x.strip()]
+    if not stages or any(c <= 0 for c in stages) or stages != sorted(stages):
+        raise ValueError(f"阶梯并发数需为递增的正整数: {spec}")
+    return stages
+
+
+def ramp_test(tester: Any, prompt: str, stages: List[int], stage_duration: int, system_prompt: str = "",
+              temperature: float = 0.7, max_tokens: int = 4096, min_success_rate: float = 100.0,
+              max_p95: Optional[float] = None, min_efficiency: float = 0.5, stop_on_knee: bool = True,
+              stream: bool = False, show_progress: bool = True, progress_callback: Any = None,
+              workload: Any = None, steady_options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    阶梯增压测试
+
+    Args:
+        tester: OpenAITester 或 AsyncOpenAITester
+        prompt: 测试问题
+        stages: 递增的并发数阶梯
+        stage_duration: 每个阶梯的测试时长（秒）
+        min_success_rate: SLO，成功率下限（%）
+        max_p95: SLO，P95 耗时上限（秒），None 表示不限制
+        min_efficiency: 扩展效率下限。效率 = QPS 增长倍数 / 并发增长倍数，
+            低于该值视为 QPS 不再随并发线性增长（达到饱和）
+        stop_on_knee: 出现 SLO 失败或饱和后是否停止后续阶梯
+        steady_options: SteadyState 的参数，提供时每个阶梯各自预热 / 检测稳态，只统计稳态阶段（见 steady.py）
+        其余参数同 duration_test
+
+    Returns:
+        stages: 每个阶梯的汇总行（并发、QPS、P95、成功率、扩展效率、状态）
+        max_ok_concurrency: 满足 SLO 且仍在线性扩展的最大并发
+        knee_concurrency: 首次出现 SLO 失败或饱和的并发（未出现时为 None）
+        stop_reason: 提前停止原因
+    """
+    rows = []
+    max_ok = None
+    knee = None
+    stop_reason = None
+    prev = None
+
+    for concurrency in stages:
+        stats = tester.duration_test(
+            prompt=prompt,
+            duration=stage_duration,
+            concurrency=concurrency,
+            system_prompt=system_prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            show_progress=show_progress,
+            progress_callback=progress_callback,
+            stream=stream,
+            workload=workload,
+            steady=SteadyState(**steady_options) if steady_options is not None else None
+        )
+
+        # 扩展效率：相对上一阶梯，QPS 增长倍数 / 并发增长倍数
+        efficiency = None
+        if prev is not None and prev["qps"] > 0:
+            efficiency = round((stats["qps"] / prev["qps"]) / (concurrency / prev["concurrency"]), 2)
+
+        problems = []
+        if stats["success_rate"] < min_success_rate:
+            problems.append(f"成功率 {stats['success_rate']}% < {min_success_rate}%")
+        if max_p95 is not None and stats["p95_time"] > max_p95:
+            problems.append(f"P95 {stats['p95_time']}s > {max_p95}s")
+        if efficiency is not None and efficiency < min_efficiency:
+            problems.append(f"扩展效率 {efficiency} < {min_efficiency}")
+
+        row = {
+            "concurrency": concurrency,
+            "total": stats["total"],
+            "success_rate": stats["success_rate"],
+            "avg_time": stats["avg_time"],
+            "p95_time": stats["p95_time"],
+            "qps": stats["qps"],
+            "efficiency": efficiency,
+            "status": "OK" if not problems else "; ".join(problems),
+            "stats": stats
+        }
+        rows.append(row)
+        prev = row
+
+        if problems:
+            if knee is None:
+                knee = concurrency
+                stop_reason = f"并发 {concurrency}: " + "; ".join(problems)
+            if stop_on_knee:
+                break
+        elif knee is None:
+            max_ok = concurrency
+
+    return {
+        "stages": rows,
+        "stage_duration": stage_duration,
+        "max_ok_concurrency": max_ok,
+        "knee_concurrency": knee,
+        "stop_reason": stop_reason
+    }
+
+
+def format_ramp_table(result: Dict[str, Any]) -> str:
+    """把 ramp_test 的结果格式化为终端汇总表"""
+    lines = [f"{'并发':>6} {'请求数':>8} {'成功率%':>8} {'平均(s)':>8} {'P95(s)':>8} {'QPS':>8} {'扩展效率':>8}  状态"]
+    for row in result["stages"]:
+        efficiency = "-" if row["efficiency"] is None else row["efficiency"]
+        lines.append(f"{row['concurrency']:>6} {row['total']:>8} {row['success_rate']:>8} {row['avg_time']:>8} "
+                     f"{row['p95_time']:>8} {row['qps']:>8} {efficiency:>8}  {row['status']}")
+    return "\n".join(lines)
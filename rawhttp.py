@@ -0,0 +1,281 @@
+# coding=utf-8
+"""
+精简请求路径：直接用 httpx 发送预先编码的 JSON 请求体，逐块解析 SSE 字节流
+
+openai SDK 每个请求都要重新构建 messages、序列化参数、为每个响应块构造 pydantic 对象，
+高 QPS 下这部分 Python 开销占了客户端 CPU 的大头。精简路径：
+    - 同一组参数（prompt / system_prompt / temperature / max_tokens / stream）只编码一次请求体，之后直接复用字节串
+    - SSE 按字节增量切分，每个事件只做一次 json.loads，不构造 SDK 对象
+    - 回答文本以列表收集后一次拼接（避免 += 的平方级增长），也可以只计数不保留文本（keep_text=False）
+返回结构与 single_chat 相同（含 token 用量，见 usage.py），额外包含 output_bytes（响应体字节数）与 parse_time（JSON / SSE 解析耗时，其余为等待网络）。
+与 SDK 不同，精简路径不会自动重试 429/5xx，失败会如实计入统计。
+"""
+import json
+import time
+import httpx
+from typing import Dict, Any, List, Optional, Tuple, Callable
+from stats import stream_metrics
+from transport import retry_after
+from usage import usage_fields
+
+REQUEST_PATHS = ("sdk", "raw")
+
+
+class RequestEncoder:
+    """
+    请求体缓存：同一组参数只编码一次
+
+    Args:
+        model: 模型名
+        max_entries: 缓存条数上限，超过后清空重建（数据集负载时 prompt 很多，避免无限增长）
+        max_bytes: 缓存的请求体总字节数上限（长 prompt 且每个请求都不同时，按条数限制仍可能占用大量内存）
+        stream_usage: 流式请求是否携带 stream_options.include_usage，让服务端在最后一个事件中返回 token 用量
+    """
+
+    def __init__(self, model: str, max_entries: int = 4096, max_bytes: int = 64 * 1024 * 1024,
+                 stream_usage: bool = True):
+        self.model = model
+        self.stream_usage = stream_usage
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._cache: Dict[Tuple, bytes] = {}
+        self._bytes = 0
+
+    def body(self, prompt: str, system_prompt: str, temperature: float, max_tokens: int, stream: bool) -> bytes:
+        return self.cached((prompt, system_prompt, temperature, max_tokens, stream),
+                           lambda: self.messages_body([{"role": "system", "content": system_prompt},
+                                                       {"role": "user", "content": prompt}],
+                                                      temperature, max_tokens, stream))
+
+    def cached(self, key: Tuple, build: Callable[[], bytes]) -> bytes:
+        """按 key 取缓存的请求体，未命中时调用 build() 编码并缓存"""
+        body = self._cache.get(key)
+        if body is None:
+            if len(self._cache) >= self.max_entries or self._bytes >= self.max_bytes:
+                self._cache.clear()
+                self._bytes = 0
+            body = build()
+            self._cache[key] = body
+            self._bytes += len(body)
+        return body
+
+    def messages_body(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int,
+                      stream: bool) -> bytes:
+        """按完整的消息列表编码请求体（不缓存：多轮会话的历史每个请求都不同）"""
+        return json.dumps({
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": stream,
+            **self.stream_options(stream)
+        }, ensure_ascii=False).encode("utf-8")
+
+    def stream_options(self, stream: bool) -> Dict[str, Any]:
+        """流式请求附加的 stream_options（sdk 路径作为 create() 的参数）"""
+        return {"stream_options": {"include_usage": True}} if stream and self.stream_usage else {}
+
+
+class SSEParser:
+    """增量 SSE 解析器：feed() 接收任意切分的字节块，返回其中已完整的 data 负载（bytes）"""
+
+    def __init__(self):
+        self._buffer = b""
+        self._data: List[bytes] = []
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        events = []
+        lines = (self._buffer + chunk).split(b"\n")
+        self._buffer = lines.pop()  # 最后一段可能不完整，留到下一块
+        for line in lines:
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            if not line:
+                # 空行结束一个事件，多行 data 以换行拼接
+                if self._data:
+                    events.append(b"\n".join(self._data))
+                    self._data = []
+            elif line.startswith(b"data:"):
+                self._data.append(line[6:] if line[5:6] == b" " else line[5:])
+        return events
+
+
+class StreamAccumulator:
+    """累积流式响应：内容块到达时刻、回答与推理文本（可选）、token 用量（服务端未返回时按内容块计数）"""
+
+    def __init__(self, keep_text: bool = True):
+        self.keep_text = keep_text
+        self.content: List[str] = []
+        self.reasoning: List[str] = []
+        self.chunk_times: List[float] = []
+        self.reasoning_chunks = 0
+        self.usage: Optional[Dict[str, Any]] = None
+        self.done = False
+
+    def add(self, payload: bytes) -> None:
+        if payload == b"[DONE]":
+            self.done = True
+            return
+        event = json.loads(payload)
+        if event.get("usage"):
+            self.usage = event["usage"]
+        choices = event.get("choices")
+        if not choices:
+            return
+        delta = choices[0].get("delta") or {}
+        content = delta.get("content")
+        if content:
+            if self.keep_text:
+                self.content.append(content)
+            self.chunk_times.append(time.time())
+        reasoning = delta.get("reasoning_content")
+        if reasoning:
+            if self.keep_text:
+                self.reasoning.append(reasoning)
+            self.chunk_times.append(time.time())
+            self.reasoning_chunks += 1
+
+    def add_chunk(self, chunk: Any) -> None:
+        """sdk 路径：处理一个 ChatCompletionChunk 对象（字段同 add 中的事件）"""
+        if chunk.usage:
+            self.usage = chunk.usage
+        if not chunk.choices:
+            return
+        delta = chunk.choices[0].delta
+        content = getattr(delta, "content", None)
+        if content:
+            if self.keep_text:
+                self.content.append(content)
+            self.chunk_times.append(time.time())
+        reasoning = getattr(delta, "reasoning_content", None)
+        if reasoning:
+            if self.keep_text:
+                self.reasoning.append(reasoning)
+            self.chunk_times.append(time.time())
+            self.reasoning_chunks += 1
+
+    def fields(self) -> Dict[str, Any]:
+        """附加到结果中的字段：token 用量（子类按端点扩展）"""
+        return usage_fields(self.usage, chunks=len(self.chunk_times), reasoning_chunks=self.reasoning_chunks)
+
+
+# 异常信息与 openai SDK（APITimeoutError / APIConnectionError / APIStatusError）保持一致，便于按类型归类与对比
+def _error(status: int, body: bytes) -> str:
+    return f"Error code: {status} - {body[:500].decode('utf-8', 'replace')}"
+
+
+def _message_result(data: bytes, start_time: float, keep_text: bool) -> Dict[str, Any]:
+    parse_start = time.perf_counter()
+    body = json.loads(data)
+    msg = body["choices"][0]["message"]
+    parse_time = time.perf_counter() - parse_start
+    content, reasoning = msg.get("content") or "", msg.get("reasoning_content") or ""
+    return {
+        "success": True,
+        "response": content if keep_text else "",
+        "reasoning": reasoning if keep_text else "",
+        "time": round(time.time() - start_time, 3),
+        "error": None,
+        "output_bytes": len(data),
+        "parse_time": parse_time,
+        **usage_fields(body.get("usage"), content, reasoning)
+    }
+
+
+def _stream_result(acc: StreamAccumulator, start_time: float, received: int, parse_time: float) -> Dict[str, Any]:
+    return {
+        "success": True,
+        "response": "".join(acc.content),
+        "reasoning": "".join(acc.reasoning),
+        "time": round(time.time() - start_time, 3),
+        "error": None,
+        "output_bytes": received,
+        "parse_time": parse_time,
+        **stream_metrics(start_time, acc.chunk_times),
+        **acc.fields()
+    }
+
+
+def _failure(error: str, start_time: float, headers: Any = None) -> Dict[str, Any]:
+    return {"success": False, "response": "", "reasoning": "", "time": round(time.time() - start_time, 3),
+            "error": error, "retry_after": retry_after(headers)}
+
+
+def raw_chat(client: Any, url: str, headers: Dict[str, str], body: bytes, stream: bool,
+             keep_text: bool = True, parse: Optional[Callable] = None, accumulator: Optional[type] = None
+             ) -> Dict[str, Any]:
+    """
+    用 httpx.Client 发送一次预编码的 chat/completions 请求，返回结构同 single_chat
+
+    parse(data, start_time, keep_text) 与 accumulator 替换非流式响应的解析与流式事件的累积，
+    用于 /completions、/embeddings 等其他端点（见 endpoints.py）
+    """
+    parse = parse or _message_result
+    accumulator = accumulator or StreamAccumulator
+    start_time = time.time()
+    try:
+        if not stream:
+            resp = client.post(url, content=body, headers=headers)
+            if resp.status_code >= 400:
+                return _failure(_error(resp.status_code, resp.content), start_time, resp.headers)
+            return parse(resp.content, start_time, keep_text)
+        with client.stream("POST", url, content=body, headers=headers) as resp:
+            if resp.status_code >= 400:
+                return _failure(_error(resp.status_code, resp.read()), start_time, resp.headers)
+            parser = SSEParser()
+            acc = accumulator(keep_text)
+            received = 0
+            parse_time = 0.0
+            for chunk in resp.iter_bytes():
+                received += len(chunk)
+                parse_start = time.perf_counter()
+                for payload in parser.feed(chunk):
+                    acc.add(payload)
+                parse_time += time.perf_counter() - parse_start
+            return _stream_result(acc, start_time, received, parse_time)
+    except httpx.TimeoutException:
+        return _failure("Request timed out.", start_time)
+    except httpx.TransportError:
+        return _failure("Connection error.", start_time)
+    except Exception as e:
+        return _failure(str(e) or type(e).__name__, start_time)
+
+
+async def araw_chat(client: Any, url: str, headers: Dict[str, str], body: bytes, stream: bool,
+                    keep_text: bool = True, parse: Optional[Callable] = None, accumulator: Optional[type] = None
+                    ) -> Dict[str, Any]:
+    """raw_chat 的协程版本（httpx.AsyncClient）"""
+    parse = parse or _message_result
+    accumulator = accumulator or StreamAccumulator
+    start_time = time.time()
+    try:
+        if not stream:
+            resp = await client.post(url, content=body, headers=headers)
+            if resp.status_code >= 400:
+                return _failure(_error(resp.status_code, resp.content), start_time, resp.headers)
+            return parse(resp.content, start_time, keep_text)
+        async with client.stream("POST", url, content=body, headers=headers) as resp:
+            if resp.status_code >= 400:
+                return _failure(_error(resp.status_code, await resp.aread()), start_time,
+                                resp.headers)
+            parser = SSEParser()
+            acc = accumulator(keep_text)
+            received = 0
+            parse_time = 0.0
+            async for chunk in resp.aiter_bytes():
+                received += len(chunk)
+                parse_start = time.perf_counter()
+                for payload in parser.feed(chunk):
+                    acc.add(payload)
+                parse_time += time.perf_counter() - parse_start
+            return _stream_result(acc, start_time, received, parse_time)
+    except httpx.TimeoutException:
+        return _failure("Request timed out.", start_time)
+    except httpx.TransportError:
+        return _failure("Connection error.", start_time)
+    except Exception as e:
+        return _failure(str(e) or type(e).__name__, start_time)
+
+
+def auth_headers(api_key: str) -> Dict[str, str]:
+    return {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
@@ -0,0 +1,148 @@
+# coding=utf-8
+"""
+两次运行之间的回归判断：用自助法（bootstrap）给出 P50 / P95 / TTFT P95 / QPS / 成功率相对变化的置信区间
+
+只比较两个点估计无法区分真实变化与抽样噪声（短测试的 P95 本身就有几个百分点的波动）。
+这里对两次运行各自重抽样 resamples 次，相对变化 (new - base) / base 的 [α/2, 1-α/2] 分位作为置信区间：
+    延迟分位   对保存的直方图做多项分布重抽样（等价于对原始样本有放回重抽样，精度受直方图 1% 的分桶限制），
+              一次生成 resamples × 桶数 的计数矩阵，累加后按秩取分位，全程向量化
+    QPS       每秒成功数的移动块自助法（块长约 n^(1/3) 秒），保留相邻秒之间的自相关
+    成功率     二项分布重抽样
+区间不含 0 判定为显著变化；显著变差且点估计的变化超过 threshold% 时判定为回归，可作为发布后的门禁。
+缺少直方图（如分布式测试）或样本太少时该指标只给出点估计，不参与判定。
+"""
+import math
+import numpy as np
+from typing import Dict, Any, List, Optional
+from stats import LatencyHistogram
+
+# (键, 名称, 数据来源, 百分位, 数值越大越好)
+METRICS = (
+    ("p50_time", "P50(s)", "latency", 50, False),
+    ("p95_time", "P95(s)", "latency", 95, False),
+    ("ttft_p95", "TTFT P95(s)", "ttft", 95, False),
+    ("qps", "QPS", "qps_series", None, True),
+    ("success_rate", "成功率%", None, None, True),
+)
+
+MIN_SAMPLES = 20
+MIN_SECONDS = 5
+
+
+def bootstrap_percentile(hist: LatencyHistogram, q: float, resamples: int, rng: np.random.Generator) -> np.ndarray:
+    """直方图第 q 百分位的自助分布（长度 resamples）"""
+    values, counts = hist.nonzero_buckets()
+    values = np.asarray(values)
+    counts = np.asarray(counts, dtype=float)
+    n = int(counts.sum())
+    draws = rng.multinomial(n, counts / n, size=resamples).cumsum(axis=1)
+    rank = max(1, math.ceil(n * q / 100))
+    return values[(draws >= rank).argmax(axis=1)]
+
+
+def bootstrap_mean(series: List[float], resamples: int, rng: np.random.Generator) -> np.ndarray:
+    """逐秒序列均值的移动块自助分布（长度 resamples）"""
+    x = np.asarray(series, dtype=float)
+    n = len(x)
+    block = max(1, round(n ** (1 / 3)))
+    blocks = math.ceil(n / block)
+    starts = rng.integers(0, n - block + 1, size=(resamples, blocks))
+    index = (starts[:, :, None] + np.arange(block)).reshape(resamples, -1)[:, :n]
+    return x[index].mean(axis=1)
+
+
+def bootstrap_rate(success: int, total: int, resamples: int, rng: np.random.Generator) -> np.ndarray:
+    """成功率（%）的自助分布"""
+    return rng.binomial(total, success / total, size=resamples) / total * 100
+
+
+def _distribution(run: Dict[str, Any], source: Optional[str], q: Optional[float], resamples: int,
+                  rng: np.random.Generator) -> Optional[np.ndarray]:
+    if source is None:
+        stats = run["stats"]
+        return bootstrap_rate(stats["success"], stats["total"], resamples, rng) if stats.get("total") else None
+    if source == "qps_series":
+        series = run["qps_series"]
+        return bootstrap_mean(series, resamples, rng) if len(series) >= MIN_SECONDS else None
+    hist = run[source]
+    if hist is None or hist.count < MIN_SAMPLES:
+        return None
+    return bootstrap_percentile(hist, q, resamples, rng)
+
+
+def _point(run: Dict[str, Any], source: Optional[str], q: Optional[float]) -> float:
+    """与自助分布同一口径的点估计（QPS 为去掉首尾窗口后每秒成功数的均值，与 stats 中按总时长计算的略有差别）"""
+    if source is None:
+        return run["stats"]["success"] / run["stats"]["total"] * 100
+    if source == "qps_series":
+        return sum(run["qps_series"]) / len(run["qps_series"])
+    return run[source].percentile(q)
+
+
+def compare_runs(base: Dict[str, Any], new: Dict[str, Any], resamples: int = 2000, confidence: float = 0.95,
+                 threshold: float = 5.0, seed: Optional[int] = 0) -> Dict[str, Any]:
+    """
+    对比两次运行
+
+    Args:
+        base / new: RunStore.get() 返回的运行
+        resamples: 自助法重抽样次数
+        confidence: 置信水平
+        threshold: 判定为回归的最小变化（%），避免把统计上显著但幅度很小的变化当作回归
+        seed: 随机种子，固定后同样的两次运行结论可复现
+
+    Returns:
+        rows: 每个指标一行（metric、label、base、new（stats 中的值）、change（与自助分布同口径的点估计变化 %）、low / high（置信区间 %）、
+              significant、status：regression / improved / unchanged / no_data）
+        regressions: 回归的指标名称列表，passed: 是否没有回归，以及 base_id / new_id / confidence / threshold
+    """
+    if not 0 < confidence < 1:
+        raise ValueError(f"置信水平需在 (0, 1) 之间: {confidence}")
+    rng = np.random.default_rng(seed)
+    alpha = 1 - confidence
+    rows = []
+    for key, label, source, q, higher_better in METRICS:
+        a, b = base["stats"].get(key), new["stats"].get(key)
+        if a is None and b is None:
+            continue
+        row = {"metric": key, "label": label, "base": a, "new": b, "change": None, "low": None, "high": None,
+               "significant": None, "status": "no_data"}
+        if a is not None and b is not None and a:
+            row["change"] = round((b - a) / a * 100, 2)
+        da = _distribution(base, source, q, resamples, rng)
+        db = _distribution(new, source, q, resamples, rng)
+        valid = da > 0 if da is not None else None
+        if db is not None and row["change"] is not None and valid is not None and valid.any():
+            pa, pb = _point(base, source, q), _point(new, source, q)
+            row["change"] = round((pb - pa) / pa * 100, 2) if pa else row["change"]
+            ratio = db[valid] / da[valid] - 1
+            low, high = np.quantile(ratio, [alpha / 2, 1 - alpha / 2]) * 100
+            row["low"], row["high"] = round(float(low), 2), round(float(high), 2)
+            row["significant"] = bool(low > 0 or high < 0)
+            worse = (row["change"] < 0) if higher_better else (row["change"] > 0)
+            if not row["significant"]:
+                row["status"] = "unchanged"
+            elif worse:
+                row["status"] = "regression" if abs(row["change"]) >= threshold else "unchanged"
+            else:
+                row["status"] = "improved"
+        rows.append(row)
+    regressions = [row["label"] for row in rows if row["status"] == "regression"]
+    return {"base_id": base["id"], "new_id": new["id"], "confidence": confidence, "threshold": threshold,
+            "resamples": resamples, "rows": rows, "regressions": regressions, "passed": not regressions}
+
+
+STATUS_TEXT = {"regression": "❌ 回归", "improved": "✅ 改善", "unchanged": "无显著变化", "no_data": "无分布数据"}
+
+
+def format_regression_table(result: Dict[str, Any]) -> str:
+    """回归对比表：每行一个指标，附带置信区间与结论"""
+    interval_label = f"{round(result['confidence'] * 100)}% 置信区间"
+    lines = [f"{'指标':<14} {'基线 #' + str(result['base_id']):>12} {'新 #' + str(result['new_id']):>12} "
+             f"{'变化%':>9} {interval_label:<24} 结论"]
+    for row in result["rows"]:
+        interval = "-" if row["low"] is None else f"[{row['low']:+}%, {row['high']:+}%]"
+        change = "-" if row["change"] is None else f"{row['change']:+}"
+        lines.append(f"{row['label']:<14} {str(row['base']):>12} {str(row['new']):>12} {change:>9} "
+                     f"{interval:<24} {STATUS_TEXT[row['status']]}")
+    return "\n".join(lines)
@@ -0,0 +1,233 @@
+# coding=utf-8
+"""
+结果库：把每次测试的元数据、汇总统计与延迟分布保存到本地 SQLite，供之后的回归对比（见 regression.py）
+
+命令行的测试结果只打印一次，Web 界面的结果随浏览器会话消失；保存到结果库后可以随时列出历史运行、
+给某次运行打上标签（如 baseline、prod-v1.2），并在服务端发布后用新一次运行与标签对比，作为回归门禁。
+
+表结构：
+    runs  每次测试一行：id、created（Unix 时间）、mode（测试方法名）、model、base_url、label（备注）、
+          params（测试参数 JSON）、stats（汇总统计 JSON，去掉逐秒时间序列）、
+          latency / ttft（延迟直方图 JSON，见 LatencyHistogram.to_dict，未提供 RunStats 时为空）、
+          qps_series（每秒成功数 JSON，去掉首尾不完整的窗口）
+    tags  标签 -> run_id；同名标签再次打在新的运行上时移动过去
+引用一次运行：数字 id、标签名、latest（最新一次）或 latest~N（最新一次之前的第 N 次）
+"""
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, Any, List, Optional
+from stats import RunStats, LatencyHistogram
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL NOT NULL,
+    mode TEXT NOT NULL,
+    model TEXT,
+    base_url TEXT,
+    label TEXT,
+    params TEXT NOT NULL,
+    stats TEXT NOT NULL,
+    latency TEXT,
+    ttft TEXT,
+    qps_series TEXT
+);
+CREATE TABLE IF NOT EXISTS tags (
+    name TEXT PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE
+);
+"""
+
+
+def qps_series(stats: Dict[str, Any], run: Optional[RunStats] = None) -> List[int]:
+    """每秒成功数：优先取 RunStats 的时间序列，否则取 stats["timeseries"]；首尾两个窗口通常不完整，予以去掉"""
+    series = run.timeline.columns()["success"] if run is not None else stats.get("timeseries", {}).get("success", [])
+    return list(series[1:-1]) if len(series) > 2 else list(series)
+
+
+def json_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """只保留可直接序列化的测试参数（去掉 workload、steady 等对象）"""
+    return {k: v for k, v in params.items() if isinstance(v, (str, int, float, bool, type(None)))}
+
+
+def check_tag(name: str) -> None:
+    """标签不能与 id / latest 引用混淆"""
+    if not name or name.isdigit() or name.startswith("latest"):
+        raise ValueError(f"标签不能为空、纯数字或以 latest 开头: {name}")
+
+
+class RunStore:
+    """
+    基于 SQLite 的结果库（线程安全，Web 界面的测试线程与主线程可共用同一实例）
+
+    Args:
+        path: 数据库文件路径，不存在时自动创建
+    """
+
+    def __init__(self, path: str = "runs.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def save(self, mode: str, stats: Dict[str, Any], run: Optional[RunStats] = None,
+             params: Optional[Dict[str, Any]] = None, model: Optional[str] = None, base_url: Optional[str] = None,
+             label: Optional[str] = None, tags: Optional[List[str]] = None) -> int:
+        """
+        保存一次测试
+
+        Args:
+            mode: 测试方法名，如 duration_test / rate_test
+            stats: 测试方法返回的统计字典
+            run: 该次测试的 RunStats（稳态模式下为 SteadyState.measured），提供时保存完整的延迟直方图，
+                回归对比才能给出 P50/P95 的置信区间
+            params: 测试参数，只保存可序列化的字段
+            tags: 保存后打上的标签
+
+        Returns:
+            新运行的 id
+        """
+        for name in tags or []:
+            check_tag(name)
+        summary = {k: v for k, v in stats.items() if k != "timeseries"}
+        latency = ttft = None
+        if run is not None:
+            latency = json.dumps(run.latency.to_dict())
+            ttft = json.dumps(run.ttft.to_dict()) if run.ttft.count else None
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO runs (created, mode, model, base_url, label, params, stats, latency, ttft, qps_series) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), mode, model, base_url, label, json.dumps(json_params(params or {}), ensure_ascii=False),
+                 json.dumps(summary, ensure_ascii=False, default=str), latency, ttft,
+                 json.dumps(qps_series(stats, run))))
+            run_id = cursor.lastrowid
+            for name in tags or []:
+                self._conn.execute("INSERT OR REPLACE INTO tags (name, run_id) VALUES (?, ?)", (name, run_id))
+        return run_id
+
+    def resolve(self, ref: Any) -> int:
+        """把 id / 标签 / latest / latest~N 解析为运行 id，找不到时抛出 ValueError"""
+        ref = str(ref).strip()
+        with self._lock:
+            if ref.isdigit():
+                row = self._conn.execute("SELECT id FROM runs WHERE id = ?", (int(ref),)).fetchone()
+            elif ref == "latest" or ref.startswith("latest~"):
+                offset = ref.partition("~")[2]
+                if offset and not offset.isdigit():
+                    raise ValueError(f"无法解析的运行引用: {ref}")
+                row = self._conn.execute("SELECT id FROM runs ORDER BY id DESC LIMIT 1 OFFSET ?",
+                                         (int(offset or 0),)).fetchone()
+            else:
+                row = self._conn.execute("SELECT run_id AS id FROM tags WHERE name = ?", (ref,)).fetchone()
+        if row is None:
+            raise ValueError(f"结果库 {self.path} 中找不到运行: {ref}")
+        return row["id"]
+
+    def get(self, ref: Any) -> Dict[str, Any]:
+        """
+        读取一次运行
+
+        Returns:
+            id / created / mode / model / base_url / label / params / stats / tags，
+            latency / ttft 为 LatencyHistogram（未保存时为 None），qps_series 为每秒成功数列表
+        """
+        run_id = self.resolve(ref)
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+            tags = [r["name"] for r in self._conn.execute("SELECT name FROM tags WHERE run_id = ? ORDER BY name",
+                                                          (run_id,))]
+        return {
+            "id": row["id"],
+            "created": row["created"],
+            "mode": row["mode"],
+            "model": row["model"],
+            "base_url": row["base_url"],
+            "label": row["label"],
+            "params": json.loads(row["params"]),
+            "stats": json.loads(row["stats"]),
+            "latency": LatencyHistogram.from_dict(json.loads(row["latency"])) if row["latency"] else None,
+            "ttft": LatencyHistogram.from_dict(json.loads(row["ttft"])) if row["ttft"] else None,
+            "qps_series": json.loads(row["qps_series"] or "[]"),
+            "tags": tags,
+        }
+
+    def tag(self, ref: Any, name: str) -> int:
+        """给运行打标签（同名标签从原来的运行上移走），返回运行 id"""
+        check_tag(name)
+        run_id = self.resolve(ref)
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO tags (name, run_id) VALUES (?, ?)", (name, run_id))
+        return run_id
+
+    def untag(self, name: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM tags WHERE name = ?", (name,))
+
+    def delete(self, ref: Any) -> None:
+        run_id = self.resolve(ref)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM runs WHERE id = ?", (run_id,))
+
+    def list(self, limit: int = 20, mode: Optional[str] = None, model: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        最近的运行（新的在前）
+
+        Returns:
+            每次运行一行：id、time、mode、model、label、tags，以及 total / success_rate / qps / p50_time / p95_time
+        """
+        query = "SELECT id, created, mode, model, base_url, label, stats FROM runs"
+        conditions, args = [], []
+        if mode:
+            conditions.append("mode = ?")
+            args.append(mode)
+        if model:
+            conditions.append("model = ?")
+            args.append(model)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY id DESC LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+            tags: Dict[int, List[str]] = {}
+            for r in self._conn.execute("SELECT name, run_id FROM tags ORDER BY name"):
+                tags.setdefault(r["run_id"], []).append(r["name"])
+        result = []
+        for row in rows:
+            stats = json.loads(row["stats"])
+            result.append({
+                "id": row["id"],
+                "time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["created"])),
+                "mode": row["mode"],
+                "model": row["model"],
+                "label": row["label"] or "",
+                "tags": ",".join(tags.get(row["id"], [])),
+                "total": stats.get("total"),
+                "success_rate": stats.get("success_rate"),
+                "qps": stats.get("qps"),
+                "p50_time": stats.get("p50_time"),
+                "p95_time": stats.get("p95_time"),
+            })
+        return result
+
+
+def format_runs_table(rows: List[Dict[str, Any]]) -> str:
+    """list() 的终端表格"""
+    if not rows:
+        return "（结果库中还没有运行）"
+    lines = [f"{'id':>5}  {'时间':<19} {'模式':<15} {'模型':<20} {'请求数':>7} {'成功率%':>8} {'QPS':>8} "
+             f"{'P50(s)':>7} {'P95(s)':>7}  标签 / 备注"]
+    for row in rows:
+        note = " / ".join(x for x in (row["tags"], row["label"]) if x)
+        lines.append(f"{row['id']:>5}  {row['time']:<19} {row['mode']:<15} {str(row['model'])[:20]:<20} "
+                     f"{row['total']:>7} {row['success_rate']:>8} {row['qps']:>8} {row['p50_time']:>7} "
+                     f"{row['p95_time']:>7}  {note}")
+    return "\n".join(lines)
@@ -0,0 +1,179 @@
+# coding=utf-8
+"""
+多轮会话负载：每个虚拟用户维持一段 N 轮对话，逐轮追加之前的回答，测量前缀缓存 / KV cache 复用的收益
+
+single_chat 默认只发送 [system, user] 两条消息，无法反映线上“对话历史越来越长”的流量。会话模式下：
+    - 每个虚拟用户（并发数）开启一段会话，第 k 轮的请求包含系统提示词与前 k-1 轮的问答，再追加新的用户消息
+    - 轮与轮之间等待思考时间（think_time，在 0.5~1.5 倍之间均匀抖动，避免所有用户同步发送）
+    - 某一轮失败或测试结束时该会话终止，虚拟用户随即开启新会话
+    - 统计按轮次拆分：每轮的耗时、TTFT 分布与平均 prompt 长度
+
+前缀模式（prefix_mode）决定请求之间可复用的前缀：
+    shared    所有会话共享同一个系统提示词，跨会话与会话内的历史都可命中前缀缓存
+    unique    每个会话的系统提示词以唯一前缀开头，只能复用本会话之前轮次的历史
+    nocache   每个请求都以唯一前缀开头，任何前缀都无法复用（无缓存的基线）
+对比多个模式（compare_prefix_modes）即可量化缓存收益：同一轮次下 TTFT 的差异随历史变长而扩大。
+系统提示词与用户消息可用合成文本指定 token 数（见 sweep.SyntheticPrompts），系统提示词越长缓存收益越明显。
+"""
+import random
+import threading
+from typing import Dict, Any, List, Optional
+from stats import RunStats
+from sweep import SyntheticPrompts
+
+PREFIX_MODES = ("shared", "unique", "nocache")
+
+
+class SessionScript:
+    """
+    会话脚本：轮数、思考时间、前缀模式，以及系统提示词 / 用户消息的生成方式
+
+    Args:
+        turns: 每段会话的轮数
+        think_time: 轮与轮之间的平均思考时间（秒）
+        prefix_mode: shared / unique / nocache，见模块说明
+        system_tokens: 合成系统提示词的 token 数，0 表示只使用测试参数中的 system_prompt
+        user_tokens: 合成用户消息的 token 数（每条内容不同），0 表示使用测试的 prompt（或数据集中的 prompt）
+        prompts: 合成文本生成器，默认按单词近似 token 数
+        seed: 思考时间抖动的随机种子
+    """
+
+    def __init__(self, turns: int = 4, think_time: float = 0.0, prefix_mode: str = "shared",
+                 system_tokens: int = 0, user_tokens: int = 0, prompts: Optional[SyntheticPrompts] = None,
+                 seed: Optional[int] = None):
+        if prefix_mode not in PREFIX_MODES:
+            raise ValueError(f"不支持的前缀模式: {prefix_mode}")
+        if turns < 1:
+            raise ValueError(f"会话轮数需大于 0: {turns}")
+        self.turns = turns
+        self.think_time = think_time
+        self.prefix_mode = prefix_mode
+        self.system_tokens = system_tokens
+        self.user_tokens = user_tokens
+        self.prompts = prompts or SyntheticPrompts()
+        self._rng = random.Random(seed)
+
+    def with_mode(self, prefix_mode: str) -> "SessionScript":
+        """相同配置、不同前缀模式的脚本（对比时使用，共享合成文本缓存）"""
+        return SessionScript(self.turns, self.think_time, prefix_mode, self.system_tokens, self.user_tokens,
+                             self.prompts)
+
+    def start(self, system_prompt: str) -> List[Dict[str, str]]:
+        """开启一段会话，返回只含系统提示词的消息列表"""
+        system = system_prompt
+        if self.system_tokens:
+            system = self.prompts.prompt(self.system_tokens, unique=False) + ("\n" + system_prompt if system_prompt else "")
+        if self.prefix_mode == "unique":
+            system = self.prompts.unique_prefix() + system
+        return [{"role": "system", "content": system}]
+
+    def user(self, prompt: str) -> Dict[str, str]:
+        content = self.prompts.prompt(self.user_tokens, unique=True) if self.user_tokens else prompt
+        return {"role": "user", "content": content}
+
+    def request(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """本轮实际发送的消息：nocache 模式下在最前面加上唯一前缀，其余模式原样发送"""
+        if self.prefix_mode != "nocache":
+            return messages
+        return [{"role": "system", "content": self.prompts.unique_prefix() + messages[0]["content"]}] + messages[1:]
+
+    def think(self) -> float:
+        return self.think_time * self._rng.uniform(0.5, 1.5) if self.think_time > 0 else 0.0
+
+
+class SessionStats:
+    """按轮次拆分的统计（线程安全）：每轮一个 RunStats，另记平均 prompt 长度与会话完成/中断数"""
+
+    def __init__(self, turns: int):
+        self.turns = [RunStats() for _ in range(turns)]
+        self._lock = threading.Lock()
+        self._prompt_chars = [0] * turns
+        self.completed = 0
+        self.aborted = 0
+
+    def record(self, turn: int, result: Dict[str, Any], messages: List[Dict[str, str]]) -> None:
+        chars = sum(len(m["content"]) for m in messages)
+        self.turns[turn].record(result)
+        with self._lock:
+            self._prompt_chars[turn] += chars
+
+    def end(self, completed: bool) -> None:
+        with self._lock:
+            if completed:
+                self.completed += 1
+            else:
+                self.aborted += 1
+
+    def report(self, script: SessionScript) -> Dict[str, Any]:
+        """
+        Returns:
+            turns: 每轮一行（turn 从 1 开始、requests、success_rate、avg/p50/p95 耗时、ttft_p50/p95、prompt_chars 平均长度）
+            completed_sessions / aborted_sessions、prefix_mode、think_time
+        """
+        rows = []
+        for i, run in enumerate(self.turns):
+            if not run.total:
+                continue
+            stats = run.summary(1.0)
+            rows.append({
+                "turn": i + 1,
+                "requests": stats["total"],
+                "success_rate": stats["success_rate"],
+                "avg_time": stats["avg_time"],
+                "p50_time": stats["p50_time"],
+                "p95_time": stats["p95_time"],
+                "ttft_p50": stats.get("ttft_p50"),
+                "ttft_p95": stats.get("ttft_p95"),
+                "prompt_chars": round(self._prompt_chars[i] / stats["total"])
+            })
+        return {"prefix_mode": script.prefix_mode, "turns": rows, "think_time": script.think_time,
+                "completed_sessions": self.completed, "aborted_sessions": self.aborted}
+
+
+def compare_prefix_modes(results: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    对比不同前缀模式下每轮的 TTFT P50（无流式数据时用耗时 P50）
+
+    Args:
+        results: 前缀模式 -> session_test 返回的统计字典
+
+    Returns:
+        每轮一行：各模式的 P50，以及 shared 相对基线（有 nocache 时取 nocache，否则取 unique）的降低比例 saving（%）
+    """
+    metric = "ttft_p50" if all(row["ttft_p50"] is not None for stats in results.values()
+                               for row in stats["sessions"]["turns"]) else "p50_time"
+    baseline = "nocache" if "nocache" in results else "unique"
+    by_turn: Dict[int, Dict[str, Any]] = {}
+    for mode, stats in results.items():
+        for row in stats["sessions"]["turns"]:
+            by_turn.setdefault(row["turn"], {"turn": row["turn"], "metric": metric})[mode] = row[metric]
+    rows = []
+    for turn in sorted(by_turn):
+        row = by_turn[turn]
+        if row.get("shared") is not None and row.get(baseline):
+            row["saving"] = round((row[baseline] - row["shared"]) / row[baseline] * 100, 1)
+        rows.append(row)
+    return rows
+
+
+def format_session_table(sessions: Dict[str, Any]) -> str:
+    """按轮次的统计表"""
+    lines = [f"{'轮次':>4} {'请求数':>7} {'成功率%':>8} {'平均(s)':>8} {'P50(s)':>8} {'P95(s)':>8} "
+             f"{'TTFT P50':>9} {'TTFT P95':>9} {'prompt字符':>10}"]
+    for row in sessions["turns"]:
+        ttft50 = "-" if row["ttft_p50"] is None else row["ttft_p50"]
+        ttft95 = "-" if row["ttft_p95"] is None else row["ttft_p95"]
+        lines.append(f"{row['turn']:>4} {row['requests']:>7} {row['success_rate']:>8} {row['avg_time']:>8} "
+                     f"{row['p50_time']:>8} {row['p95_time']:>8} {ttft50:>9} {ttft95:>9} {row['prompt_chars']:>10}")
+    return "\n".join(lines)
+
+
+def format_compare_table(rows: List[Dict[str, Any]], modes: List[str]) -> str:
+    """前缀模式对比表"""
+    if not rows:
+        return "（没有完成的轮次）"
+    lines = [f"{'轮次':>4} " + " ".join(f"{m:>10}" for m in modes) + f" {'缓存收益%':>9}"]
+    for row in rows:
+        values = " ".join(f"{'-' if row.get(m) is None else row[m]:>10}" for m in modes)
+        lines.append(f"{row['turn']:>4} {values} {row.get('saving', '-'):>9}")
+    return f"（{rows[0]['metric']}，缓存收益 = shared 相对无缓存基线的降低比例）\n" + "\n".join(lines)
@@ -0,0 +1,287 @@
+# coding=utf-8
+"""
+长稳测试（soak）：逐请求记录追加写入磁盘，可续跑、可离线重新分析
+
+统计本身由 RunStats 增量计算（直方图 + 逐秒时间序列），内存不随测试时长增长；
+这里额外把每个请求的精简记录追加写入 JSONL 日志（路径以 .gz 结尾时 gzip 压缩），
+进程意外退出时已写入的记录不会丢失，之后可以 --resume 续跑剩余时长，或 --analyze 离线重建全部统计。
+
+日志每行一个 JSON 对象：
+    {"type": "header", ...}    首行：测试模式、参数与连接配置（不含 api_key）
+    {"type": "session", ...}   每次启动（含续跑）一行
+    {"type": "end", ...}       测试正常结束
+    请求记录（无 type 字段）：
+        ts 完成时刻 / t 耗时 / ok 是否成功 / err 失败类型 / msg 失败信息（截断）/ out 输出 token 数 /
+        ttft、itl、tps 流式指标 / lag、it 开环模式的发送滞后与计划时刻起算耗时 /
+        nc、pw、ct、tls 新建连接数、池等待、TCP 建连、TLS 握手 / resp、reason 截断后的回答与推理文本（可选）
+"""
+import os
+import gzip
+import json
+import math
+import time
+import heapq
+import zlib
+import threading
+from typing import Dict, Any, Iterator, Optional, Tuple
+from stats import RunStats, classify_error
+from multiproc import build_stats
+
+SOAK_MODES = ("duration_test", "rate_test")
+
+# single_chat 结果字段 -> 日志中的短字段名
+_FIELDS = (("ttft", "ttft"), ("tokens_per_sec", "tps"), ("output_tokens", "out"), ("send_lag", "lag"),
+           ("intended_time", "it"), ("new_connections", "nc"), ("pool_wait", "pw"), ("connect_time", "ct"),
+           ("tls_time", "tls"), ("items", "n"), ("input_tokens", "in"), ("reasoning_tokens", "rsn"),
+           ("usage_reported", "ur"))
+# 与测试规模相关、续跑时必须一致的参数
+_RESUME_KEYS = ("duration", "concurrency", "rps", "arrival", "stream")
+
+
+def _open(path: str, mode: str):
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+
+def _dumps(entry: Dict[str, Any]) -> bytes:
+    return (json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class RecordLog:
+    """
+    逐请求记录的追加写入器（线程安全），作为 RunStats.log 使用
+
+    Args:
+        path: 日志路径，以 .gz 结尾时 gzip 压缩
+        text_chars: 每条记录保留的回答/推理文本字符数，0 表示不保留
+        flush_interval: 刷盘间隔（秒），进程被杀时最多丢失这段时间内的记录
+    """
+
+    def __init__(self, path: str, text_chars: int = 0, flush_interval: float = 1.0):
+        self.path = path
+        self.text_chars = text_chars
+        self.flush_interval = flush_interval
+        self.records = 0
+        self._lock = threading.Lock()
+        self._file = _open(path, "ab")
+        self._last_flush = time.time()
+
+    def write_meta(self, entry: Dict[str, Any]) -> None:
+        """写入 header / session / end 等元数据行并立即刷盘"""
+        with self._lock:
+            self._file.write(_dumps(entry))
+            self._file.flush()
+
+    def write(self, result: Dict[str, Any], now: float) -> None:
+        entry = {"ts": round(now, 4), "t": result["time"], "ok": 1 if result["success"] else 0}
+        if not result["success"]:
+            entry["err"] = classify_error(result.get("error"))
+            entry["msg"] = str(result.get("error"))[:200]
+        for key, short in _FIELDS:
+            if result.get(key) is not None:
+                entry[short] = round(result[key], 6) if isinstance(result[key], float) else result[key]
+        if result.get("itl"):
+            entry["itl"] = [round(gap, 5) for gap in result["itl"]]
+        if self.text_chars:
+            if result.get("response"):
+                entry["resp"] = result["response"][:self.text_chars]
+            if result.get("reasoning"):
+                entry["reason"] = result["reasoning"][:self.text_chars]
+        line = _dumps(entry)
+        with self._lock:
+            self._file.write(line)
+            self.records += 1
+            if now - self._last_flush >= self.flush_interval:
+                self._file.flush()
+                self._last_flush = now
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def iter_log(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    逐行读取日志（流式，不整体载入内存）
+
+    进程中断留下的不完整末行或被截断的 gzip 流会被跳过，并产出一条 {"type": "truncated"} 标记
+    """
+    with _open(path, "rb") as f:
+        try:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    yield {"type": "truncated"}
+                    return
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield {"type": "truncated"}
+        except (EOFError, zlib.error, gzip.BadGzipFile):
+            yield {"type": "truncated"}
+
+
+def _to_result(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """把日志记录还原为 RunStats.record() 所需的结果字典"""
+    result = {"success": bool(entry["ok"]), "time": entry["t"], "error": entry.get("msg"),
+              "response": entry.get("resp", ""), "reasoning": entry.get("reason", "")}
+    for key, short in _FIELDS:
+        result[key] = entry.get(short)
+    if result["ttft"] is not None:
+        result["itl"] = entry.get("itl", [])
+    return result
+
+
+def _drain(run: RunStats, pending: list, until: float) -> None:
+    while pending and pending[0][0] <= until:
+        when, _, entry = heapq.heappop(pending)
+        if entry is None:
+            run.begin(when)
+        else:
+            run.record(_to_result(entry), when)
+
+
+def replay(path: str) -> Tuple[Optional[Dict[str, Any]], RunStats, Dict[str, Any]]:
+    """
+    从日志重建 RunStats
+
+    日志按完成顺序写入，而时间序列还需要每个请求的开始时刻（完成时刻 - 耗时）。
+    开始/完成事件先放入按时间排序的小顶堆，只把早于“当前完成时刻 - 已见最大耗时”的事件交给 RunStats，
+    堆中只保留最近一段时间内的请求，回放的内存同样不随日志长度增长。
+
+    Returns:
+        (header, run, info)：info 包含 records、sessions、elapsed（各次运行的有效时长之和）、ended、truncated
+    """
+    run = RunStats()
+    header = None
+    sessions = []
+    info = {"records": 0, "ended": False, "truncated": False}
+    pending = []
+    horizon = 0.0
+    seq = 0
+    for entry in iter_log(path):
+        kind = entry.get("type")
+        if kind == "header":
+            header = entry
+        elif kind == "session":
+            sessions.append([entry["started"], entry["started"]])
+            info["ended"] = False
+        elif kind == "end":
+            if sessions:
+                sessions[-1][1] = max(sessions[-1][1], entry["ts"])
+            info["ended"] = True
+        elif kind == "truncated":
+            info["truncated"] = True
+        elif kind is None:
+            ts, latency = entry["ts"], entry["t"]
+            if not sessions:
+                sessions.append([ts - latency, ts])
+            sessions[-1][1] = max(sessions[-1][1], ts)
+            horizon = max(horizon, latency)
+            heapq.heappush(pending, (ts - latency, seq, None))
+            heapq.heappush(pending, (ts, seq + 1, entry))
+            seq += 2
+            info["records"] += 1
+            _drain(run, pending, ts - horizon)
+    _drain(run, pending, math.inf)
+    info["sessions"] = len(sessions)
+    info["elapsed"] = sum(end - start for start, end in sessions)
+    return header, run, info
+
+
+def _repair(path: str) -> None:
+    """去掉被截断的末尾（流式复制可读部分），之后才能在其后追加新的记录"""
+    tmp = path + ".repair" + (".gz" if path.endswith(".gz") else "")
+    with _open(tmp, "wb") as out:
+        for entry in iter_log(path):
+            if entry.get("type") != "truncated":
+                out.write(_dumps(entry))
+    os.replace(tmp, path)
+
+
+def _json_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    params = dict(params)
+    if params.get("workload") is not None:
+        params["workload"] = params["workload"].spec()
+    return params
+
+
+def analyze_log(path: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    离线分析日志：重建与测试方法返回值结构相同的统计字典
+
+    Returns:
+        (header, stats)：stats 额外包含 log、log_records、sessions、ended
+    """
+    header, run, info = replay(path)
+    if header is None:
+        raise ValueError(f"{path} 不是有效的压测记录日志（缺少 header）")
+    stats = build_stats(header["mode"], run, info["elapsed"], header["params"])
+    stats.update({"log": path, "log_records": info["records"], "sessions": info["sessions"],
+                  "ended": info["ended"]})
+    return header, stats
+
+
+def soak_test(tester: Any, mode: str, params: Dict[str, Any], log_path: str, resume: bool = False,
+              text_chars: int = 0, config: Optional[Dict[str, Any]] = None, show_progress: bool = True,
+              progress_callback: Any = None, run: Optional[RunStats] = None) -> Dict[str, Any]:
+    """
+    长稳测试：在固定时长 / 固定速率测试的同时把逐请求记录写入日志
+
+    Args:
+        tester: OpenAITester 或 AsyncOpenAITester
+        mode: "duration_test" 或 "rate_test"
+        params: 对应测试方法的参数，duration 为总时长（续跑时自动扣除已完成的部分）
+        log_path: 日志路径，以 .gz 结尾时 gzip 压缩
+        resume: 日志已存在时从中恢复统计并跑完剩余时长；为 False 且日志已存在时报错，避免覆盖
+        text_chars: 每条记录保留的回答/推理文本字符数，0 表示不保留
+        config: tester 配置，写入日志 header 便于事后查看（api_key 不写入）
+        show_progress: 是否显示进度条
+        progress_callback: 每秒一次的进度回调
+        run: 外部传入的 RunStats（如 /metrics 导出正在读取的实例），续跑时从日志恢复的统计合并到其中
+
+    Returns:
+        与对应测试方法结构相同的统计字典（覆盖全部运行），额外包含 log、log_records、resumed_from
+    """
+    if mode not in SOAK_MODES:
+        raise ValueError(f"长稳测试只支持 {', '.join(SOAK_MODES)}，不支持 {mode}")
+    run = run if run is not None else RunStats()
+    done = 0.0
+    records = 0
+    header = {"type": "header", "version": 1, "started": time.time(), "mode": mode,
+              "params": _json_params(params),
+              "config": {k: v for k, v in (config or {}).items() if k != "api_key"}}
+    exists = os.path.exists(log_path) and os.path.getsize(log_path) > 0
+    if exists:
+        if not resume:
+            raise ValueError(f"日志 {log_path} 已存在：续跑请加 --resume，或换一个文件名")
+        old, replayed, info = replay(log_path)
+        if old is None or old["mode"] != mode or \
+                any(old["params"].get(k) != header["params"].get(k) for k in _RESUME_KEYS):
+            raise ValueError(f"日志 {log_path} 的测试模式或参数与本次不一致，无法续跑")
+        run.merge(replayed)
+        if info["truncated"]:
+            _repair(log_path)
+            print("🩹 日志末尾不完整（进程中断），已截去未写完的部分")
+        done = info["elapsed"]
+        records = info["records"]
+        print(f"♻️ 从日志恢复: 已完成 {records} 个请求 / {done:.0f}s，剩余 {max(0.0, params['duration'] - done):.0f}s")
+
+    log = RecordLog(log_path, text_chars)
+    if not exists:
+        log.write_meta(header)
+    log.write_meta({"type": "session", "started": time.time()})
+    run.log = log
+    elapsed = 0.0
+    try:
+        remaining = params["duration"] - done
+        if remaining >= 1:
+            part = getattr(tester, mode)(**dict(params, duration=int(math.ceil(remaining))), run=run,
+                                         show_progress=show_progress, progress_callback=progress_callback)
+            elapsed = part["duration"]
+        log.write_meta({"type": "end", "ts": time.time()})
+    finally:
+        run.log = None
+        log.close()
+
+    stats = build_stats(mode, run, done + elapsed, params)
+    stats.update({"log": log_path, "log_records": records + log.records, "resumed_from": round(done, 3)})
+    return stats
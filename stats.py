@@ -0,0 +1,671 @@
+# coding=utf-8
+"""
+压测统计：对数分桶直方图 + 线程安全的运行计数器
+
+所有测试模式都把单次请求结果交给 RunStats.record()，不再保留完整的结果列表，
+因此无论测试持续多久，内存占用都是常数，任意百分位都可在 O(桶数) 内得到。
+逐秒时间序列（TimeSeries）以列式 array 保存，用于观察预热、吞吐崩塌与停顿。
+"""
+import re
+import csv
+import json
+import math
+import time
+import threading
+from array import array
+from typing import Dict, Any, List, Optional, Tuple
+
+
+def stream_metrics(start_time: float, chunk_times: List[float]) -> Dict[str, Any]:
+    """
+    根据流式响应中每个内容块（content 或 reasoning_content）的到达时间计算延迟指标
+
+    Returns:
+        ttft: 首个内容块耗时（秒）
+        itl: 相邻内容块的间隔列表（秒）
+        output_tokens: 内容块数量（OpenAI 协议下通常一块即一个 token）
+        tokens_per_sec: 解码速度，首块之后的 token 数 / 首块到末块的时长
+    """
+    if not chunk_times:
+        return {"ttft": None, "itl": [], "output_tokens": 0, "tokens_per_sec": None}
+    itl = [b - a for a, b in zip(chunk_times, chunk_times[1:])]
+    decode_time = chunk_times[-1] - chunk_times[0]
+    return {
+        "ttft": round(chunk_times[0] - start_time, 4),
+        "itl": itl,
+        "output_tokens": len(chunk_times),
+        "tokens_per_sec": round((len(chunk_times) - 1) / decode_time, 2) if decode_time > 0 else None
+    }
+
+
+class LatencyHistogram:
+    """
+    HDR 风格的对数分桶直方图
+
+    桶边界按固定比例 (1 + 2 * precision) 增长，落在同一桶内的值以几何中点代表，
+    相对误差不超过 precision。count / sum / min / max 精确记录。
+    本类不加锁，并发写入由 RunStats 负责加锁。
+    """
+
+    def __init__(self, lowest: float = 1e-4, highest: float = 3600.0, precision: float = 0.01):
+        self.lowest = lowest
+        self.highest = highest
+        self.precision = precision
+        self._log_base = math.log1p(2 * precision)
+        self._buckets = [0] * (int(math.log(highest / lowest) / self._log_base) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _index(self, value: float) -> int:
+        if value <= self.lowest:
+            return 0
+        return min(len(self._buckets) - 1, int(math.log(value / self.lowest) / self._log_base))
+
+    def record(self, value: float, count: int = 1) -> None:
+        self._buckets[self._index(value)] += count
+        self.count += count
+        self.sum += value * count
+        self.sumsq += value * value * count
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        """第 q 百分位（q 取 0~100），无数据时返回 0"""
+        if self.count == 0:
+            return 0
+        rank = max(1, math.ceil(self.count * q / 100))
+        seen = 0
+        for i, n in enumerate(self._buckets):
+            seen += n
+            if seen >= rank:
+                value = self.lowest * math.exp((i + 0.5) * self._log_base)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def percentile_interval(self, q: float, z: float) -> Tuple[float, float, float]:
+        """
+        第 q 百分位的分布无关置信区间：次序统计量的秩服从二项分布，按正态近似取 q ± z·sqrt(q(1-q)/n) 处的分位
+
+        Returns:
+            (估计值, 下限, 上限)，无数据时均为 0
+        """
+        p = q / 100
+        half = z * math.sqrt(p * (1 - p) / self.count) if self.count else 0
+        return (self.percentile(q), self.percentile(max(0.0, p - half) * 100),
+                self.percentile(min(1.0, p + half) * 100))
+
+    def nonzero_buckets(self) -> Tuple[List[float], List[int]]:
+        """非空桶的代表值（几何中点，限制在 min/max 之间）与计数，按值升序，用于对分布重抽样"""
+        values, counts = [], []
+        for i, n in enumerate(self._buckets):
+            if n:
+                value = self.lowest * math.exp((i + 0.5) * self._log_base)
+                values.append(min(max(value, self.min), self.max))
+                counts.append(n)
+        return values, counts
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0
+
+    def stddev(self) -> float:
+        if self.count < 2:
+            return 0
+        mean = self.mean()
+        return math.sqrt(max(0.0, self.sumsq / self.count - mean * mean))
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        """合并另一个同配置的直方图（用于多线程/多进程/多机汇总）"""
+        if (other.lowest, other.highest, other.precision) != (self.lowest, self.highest, self.precision):
+            raise ValueError("只能合并分桶配置相同的直方图")
+        for i, n in enumerate(other._buckets):
+            if n:
+                self._buckets[i] += n
+        self.count += other.count
+        self.sum += other.sum
+        self.sumsq += other.sumsq
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为 JSON 友好的字典，只保存非空桶"""
+        return {
+            "lowest": self.lowest,
+            "highest": self.highest,
+            "precision": self.precision,
+            "count": self.count,
+            "sum": self.sum,
+            "sumsq": self.sumsq,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "buckets": [[i, n] for i, n in enumerate(self._buckets) if n]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        hist = cls(data["lowest"], data["highest"], data["precision"])
+        for i, n in data["buckets"]:
+            hist._buckets[i] = n
+        hist.count = data["count"]
+        hist.sum = data["sum"]
+        hist.sumsq = data["sumsq"]
+        if hist.count:
+            hist.min = data["min"]
+            hist.max = data["max"]
+        return hist
+
+    def cumulative(self, bounds: List[float]) -> List[int]:
+        """不大于各上界（升序）的累计计数，用于导出 Prometheus 直方图；边界落在桶内时误差不超过 precision"""
+        limits = [self._index(bound) for bound in bounds]
+        counts = []
+        seen = 0
+        i = 0
+        for limit in limits:
+            while i <= limit:
+                seen += self._buckets[i]
+                i += 1
+            counts.append(seen)
+        return counts
+
+    def summary(self, prefix: str, ndigits: int = 4) -> Dict[str, Any]:
+        """生成 <prefix>_avg/_p50/_p95/_p99 四项分布统计"""
+        return {
+            f"{prefix}_avg": round(self.mean(), ndigits),
+            f"{prefix}_p50": round(self.percentile(50), ndigits),
+            f"{prefix}_p95": round(self.percentile(95), ndigits),
+            f"{prefix}_p99": round(self.percentile(99), ndigits),
+        }
+
+
+def classify_error(error: Any) -> str:
+    """把失败信息归类为 http_<状态码> / timeout / connection / other，用于按类型统计失败数"""
+    text = str(error)
+    match = re.search(r"Error code: (\d{3})", text)
+    if match:
+        return f"http_{match.group(1)}"
+    lowered = text.lower()
+    if "timed out" in lowered or "timeout" in lowered:
+        return "timeout"
+    if "connect" in lowered:
+        return "connection"
+    return "other"
+
+
+def merge_rows(rows: List[Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """合并多个进程/代理同一时间窗口的行：计数相加，百分位按成功数加权平均（近似值）"""
+    rows = [r for r in rows if r]
+    if not rows:
+        return None
+    latest = max(r["t"] for r in rows)
+    rows = [r for r in rows if r["t"] == latest]
+    merged = {"t": latest}
+    for key in set().union(*rows):
+        if key in TimeSeries.PERCENTILES or key == "t":
+            continue
+        merged[key] = sum(r.get(key, 0) for r in rows)
+    weight = sum(r["success"] for r in rows)
+    for key in TimeSeries.PERCENTILES:
+        merged[key] = round(sum(r[key] * r["success"] for r in rows) / weight, 4) if weight else 0
+    return merged
+
+
+class TimeSeries:
+    """
+    逐秒时间序列：每个窗口一行，按列存放在 array 中（每行约 100 字节，24 小时约 8MB）
+
+    列：t（窗口起始的 Unix 时间）、started、completed、success、failed、in_flight（窗口结束时的在途数）、
+    new_connections（窗口内完成的请求新建的连接数）、
+    p50/p95/p99（窗口内成功请求的耗时）、tokens_per_sec（窗口内完成的输出 token / 秒），
+    以及按失败类型拆分的 failed_<type>。
+    窗口以绝对时间对齐，多进程/多机的序列可以直接按 t 合并。本类不加锁，由 RunStats 负责加锁。
+    """
+
+    COUNTS = ("started", "completed", "success", "failed", "in_flight", "output_tokens", "new_connections")
+    PERCENTILES = ("p50", "p95", "p99")
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self.in_flight = 0
+        self._t = array("d")
+        self._counts = {name: array("q") for name in self.COUNTS}
+        self._percentiles = {name: array("d") for name in self.PERCENTILES}
+        self._failed_by_type: Dict[str, array] = {}
+        # 当前（未结束）窗口
+        self._key = None
+        self._current = dict.fromkeys(self.COUNTS, 0)
+        self._current_failed: Dict[str, int] = {}
+        self._latency = LatencyHistogram()
+
+    def __len__(self) -> int:
+        return len(self._t)
+
+    def advance(self, now: float) -> None:
+        """结束 now 之前的所有窗口（没有任何请求完成的空窗口也会补齐，停顿在序列中可见）"""
+        key = int(now // self.interval)
+        if self._key is None:
+            self._key = key
+        while self._key < key:
+            self._close()
+            self._key += 1
+
+    def _close(self) -> None:
+        self._current["in_flight"] = self.in_flight
+        self._t.append(self._key * self.interval)
+        for name in self.COUNTS:
+            self._counts[name].append(self._current[name])
+        for name, q in zip(self.PERCENTILES, (50, 95, 99)):
+            self._percentiles[name].append(round(self._latency.percentile(q), 4))
+        for kind in self._current_failed:
+            if kind not in self._failed_by_type:
+                self._failed_by_type[kind] = array("q", [0] * (len(self._t) - 1))
+        for kind, column in self._failed_by_type.items():
+            column.append(self._current_failed.get(kind, 0))
+        self._current = dict.fromkeys(self.COUNTS, 0)
+        self._current_failed = {}
+        if self._latency.count:
+            self._latency = LatencyHistogram()
+
+    def start(self, now: float) -> None:
+        self.advance(now)
+        self._current["started"] += 1
+        self.in_flight += 1
+
+    def abandon(self) -> None:
+        """已开始的请求被取消、不会再完成：只从在途数中扣除"""
+        self.in_flight = max(0, self.in_flight - 1)
+
+    def complete(self, now: float, result: Dict[str, Any]) -> Optional[str]:
+        """记录一次完成的请求，失败时返回失败类型"""
+        self.advance(now)
+        self._current["completed"] += 1
+        self._current["new_connections"] += result.get("new_connections") or 0
+        self.in_flight = max(0, self.in_flight - 1)
+        if result["success"]:
+            self._current["success"] += 1
+            self._latency.record(result["time"])
+            self._current["output_tokens"] += result.get("output_tokens") or 0
+        else:
+            self._current["failed"] += 1
+            kind = classify_error(result.get("error"))
+            self._current_failed[kind] = self._current_failed.get(kind, 0) + 1
+            return kind
+        return None
+
+    def _row(self, i: int) -> Dict[str, Any]:
+        row = {"t": self._t[i]}
+        row.update({name: self._counts[name][i] for name in self.COUNTS})
+        row.update({name: self._percentiles[name][i] for name in self.PERCENTILES})
+        row["tokens_per_sec"] = round(row["output_tokens"] / self.interval, 2)
+        row.update({f"failed_{kind}": column[i] for kind, column in self._failed_by_type.items()})
+        return row
+
+    def last_row(self) -> Optional[Dict[str, Any]]:
+        """最近一个已结束的窗口（供每秒进度刷新与实时图表）"""
+        return self._row(len(self._t) - 1) if len(self._t) else None
+
+    def columns(self) -> Dict[str, List[Any]]:
+        """按列导出全部已结束窗口，附带相对首个窗口的 elapsed 列"""
+        data = {"t": self._t.tolist(), "elapsed": [round(t - self._t[0], 3) for t in self._t]}
+        data.update({name: self._counts[name].tolist() for name in self.COUNTS})
+        data.update({name: self._percentiles[name].tolist() for name in self.PERCENTILES})
+        data["tokens_per_sec"] = [round(n / self.interval, 2) for n in self._counts["output_tokens"]]
+        data.update({f"failed_{kind}": column.tolist() for kind, column in self._failed_by_type.items()})
+        return data
+
+    def finish(self) -> None:
+        """测试结束时把当前窗口也计入序列（末尾窗口可能不足一个 interval）"""
+        if self._key is not None and (self._current["started"] or self._current["completed"]):
+            self._close()
+            self._key += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"interval": self.interval, "in_flight": self.in_flight, "columns": self.columns()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TimeSeries":
+        series = cls(data["interval"])
+        series.in_flight = data.get("in_flight", 0)
+        columns = data["columns"]
+        series._t = array("d", columns["t"])
+        for name in cls.COUNTS:
+            series._counts[name] = array("q", columns.get(name, [0] * len(columns["t"])))
+        for name in cls.PERCENTILES:
+            series._percentiles[name] = array("d", columns[name])
+        for name, values in columns.items():
+            if name.startswith("failed_"):
+                series._failed_by_type[name[len("failed_"):]] = array("q", values)
+        if len(series._t):
+            series._key = int(round(series._t[-1] / series.interval)) + 1
+        return series
+
+    def merge(self, other: "TimeSeries") -> None:
+        """按窗口起始时间合并另一条序列（计数相加，百分位按成功数加权，见 merge_rows）"""
+        rows = {}
+        for series in (self, other):
+            for i in range(len(series)):
+                row = series._row(i)
+                rows.setdefault(row["t"], []).append(row)
+        merged = [merge_rows(group) for _, group in sorted(rows.items())]
+        kinds = sorted({k for row in merged for k in row if k.startswith("failed_")})
+        self._t = array("d", [row["t"] for row in merged])
+        for name in self.COUNTS:
+            self._counts[name] = array("q", [row[name] for row in merged])
+        for name in self.PERCENTILES:
+            self._percentiles[name] = array("d", [row[name] for row in merged])
+        self._failed_by_type = {k[len("failed_"):]: array("q", [row.get(k, 0) for row in merged]) for k in kinds}
+        self.in_flight += other.in_flight
+        if len(self._t):
+            self._key = max(self._key or 0, int(round(self._t[-1] / self.interval)) + 1)
+
+
+def write_timeseries(columns: Dict[str, List[Any]], path: str) -> None:
+    """把 TimeSeries.columns() 写入 .json（按列）或 .csv（每秒一行）文件"""
+    if path.endswith(".json"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(columns, f)
+        return
+    names = list(columns)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        writer.writerows(zip(*(columns[name] for name in names)))
+
+
+class RunStats:
+    """
+    一次压测的运行统计：请求计数、延迟直方图、流式指标直方图、逐秒时间序列与前几条失败信息
+
+    begin() / record() 可被任意多个工作线程/协程同时调用；snapshot() 供进度条与回调每秒读取，
+    summary() 在测试结束时生成与历史版本兼容的统计字典。
+    """
+
+    _HISTOGRAMS = ("latency", "ttft", "itl", "tps", "send_lag", "intended", "pool_wait", "connect", "tls", "parse",
+                   "token_latency")
+
+    def __init__(self, max_failures: int = 5, log: Any = None):
+        self._lock = threading.Lock()
+        self.max_failures = max_failures
+        # 逐请求记录日志（soak.RecordLog），设置后每条结果在计入统计的同时追加写入磁盘
+        self.log = log
+        # 逐请求时间线采样器（tracing.SpanRecorder），设置后按采样率记录请求各阶段的时刻
+        self.tracer = None
+        # goodput 的延迟 SLO（秒）：设置后 summary() 统计耗时不超过该值的请求的吞吐，只影响 summary()
+        self.goodput_slo: Optional[float] = None
+        self.total = 0
+        self.success = 0
+        self.unsent = 0
+        self.new_connections = 0
+        self.output_tokens = 0
+        # 成功请求的 token 用量（服务端 usage，未返回时为本地计数，见 usage.py）与用量来自服务端的请求数
+        self.input_tokens = 0
+        self.reasoning_tokens = 0
+        self.usage_reported = 0
+        # 非聊天端点（endpoints.py）：成功请求包含的输入条数
+        self.items = 0
+        self.failed_by_type: Dict[str, int] = {}
+        self.failures: List[str] = []
+        self.latency = LatencyHistogram()
+        self.ttft = LatencyHistogram()
+        self.itl = LatencyHistogram(lowest=1e-6)
+        self.tps = LatencyHistogram(lowest=0.01, highest=1e7)
+        # 开环（固定速率）模式：实际发送相对计划时刻的滞后，以及从计划时刻算起的延迟
+        self.send_lag = LatencyHistogram(lowest=1e-6)
+        self.intended = LatencyHistogram()
+        # 连接层：等待空闲连接的时间、TCP 建连与 TLS 握手耗时（只统计实际新建的连接）
+        self.pool_wait = LatencyHistogram(lowest=1e-6)
+        self.connect = LatencyHistogram(lowest=1e-6)
+        self.tls = LatencyHistogram(lowest=1e-6)
+        # 精简请求路径：每个成功请求的 JSON / SSE 解析耗时（客户端 CPU，不属于服务端耗时）
+        self.parse = LatencyHistogram(lowest=1e-7)
+        # 以输出 token 数加权的耗时分布：任意延迟 SLO 下达标请求的输出 token 数可在 summary 时得到，且可跨进程合并
+        self.token_latency = LatencyHistogram()
+        self.timeline = TimeSeries()
+
+    def begin(self, now: Optional[float] = None) -> None:
+        """请求开始发送（用于时间序列中的 started / in_flight）；now 仅在离线回放日志时指定"""
+        with self._lock:
+            self.timeline.start(time.time() if now is None else now)
+
+    def abandon(self) -> None:
+        """begin() 之后请求被取消、不会再 record（async 引擎到点后取消未返回的请求），不计入成功或失败"""
+        with self._lock:
+            self.timeline.abandon()
+
+    def record(self, result: Dict[str, Any], now: Optional[float] = None) -> None:
+        """记录一次 single_chat 的返回结果；now 为完成时刻，仅在离线回放日志时指定"""
+        now = time.time() if now is None else now
+        if self.log is not None:
+            self.log.write(result, now)
+        if self.tracer is not None:
+            self.tracer.add(result, now)
+        with self._lock:
+            self.total += 1
+            kind = self.timeline.complete(now, result)
+            if result.get("send_lag") is not None:
+                self.send_lag.record(result["send_lag"])
+            if result.get("pool_wait") is not None:
+                self.pool_wait.record(result["pool_wait"])
+                self.new_connections += result["new_connections"]
+                if result["connect_time"] is not None:
+                    self.connect.record(result["connect_time"])
+                if result["tls_time"] is not None:
+                    self.tls.record(result["tls_time"])
+            if kind is not None:
+                self.failed_by_type[kind] = self.failed_by_type.get(kind, 0) + 1
+                if len(self.failures) < self.max_failures:
+                    self.failures.append(f"Req-{result['time']}s: {result['error']}")
+                return
+            self.success += 1
+            self.output_tokens += result.get("output_tokens") or 0
+            self.input_tokens += result.get("input_tokens") or 0
+            self.reasoning_tokens += result.get("reasoning_tokens") or 0
+            self.usage_reported += 1 if result.get("usage_reported") else 0
+            self.items += result.get("items") or 0
+            self.latency.record(result["time"])
+            if result.get("output_tokens"):
+                self.token_latency.record(result["time"], result["output_tokens"])
+            if result.get("intended_time") is not None:
+                self.intended.record(result["intended_time"])
+            if result.get("parse_time") is not None:
+                self.parse.record(result["parse_time"])
+            if result.get("ttft") is not None:
+                self.ttft.record(result["ttft"])
+                for gap in result["itl"]:
+                    self.itl.record(gap)
+                if result["tokens_per_sec"]:
+                    self.tps.record(result["tokens_per_sec"])
+
+    def record_unsent(self) -> None:
+        """开环模式：计划内但直到测试结束都没能发出的请求"""
+        with self._lock:
+            self.unsent += 1
+
+    def latency_interval(self, q: float, z: float) -> Tuple[int, float, float, float]:
+        """成功请求耗时第 q 百分位的置信区间（见 LatencyHistogram.percentile_interval），返回 (样本数, 估计值, 下限, 上限)"""
+        with self._lock:
+            return (self.latency.count,) + self.latency.percentile_interval(q, z)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前累计的请求数与成功数，以及最近一个已结束的时间窗口（O(1)，供每秒进度刷新）"""
+        with self._lock:
+            self.timeline.advance(time.time())
+            return {"requests": self.total, "success": self.success, "window": self.timeline.last_row()}
+
+    def export(self, buckets: Dict[str, List[float]]) -> Dict[str, Any]:
+        """
+        当前累计计数与直方图的一致快照，供 /metrics 抓取时读取（耗时 O(桶数)，与请求数无关）
+
+        Args:
+            buckets: 直方图名（如 latency、ttft）-> 升序的上界列表
+
+        Returns:
+            计数器（total/success/unsent/new_connections/output_tokens/input_tokens/reasoning_tokens/items/failed_by_type）、
+            in_flight，
+            以及 histograms：名称 -> (累计计数列表, count, sum)
+        """
+        with self._lock:
+            return {
+                "total": self.total,
+                "success": self.success,
+                "unsent": self.unsent,
+                "new_connections": self.new_connections,
+                "output_tokens": self.output_tokens,
+                "input_tokens": self.input_tokens,
+                "reasoning_tokens": self.reasoning_tokens,
+                "items": self.items,
+                "failed_by_type": dict(self.failed_by_type),
+                "in_flight": self.timeline.in_flight,
+                "histograms": {name: (getattr(self, name).cumulative(bounds), getattr(self, name).count,
+                                      getattr(self, name).sum) for name, bounds in buckets.items()}
+            }
+
+    def merge(self, other: "RunStats") -> None:
+        with self._lock:
+            self.total += other.total
+            self.success += other.success
+            self.unsent += other.unsent
+            self.new_connections += other.new_connections
+            self.output_tokens += other.output_tokens
+            self.input_tokens += other.input_tokens
+            self.reasoning_tokens += other.reasoning_tokens
+            self.usage_reported += other.usage_reported
+            self.items += other.items
+            for kind, n in other.failed_by_type.items():
+                self.failed_by_type[kind] = self.failed_by_type.get(kind, 0) + n
+            self.failures = (self.failures + other.failures)[:self.max_failures]
+            for name in self._HISTOGRAMS:
+                getattr(self, name).merge(getattr(other, name))
+            self.timeline.merge(other.timeline)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化（在测试结束后调用，当前时间窗口会被计入时间序列）"""
+        with self._lock:
+            self.timeline.finish()
+            return {
+                "total": self.total,
+                "success": self.success,
+                "unsent": self.unsent,
+                "new_connections": self.new_connections,
+                "output_tokens": self.output_tokens,
+                "input_tokens": self.input_tokens,
+                "reasoning_tokens": self.reasoning_tokens,
+                "usage_reported": self.usage_reported,
+                "items": self.items,
+                "failed_by_type": dict(self.failed_by_type),
+                "failures": list(self.failures),
+                **{name: getattr(self, name).to_dict() for name in self._HISTOGRAMS},
+                "timeline": self.timeline.to_dict()
+            }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RunStats":
+        run = cls()
+        run.total = data["total"]
+        run.success = data["success"]
+        run.unsent = data.get("unsent", 0)
+        run.new_connections = data.get("new_connections", 0)
+        run.output_tokens = data.get("output_tokens", 0)
+        run.input_tokens = data.get("input_tokens", 0)
+        run.reasoning_tokens = data.get("reasoning_tokens", 0)
+        run.usage_reported = data.get("usage_reported", 0)
+        run.items = data.get("items", 0)
+        run.failed_by_type = dict(data.get("failed_by_type", {}))
+        run.failures = list(data["failures"])
+        for name in cls._HISTOGRAMS:
+            if name in data:
+                setattr(run, name, LatencyHistogram.from_dict(data[name]))
+        if data.get("timeline"):
+            run.timeline = TimeSeries.from_dict(data["timeline"])
+        return run
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        """
+        生成统计字典
+
+        Args:
+            elapsed: 计算 QPS 所用的时长（秒）
+
+        Returns:
+            total/success/failed/success_rate/avg_time/p95_time/qps/failures，
+            以及 p50/p90/p99/p99.9、min/max、标准差、timeseries（逐秒时间序列，按列存放）；
+            流式压测时附带 ttft/itl/tps 分布，固定速率模式附带 send_lag/intended_time 分布，
+            以及 new_connections 与 pool_wait/connect_time/tls_time 分布（连接池等待与建连耗时），
+            精简请求路径下附带 parse_time 分布与 parse_share（解析耗时占成功请求总耗时的百分比），
+            有 token 用量时附带 input/output/reasoning_tokens、input_tps / output_tps / total_tps（token/秒）
+            与 usage_reported_pct（用量来自服务端的成功请求占比，其余为本地计数），
+            设置 goodput_slo 时附带 goodput_slo、slo_attainment（耗时达标的请求占全部请求的百分比）、
+            goodput_rps（每秒达标请求数）与 goodput_tps（达标请求每秒的输出 token 数），
+            非聊天端点附带 items / items_per_sec / avg_batch
+        """
+        with self._lock:
+            self.timeline.finish()
+            lat = self.latency
+            stats = {
+                "total": self.total,
+                "success": self.success,
+                "failed": self.total - self.success,
+                "success_rate": round(self.success / self.total * 100, 2) if self.total else 0,
+                "avg_time": round(lat.mean(), 3),
+                "p95_time": round(lat.percentile(95), 3),
+                "qps": round(self.success / elapsed, 2) if elapsed > 0 else 0,
+                "failures": list(self.failures),
+                "p50_time": round(lat.percentile(50), 3),
+                "p90_time": round(lat.percentile(90), 3),
+                "p99_time": round(lat.percentile(99), 3),
+                "p999_time": round(lat.percentile(99.9), 3),
+                "min_time": round(lat.min, 3) if lat.count else 0,
+                "max_time": round(lat.max, 3) if lat.count else 0,
+                "std_time": round(lat.stddev(), 3),
+            }
+            # 流式压测：TTFT（首 token 耗时）、ITL（token 间隔）、解码速度
+            if self.ttft.count:
+                stats.update(self.ttft.summary("ttft"))
+                stats.update(self.itl.summary("itl"))
+                stats.update(self.tps.summary("tps", 2))
+            # 开环模式：发送滞后反映客户端/调度是否跟得上目标速率，intended_time 已修正协调遗漏
+            if self.send_lag.count:
+                stats.update(self.send_lag.summary("send_lag"))
+                stats["send_lag_max"] = round(self.send_lag.max, 4)
+                stats.update(self.intended.summary("intended_time", 3))
+            # 连接层：客户端排队等待连接与建连的时间，与服务端处理时间分开呈现
+            if self.pool_wait.count:
+                stats["new_connections"] = self.new_connections
+                stats.update(self.pool_wait.summary("pool_wait"))
+                stats["pool_wait_max"] = round(self.pool_wait.max, 4)
+                if self.connect.count:
+                    stats.update(self.connect.summary("connect_time"))
+                if self.tls.count:
+                    stats.update(self.tls.summary("tls_time"))
+            # 客户端解析开销：其余时间为等待网络与服务端
+            if self.parse.count:
+                stats.update(self.parse.summary("parse_time", 6))
+                stats["parse_share"] = round(self.parse.sum / lat.sum * 100, 2) if lat.sum else 0
+            # token 吞吐：输出长度差异很大时，请求/秒无法反映服务端的实际负载
+            if self.input_tokens or self.output_tokens:
+                stats["input_tokens"] = self.input_tokens
+                stats["output_tokens"] = self.output_tokens
+                stats["reasoning_tokens"] = self.reasoning_tokens
+                for key, n in (("input_tps", self.input_tokens), ("output_tps", self.output_tokens),
+                               ("total_tps", self.input_tokens + self.output_tokens)):
+                    stats[key] = round(n / elapsed, 2) if elapsed > 0 else 0
+                stats["usage_reported_pct"] = round(self.usage_reported / self.success * 100, 2) if self.success else 0
+            # goodput：只统计耗时不超过 SLO 的请求（按直方图分桶计数，边界处误差不超过 1%）
+            if self.goodput_slo is not None:
+                good = self.latency.cumulative([self.goodput_slo])[0]
+                good_tokens = self.token_latency.cumulative([self.goodput_slo])[0]
+                stats["goodput_slo"] = self.goodput_slo
+                stats["slo_attainment"] = round(good / self.total * 100, 2) if self.total else 0
+                stats["goodput_rps"] = round(good / elapsed, 2) if elapsed > 0 else 0
+                stats["goodput_tps"] = round(good_tokens / elapsed, 2) if elapsed > 0 else 0
+            # 批量请求：每秒处理的输入条数
+            if self.items:
+                stats["items"] = self.items
+                stats["items_per_sec"] = round(self.items / elapsed, 2) if elapsed > 0 else 0
+                stats["avg_batch"] = round(self.items / self.success, 2) if self.success else 0
+            stats["timeseries"] = self.timeline.columns()
+            return stats
+
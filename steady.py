@@ -0,0 +1,261 @@
+# coding=utf-8
+"""
+预热剔除、稳态检测与按置信区间提前结束（固定时长模式）
+
+默认情况下统计从 t=0 开始，冷启动的建连、服务端预热（编译、缓存填充、自动扩容）都会计入结果，
+并且每次测试都要跑满 duration。开启后测试分为三个阶段：
+    warmup     固定预热时长，期间的请求不计入统计
+    detecting  稳态检测：比较最近两个相邻窗口（各 window 秒）的吞吐（每秒完成数）与耗时 P50，
+               两者的相对变化都小于 tolerance 时判定进入稳态；超过 max_warmup 仍未稳定时直接开始统计并标记
+    measuring  统计阶段：只有在此之后开始发送的请求计入结果（跨越阶段边界的请求被剔除）
+统计阶段可按置信区间提前结束：
+    QPS        批均值法：每 batch 秒的成功数为一个批，按 t 分布计算批均值的置信区间（批内平均抵消相邻秒的自相关）
+    P95        分布无关的次序统计量区间（二项分布正态近似，见 LatencyHistogram.percentile_interval）
+两者的相对半宽（半宽 / 估计值）都小于 ci_target 且统计时长不少于 min_measure 时结束测试，duration 只作为上限。
+"""
+import math
+import time
+from statistics import NormalDist
+from typing import Dict, Any, List, Optional
+from stats import RunStats
+
+PHASES = ("warmup", "detecting", "measuring", "done")
+
+
+def t_quantile(p: float, df: int) -> float:
+    """t 分布的 p 分位（Cornish-Fisher 展开近似，df >= 3 时误差小于 1%）"""
+    z = NormalDist().inv_cdf(p)
+    return z + (z ** 3 + z) / (4 * df) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+
+
+class SteadyState:
+    """
+    预热 / 稳态检测 / 提前结束的状态机：工作线程调用 record()，进度循环每秒调用 update()
+
+    Args:
+        warmup: 固定预热时长（秒）
+        detect: 预热之后是否自动检测稳态
+        window: 稳态检测的窗口长度（秒），慢模型（每秒完成数很少）应适当加大
+        tolerance: 相邻窗口吞吐与耗时 P50 的相对变化上限
+        max_warmup: 预热 + 检测的最长时间（秒），None 表示测试时长的一半
+        ci_target: 提前结束的相对半宽目标（如 0.05 表示 ±5%），None 表示跑满 duration
+        confidence: 置信水平
+        min_measure: 提前结束前至少统计的时长（秒）
+        batch: QPS 批均值法的批长度（秒）
+    """
+
+    MIN_BATCHES = 5
+    MIN_SAMPLES = 50
+
+    def __init__(self, warmup: float = 0.0, detect: bool = False, window: int = 5, tolerance: float = 0.1,
+                 max_warmup: Optional[float] = None, ci_target: Optional[float] = None,
+                 confidence: float = 0.95, min_measure: float = 10.0, batch: int = 5):
+        if warmup < 0 or window < 1 or tolerance <= 0 or batch < 1:
+            raise ValueError("预热时长需不小于 0，窗口与批长度需大于 0，容差需大于 0")
+        if ci_target is not None and not 0 < ci_target < 1:
+            raise ValueError(f"置信区间目标需在 (0, 1) 之间: {ci_target}")
+        if not 0 < confidence < 1:
+            raise ValueError(f"置信水平需在 (0, 1) 之间: {confidence}")
+        self.warmup = warmup
+        self.detect = detect
+        self.window = window
+        self.tolerance = tolerance
+        self.max_warmup = max_warmup
+        self.ci_target = ci_target
+        self.confidence = confidence
+        self.min_measure = min_measure
+        self.batch = batch
+        self.measured = RunStats()
+        self.phase = "warmup"
+        self.start_time = None
+        self.measure_start = None
+        self.stopped_at = None
+        self.steady_detected = None
+        self.change = {}
+        self.ci = {}
+        self._rows: List[Dict[str, Any]] = []
+        self._batches: List[float] = []
+        self._batch_start = None
+        self._batch_success = 0
+
+    @property
+    def stopped(self) -> bool:
+        return self.stopped_at is not None
+
+    def resolve_max_warmup(self, duration: float) -> float:
+        """
+        预热 + 检测的最长时间，并检查稳态检测能否在此之前完成
+
+        比较两个相邻窗口需要预热结束后再积累 2 * window 秒的时间窗口（最近一秒的窗口要到下一秒才结束），
+        时间不够时检测永远不会成功，只会在 max_warmup 到达后标记为未稳定。
+
+        Raises:
+            ValueError: 开启稳态检测且 warmup + 2 * window + 1 超过最长预热时间
+        """
+        max_warmup = self.max_warmup if self.max_warmup is not None else max(self.warmup, duration / 2)
+        required = self.warmup + 2 * self.window + 1
+        if self.detect and required > max_warmup:
+            raise ValueError(f"稳态检测至少需要 预热 + 2 × 窗口 + 1 = {required:g} 秒，超过最长预热时间 {max_warmup:g} 秒"
+                             f"（默认为测试时长的一半）：请加大测试时长，或减小预热时长 / 稳态检测窗口")
+        return max_warmup
+
+    def start(self, start_time: float, duration: float) -> "SteadyState":
+        self.start_time = start_time
+        self.max_warmup = self.resolve_max_warmup(duration)
+        if self.warmup <= 0:
+            self._after_warmup(start_time)
+        return self
+
+    def _after_warmup(self, now: float) -> None:
+        if self.detect:
+            self.phase = "detecting"
+        else:
+            self._begin_measure(now)
+
+    def _begin_measure(self, now: float) -> None:
+        self.measure_start = now
+        self._batch_start = now
+        self.phase = "measuring"
+
+    def record(self, result: Dict[str, Any], now: Optional[float] = None) -> None:
+        """在 run.record(result) 之后调用：统计阶段开始之后发送的请求计入 measured"""
+        if self.measure_start is None:
+            return
+        now = time.time() if now is None else now
+        if now - result["time"] >= self.measure_start:
+            self.measured.record(result, now)
+
+    def update(self, window: Optional[Dict[str, Any]], now: Optional[float] = None) -> bool:
+        """
+        每秒调用一次，推进阶段并检查置信区间
+
+        Args:
+            window: RunStats.snapshot() 中最近一个已结束的时间窗口
+
+        Returns:
+            是否应提前结束测试
+        """
+        now = time.time() if now is None else now
+        if window and (not self._rows or window["t"] > self._rows[-1]["t"]):
+            self._rows.append(window)
+        if self.phase == "warmup" and now - self.start_time >= self.warmup:
+            self._after_warmup(now)
+        if self.phase == "detecting":
+            if self._stable():
+                self.steady_detected = True
+                self._begin_measure(now)
+            elif now - self.start_time >= self.max_warmup:
+                self.steady_detected = False
+                self._begin_measure(now)
+        if self.phase == "measuring":
+            if now - self._batch_start >= self.batch:
+                success = self.measured.success
+                self._batches.append((success - self._batch_success) / (now - self._batch_start))
+                self._batch_success = success
+                self._batch_start = now
+            if self.ci_target is not None and now - self.measure_start >= self.min_measure and self._converged():
+                self.phase = "done"
+                self.stopped_at = now
+                return True
+        return False
+
+    def _stable(self) -> bool:
+        """比较预热结束后最近两个相邻窗口的吞吐与耗时 P50"""
+        rows = [r for r in self._rows if r["t"] >= self.start_time + self.warmup]
+        if len(rows) < 2 * self.window:
+            return False
+        before, after = rows[-2 * self.window:-self.window], rows[-self.window:]
+        qps = [sum(r["completed"] for r in part) / self.window for part in (before, after)]
+        latency = []
+        for part in (before, after):
+            weighted = [(r["p50"], r["success"]) for r in part if r["success"]]
+            if not weighted:
+                return False
+            latency.append(sum(p * n for p, n in weighted) / sum(n for _, n in weighted))
+        self.change = {"qps": _relative_change(*qps), "p50": _relative_change(*latency)}
+        return all(c is not None and c < self.tolerance for c in self.change.values())
+
+    def _converged(self) -> bool:
+        """QPS 与 P95 的相对半宽是否都已小于 ci_target（同时更新 ci）"""
+        alpha = 1 - self.confidence
+        n, p95, low, high = self.measured.latency_interval(95, NormalDist().inv_cdf(1 - alpha / 2))
+        if n < self.MIN_SAMPLES or p95 <= 0:
+            return False
+        self.ci["p95"] = {"value": round(p95, 4), "low": round(low, 4), "high": round(high, 4),
+                          "relative": round((high - low) / 2 / p95, 4), "samples": n}
+        k = len(self._batches)
+        if k < self.MIN_BATCHES:
+            return False
+        mean = sum(self._batches) / k
+        if mean <= 0:
+            return False
+        sd = math.sqrt(sum((b - mean) ** 2 for b in self._batches) / (k - 1))
+        half = t_quantile(1 - alpha / 2, k - 1) * sd / math.sqrt(k)
+        self.ci["qps"] = {"value": round(mean, 3), "low": round(mean - half, 3), "high": round(mean + half, 3),
+                          "relative": round(half / mean, 4), "batches": k}
+        return self.ci_target is not None and self.ci["p95"]["relative"] < self.ci_target \
+            and self.ci["qps"]["relative"] < self.ci_target
+
+    def summary(self, run: RunStats, now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        测试结束时生成统计：只含统计阶段的请求（QPS 按统计时长计算），timeseries 为完整测试（含预热）
+
+        Returns:
+            RunStats.summary 的字段，额外包含 steady（阶段时刻、剔除的请求数、置信区间、是否提前结束）；
+            统计阶段从未开始（测试时长短于预热）时退回完整统计并在 steady.measured 中标记 False
+        """
+        now = time.time() if now is None else now
+        full = run.summary(now - self.start_time)
+        if self.measure_start is None or not self.measured.total:
+            stats = full
+            measured_duration = 0.0
+        else:
+            measured_duration = (self.stopped_at or now) - self.measure_start
+            self.measured.goodput_slo = run.goodput_slo
+            stats = self.measured.summary(measured_duration)
+            stats["timeseries"] = full["timeseries"]
+            if self.ci_target is None:
+                # 不提前结束时也给出统计阶段的置信区间，供判断测试时长是否足够
+                self._converged()
+        stats["steady"] = {
+            "measured": self.measure_start is not None and self.measured.total > 0,
+            "warmup": self.warmup,
+            "detect": self.detect,
+            "steady_detected": self.steady_detected,
+            "measure_start": round(self.measure_start - self.start_time, 2) if self.measure_start else None,
+            "measured_duration": round(measured_duration, 2),
+            "all_requests": full["total"],
+            "excluded_requests": full["total"] - (self.measured.total if self.measure_start else 0),
+            "change": self.change,
+            "ci_target": self.ci_target,
+            "confidence": self.confidence,
+            "ci": self.ci,
+            "stopped_early": self.stopped,
+        }
+        return stats
+
+
+def _relative_change(a: float, b: float) -> Optional[float]:
+    return abs(b - a) / max(a, b) if max(a, b) > 0 else None
+
+
+def describe(steady: Dict[str, Any]) -> List[str]:
+    """把 stats["steady"] 格式化为几行说明"""
+    if not steady["measured"]:
+        return ["⚠️ 测试在进入统计阶段前结束，以下为包含预热的完整统计"]
+    lines = []
+    start = f"统计从第 {steady['measure_start']}s 开始（预热 {steady['warmup']}s"
+    if steady["detect"]:
+        start += "，已检测到稳态" if steady["steady_detected"] else "，⚠️ 到达最长预热时间仍未稳定"
+    lines.append(start + f"），统计时长 {steady['measured_duration']}s，"
+                         f"剔除 {steady['excluded_requests']}/{steady['all_requests']} 个请求")
+    for key, label in (("qps", "QPS"), ("p95", "P95")):
+        ci = steady["ci"].get(key)
+        if ci:
+            lines.append(f"{label} {ci['value']}，{int(steady['confidence'] * 100)}% 置信区间 "
+                         f"[{ci['low']}, {ci['high']}]（相对半宽 {round(ci['relative'] * 100, 1)}%）")
+    if steady["stopped_early"]:
+        lines.append(f"置信区间已窄于 ±{round(steady['ci_target'] * 100, 1)}%，提前结束")
+    elif steady["ci_target"] is not None:
+        lines.append(f"到达测试时长时置信区间仍未窄于 ±{round(steady['ci_target'] * 100, 1)}%")
+    return lines
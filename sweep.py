@@ -0,0 +1,336 @@
+# coding=utf-8
+"""
+输入长度 × 输出长度扫描：用指定 token 数的合成 prompt 测量 TTFT、解码速度与 QPS 随长度的变化
+
+推理服务的延迟与吞吐主要取决于 prompt 长度（prefill）与输出长度（decode）。扫描模式按
+输入 token 数 × max_tokens × 并发数 的网格逐格运行固定时长测试（流式），输出矩阵：
+    TTFT P50        随输入长度线性以上增长、且 prefill 速度（输入 token / TTFT）不再提升时，prefill 成为瓶颈
+    解码速度 P50     单个请求首 token 之后的 token/s
+    QPS / 输出 token/s  整体吞吐
+
+合成 prompt：
+    - 指定 tokenizer 时 token 数精确：tiktoken 编码名（如 cl100k_base、o200k_base，需 pip install tiktoken）
+      或 HuggingFace 模型名/本地路径（需 pip install transformers）；只使用在该 tokenizer 中为单个 token 的常见单词
+    - 未指定时按“每个常见英文单词约 1 个 token”近似（主流 BPE tokenizer 下误差通常在几个百分点内）
+    - 每种长度的正文只生成一次并缓存，每个请求只在开头拼接几个单词组成的唯一前缀，
+      避免服务端前缀缓存（prefix caching）让重复的 prompt 跳过 prefill；unique=False 时所有请求使用同一 prompt
+实际计费的 prompt_tokens 还包含聊天模板的固定开销（通常十余个 token）。
+服务端可能在达到 max_tokens 之前结束回答，结果中的 output_tokens_avg 给出实际平均输出长度。
+
+批量 × 并发扫描（嵌入 / 文本补全端点，见 endpoints.py）：按 每请求输入条数 × 并发数 的网格逐格运行固定时长测试，
+给出 QPS、items/s、输入 token/s 与耗时。同一并发下 items/s 相对上一个批量的提升低于 min_gain 时，
+认为批量在上一个批量处饱和（继续增大批量只增加单个请求的耗时，不再提升吞吐）。
+"""
+import random
+import itertools
+import threading
+import importlib.util
+from typing import Dict, Any, List, Optional
+
+# 在主流 BPE / SentencePiece tokenizer 中带前导空格时均为单个 token 的常见单词
+_WORDS = (
+    "the of and to in is was for on that with as by at from his her they this have not are but had which one "
+    "were all their there been has when who will more out into other some time these two may then first any "
+    "like now only over such years after most also made many before must through back where much your way well "
+    "down should because each just those people how too little state good very make world still own see men work "
+    "long get here between both life being under never day same another know while last might great old year off "
+    "come since against go came right used take three place small found part general high number again"
+).split()
+
+
+def parse_sizes(spec: str) -> List[int]:
+    """解析逗号分隔的正整数列表，如 128,1024,4096"""
+    try:
+        sizes = [int(x) for x in spec.split(",") if x.strip()]
+    except ValueError:
+        raise ValueError(f"无法解析的列表: {spec}（应为逗号分隔的正整数）")
+    if not sizes or any(x <= 0 for x in sizes):
+        raise ValueError(f"列表中的值需为正整数: {spec}")
+    return sizes
+
+
+class SyntheticPrompts:
+    """
+    指定 token 数的合成 prompt 生成器（线程安全）
+
+    Args:
+        tokenizer: tiktoken 编码名或 HuggingFace 模型名/路径，None 表示按单词近似
+        unique: 每个请求拼接唯一前缀，避免命中服务端前缀缓存
+        seed: 正文单词序列的随机种子
+    """
+
+    # 唯一前缀使用的单词数：len(_WORDS) ** 4 个不同前缀
+    PREFIX_WORDS = 4
+
+    def __init__(self, tokenizer: Optional[str] = None, unique: bool = True, seed: int = 0):
+        self.tokenizer = tokenizer
+        self.unique = unique
+        self._encode = _load_tokenizer(tokenizer) if tokenizer else None
+        words = list(_WORDS)
+        if self._encode is not None:
+            words = [w for w in words if len(self._encode(" " + w)) == 1]
+            if len(words) < 16:
+                raise ValueError(f"tokenizer {tokenizer} 中可用的单 token 单词太少，无法生成精确长度的 prompt")
+        self._words = words
+        self._rng = random.Random(seed)
+        self._bodies: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+
+    @property
+    def exact(self) -> bool:
+        """token 数是否经 tokenizer 校验（否则为近似值）"""
+        return self._encode is not None
+
+    def count(self, text: str) -> Optional[int]:
+        """用 tokenizer 计算 token 数，未指定 tokenizer 时返回 None"""
+        return len(self._encode(text)) if self._encode is not None else None
+
+    def _body(self, tokens: int) -> str:
+        body = self._bodies.get(tokens)
+        if body is None:
+            with self._lock:
+                body = self._bodies.get(tokens)
+                if body is None:
+                    body = "".join(" " + self._rng.choice(self._words) for _ in range(tokens))
+                    if self._encode is not None and len(self._encode(body)) != tokens:
+                        raise ValueError(f"tokenizer {self.tokenizer} 下无法精确生成 {tokens} 个 token 的 prompt")
+                    self._bodies[tokens] = body
+        return body
+
+    def unique_prefix(self) -> str:
+        """PREFIX_WORDS 个 token 的唯一前缀：计数器按单词表进制展开，保证每次调用互不相同"""
+        n = next(self._counter)
+        words = []
+        for _ in range(self.PREFIX_WORDS):
+            n, i = divmod(n, len(self._words))
+            words.append(" " + self._words[i])
+        return "".join(words)
+
+    def prompt(self, tokens: int, unique: Optional[bool] = None) -> str:
+        """生成 tokens 个 token 的 prompt；正文按长度缓存，每次调用只拼接唯一前缀（unique 缺省时取构造参数）"""
+        if not (self.unique if unique is None else unique) or tokens <= self.PREFIX_WORDS:
+            return self._body(tokens)
+        return self.unique_prefix() + self._body(tokens - self.PREFIX_WORDS)
+
+
+def _load_tokenizer(name: str):
+    """返回 text -> token id 列表的函数：优先按 tiktoken 编码名加载，其次按 HuggingFace 模型加载"""
+    if importlib.util.find_spec("tiktoken") is not None:
+        import tiktoken
+        try:
+            encoding = tiktoken.get_encoding(name)
+            return lambda text: encoding.encode(text, disallowed_special=())
+        except ValueError:
+            pass
+    if importlib.util.find_spec("transformers") is not None:
+        from transformers import AutoTokenizer
+        tok = AutoTokenizer.from_pretrained(name)
+        return lambda text: tok.encode(text, add_special_tokens=False)
+    raise ValueError(f"无法加载 tokenizer {name}：tiktoken 编码名需 pip install tiktoken，"
+                     f"HuggingFace 模型需 pip install transformers")
+
+
+class SyntheticWorkload:
+    """固定输入长度与 max_tokens 的请求源，接口同 JsonlWorkload.next()，可直接作为测试方法的 workload"""
+
+    def __init__(self, prompts: SyntheticPrompts, input_tokens: int, max_tokens: int):
+        self.prompts = prompts
+        self.input_tokens = input_tokens
+        self.max_tokens = max_tokens
+
+    def next(self) -> Dict[str, Any]:
+        return {"prompt": self.prompts.prompt(self.input_tokens), "max_tokens": self.max_tokens}
+
+
+def sweep_test(tester: Any, input_sizes: List[int], output_sizes: List[int], concurrencies: List[int],
+               cell_duration: int, prompts: Optional[SyntheticPrompts] = None, system_prompt: str = "",
+               temperature: float = 0.7, show_progress: bool = True, progress_callback: Any = None) -> Dict[str, Any]:
+    """
+    输入长度 × 输出长度 × 并发数 扫描，每格运行一次流式固定时长测试
+
+    Args:
+        tester: OpenAITester 或 AsyncOpenAITester
+        input_sizes: 输入 token 数列表
+        output_sizes: max_tokens 列表
+        concurrencies: 并发数列表
+        cell_duration: 每格的测试时长（秒）
+        prompts: 合成 prompt 生成器，默认按单词近似且每个请求唯一前缀
+        system_prompt: 系统提示词（默认空，尽量减少输入长度之外的 token）
+        其余参数同 duration_test
+
+    Returns:
+        cells: 每格的汇总行（输入/输出长度、并发、QPS、TTFT、解码速度、prefill 速度等，stats 为完整统计）
+        exact_tokens: 输入 token 数是否经 tokenizer 校验
+    """
+    prompts = prompts or SyntheticPrompts()
+    rows = []
+    for input_tokens, max_tokens, concurrency in itertools.product(input_sizes, output_sizes, concurrencies):
+        print(f"\n📐 输入 {input_tokens} tokens / max_tokens {max_tokens} / 并发 {concurrency}")
+        stats = tester.duration_test(
+            prompt="",
+            duration=cell_duration,
+            concurrency=concurrency,
+            system_prompt=system_prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            show_progress=show_progress,
+            progress_callback=progress_callback,
+            stream=True,
+            workload=SyntheticWorkload(prompts, input_tokens, max_tokens)
+        )
+        # 服务端返回 usage 时为 completion_tokens，否则为内容块数
+        output_tokens = stats.get("output_tokens", 0)
+        ttft = stats.get("ttft_p50")
+        rows.append({
+            "input_tokens": input_tokens,
+            "max_tokens": max_tokens,
+            "concurrency": concurrency,
+            "total": stats["total"],
+            "success_rate": stats["success_rate"],
+            "qps": stats["qps"],
+            "p50_time": stats["p50_time"],
+            "ttft_p50": ttft,
+            "ttft_p95": stats.get("ttft_p95"),
+            "tps_p50": stats.get("tps_p50"),
+            "output_tokens_avg": round(output_tokens / stats["success"], 1) if stats["success"] else None,
+            "output_tps": round(output_tokens / stats["duration"], 2) if stats["duration"] else 0,
+            # 单个请求的 prefill 速度（输入 token / TTFT）与 TTFT 占总耗时的比例
+            "prefill_tps": round(input_tokens / ttft, 1) if ttft else None,
+            "ttft_share": round(ttft / stats["p50_time"] * 100, 1) if ttft and stats["p50_time"] else None,
+            "stats": stats
+        })
+    return {"cells": rows, "cell_duration": cell_duration, "exact_tokens": prompts.exact,
+            "tokenizer": prompts.tokenizer, "unique_prompts": prompts.unique}
+
+
+def format_sweep_table(result: Dict[str, Any]) -> str:
+    """把 sweep_test 的结果格式化为终端明细表"""
+    lines = [f"{'输入':>7} {'输出上限':>8} {'并发':>5} {'请求数':>7} {'成功率%':>8} {'QPS':>8} {'TTFT P50':>9} "
+             f"{'TTFT P95':>9} {'解码tok/s':>9} {'平均输出':>8} {'输出tok/s':>10} {'prefill tok/s':>13} {'TTFT占比%':>9}"]
+    for row in result["cells"]:
+        cells = [("-" if row[key] is None else row[key]) for key in
+                 ("ttft_p50", "ttft_p95", "tps_p50", "output_tokens_avg", "prefill_tps", "ttft_share")]
+        lines.append(f"{row['input_tokens']:>7} {row['max_tokens']:>8} {row['concurrency']:>5} {row['total']:>7} "
+                     f"{row['success_rate']:>8} {row['qps']:>8} {cells[0]:>9} {cells[1]:>9} {cells[2]:>9} "
+                     f"{cells[3]:>8} {row['output_tps']:>10} {cells[4]:>13} {cells[5]:>9}")
+    return "\n".join(lines)
+
+
+def format_sweep_matrix(result: Dict[str, Any], metric: str) -> str:
+    """某个指标的 输入长度（行）× 输出上限（列）矩阵，每个并发数一张"""
+    cells = result["cells"]
+    inputs = sorted({row["input_tokens"] for row in cells})
+    outputs = sorted({row["max_tokens"] for row in cells})
+    blocks = []
+    for concurrency in sorted({row["concurrency"] for row in cells}):
+        values = {(row["input_tokens"], row["max_tokens"]): row[metric] for row in cells
+                  if row["concurrency"] == concurrency}
+        lines = [f"  并发 {concurrency}:", "  " + "输入\\输出".rjust(10) + "".join(f"{o:>10}" for o in outputs)]
+        for i in inputs:
+            row = "".join(f"{'-' if values.get((i, o)) is None else values[(i, o)]:>10}" for o in outputs)
+            lines.append(f"  {i:>10}{row}")
+        blocks.append("\n".join(lines))
+    return "\n".join(blocks)
+
+
+def sweep_columns(result: Dict[str, Any]) -> Dict[str, List[Any]]:
+    """按列导出扫描结果（不含完整 stats），可交给 write_timeseries 写成 CSV / JSON"""
+    keys = [k for k in result["cells"][0] if k != "stats"] if result["cells"] else []
+    return {k: [row[k] for row in result["cells"]] for k in keys}
+
+
+def batch_sweep_test(tester: Any, batch_sizes: List[int], concurrencies: List[int], cell_duration: int,
+                     prompt: str, temperature: float = 0.7, max_tokens: int = 16, stream: bool = False,
+                     workload: Any = None, min_gain: float = 0.1, show_progress: bool = True,
+                     progress_callback: Any = None) -> Dict[str, Any]:
+    """
+    批量 × 并发数 扫描（tester 需为 completions / embeddings 端点），每格运行一次固定时长测试
+
+    Args:
+        tester: OpenAITester 或 AsyncOpenAITester，扫描期间修改其 batch_size，结束后恢复
+        batch_sizes: 每请求输入条数列表（升序）
+        concurrencies: 并发数列表
+        cell_duration: 每格的测试时长（秒）
+        min_gain: items/s 相对上一个批量的最小提升比例，低于该值视为饱和
+        其余参数同 duration_test
+
+    Returns:
+        cells: 每格的汇总行（批量、并发、QPS、items/s、输入 token/s、耗时、gain：items/s 相对上一个批量的提升，stats 为完整统计）
+        saturation: 并发数 -> 饱和批量（提升低于 min_gain 之前的最后一个批量，始终在提升时为 None）
+        best: items/s 最高的一格
+    """
+    if tester.endpoint == "chat":
+        raise ValueError("批量扫描仅适用于 completions / embeddings 端点")
+    batch_sizes = sorted(batch_sizes)
+    original = tester.batch_size
+    rows = []
+    try:
+        for batch_size, concurrency in itertools.product(batch_sizes, concurrencies):
+            print(f"\n📦 批量 {batch_size} / 并发 {concurrency}")
+            tester.batch_size = batch_size
+            stats = tester.duration_test(
+                prompt=prompt,
+                duration=cell_duration,
+                concurrency=concurrency,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                show_progress=show_progress,
+                progress_callback=progress_callback,
+                stream=stream,
+                workload=workload
+            )
+            rows.append({
+                "batch_size": batch_size,
+                "concurrency": concurrency,
+                "total": stats["total"],
+                "success_rate": stats["success_rate"],
+                "qps": stats["qps"],
+                "items_per_sec": stats.get("items_per_sec", 0),
+                "input_tps": stats.get("input_tps"),
+                "p50_time": stats["p50_time"],
+                "p95_time": stats["p95_time"],
+                "gain": None,
+                "stats": stats
+            })
+    finally:
+        tester.batch_size = original
+
+    saturation = {}
+    for concurrency in concurrencies:
+        previous = None
+        saturation[concurrency] = None
+        for row in (r for r in rows if r["concurrency"] == concurrency):
+            if previous is not None and previous["items_per_sec"] > 0:
+                row["gain"] = round(row["items_per_sec"] / previous["items_per_sec"] - 1, 3)
+                if row["gain"] < min_gain and saturation[concurrency] is None:
+                    saturation[concurrency] = previous["batch_size"]
+            previous = row
+    best = max(rows, key=lambda r: r["items_per_sec"]) if rows else None
+    return {"cells": rows, "cell_duration": cell_duration, "min_gain": min_gain, "saturation": saturation,
+            "best": best, "endpoint": tester.endpoint}
+
+
+def format_batch_table(result: Dict[str, Any]) -> str:
+    """把 batch_sweep_test 的结果格式化为终端明细表"""
+    lines = [f"{'批量':>6} {'并发':>5} {'请求数':>7} {'成功率%':>8} {'QPS':>8} {'items/s':>10} {'输入tok/s':>11} "
+             f"{'P50(s)':>7} {'P95(s)':>7} {'提升%':>7}"]
+    for row in result["cells"]:
+        gain = "-" if row["gain"] is None else f"{row['gain'] * 100:+.1f}"
+        input_tps = "-" if row["input_tps"] is None else row["input_tps"]
+        lines.append(f"{row['batch_size']:>6} {row['concurrency']:>5} {row['total']:>7} {row['success_rate']:>8} "
+                     f"{row['qps']:>8} {row['items_per_sec']:>10} {input_tps:>11} {row['p50_time']:>7} "
+                     f"{row['p95_time']:>7} {gain:>7}")
+    return "\n".join(lines)
+
+
+def format_batch_matrix(result: Dict[str, Any], metric: str) -> str:
+    """某个指标的 批量（行）× 并发数（列）矩阵"""
+    cells = result["cells"]
+    concurrencies = sorted({row["concurrency"] for row in cells})
+    values = {(row["batch_size"], row["concurrency"]): row[metric] for row in cells}
+    lines = ["  " + "批量\\并发".rjust(10) + "".join(f"{c:>12}" for c in concurrencies)]
+    for b in sorted({row["batch_size"] for row in cells}):
+        row = "".join(f"{'-' if values.get((b, c)) is None else values[(b, c)]:>12}" for c in concurrencies)
+        lines.append(f"  {b:>10}{row}")
+    return "\n".join(lines)
@@ -1,109 +1,293 @@
 # coding=utf-8
 import time
+import random
+import asyncio
+import itertools
 import threading
-from openai import OpenAI
-from typing import Dict, Any, List
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import contextvars
+from openai import OpenAI, AsyncOpenAI
+from typing import Dict, Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
+from stats import RunStats, stream_metrics
+from workload import resolve_request
+from adaptive import ConcurrencyController, control_loop
+from sessions import SessionScript, SessionStats
+from steady import SteadyState
+from rawhttp import REQUEST_PATHS, StreamAccumulator, raw_chat, araw_chat, auth_headers
+from usage import usage_fields, fill_input_tokens
+from endpoints import (ENDPOINT_PATHS, BatchEncoder, check_batch, raw_request, araw_request, sdk_request,
+                       asdk_request)
+from transport import (CLIENT_MODES, build_http_client, track_connections, connection_fields, describe,
+                       retry_after)
+
+
+def _arrival_times(start_time: float, end_time: float, rps: float, arrival: str):
+    """生成开环模式的计划发送时刻：constant 为等间隔，poisson 为指数分布间隔"""
+    t = start_time
+    while True:
+        t += random.expovariate(rps) if arrival == "poisson" else 1.0 / rps
+        if t >= end_time:
+            return
+        yield t
+
+
+def _mark_schedule(result: Dict[str, Any], intended: float, sent_at: float) -> Dict[str, Any]:
+    """附加开环指标：发送滞后，以及从计划时刻算起的延迟（修正协调遗漏）"""
+    result["send_lag"] = max(0.0, sent_at - intended)
+    result["intended_time"] = round(result["send_lag"] + result["time"], 3)
+    return result
+
+
+def _message_texts(messages: Optional[List[Dict[str, Any]]], prompt: str = "",
+                   system_prompt: str = "") -> List[str]:
+    """本地估算输入 token 数所用的文本：完整的消息列表，或 system_prompt 与 prompt"""
+    if messages is None:
+        return [system_prompt, prompt]
+    return [m["content"] for m in messages if isinstance(m.get("content"), str)]
+
+
+def _sdk_message_result(response: Any, start_time: float, keep_text: bool) -> Dict[str, Any]:
+    """sdk 路径的非流式结果（结构同 rawhttp 的非流式解析）"""
+    msg = response.choices[0].message
+    content, reasoning = msg.content or "", getattr(msg, "reasoning_content", None) or ""
+    return {
+        "success": True,
+        "response": content if keep_text else "",
+        "reasoning": reasoning if keep_text else "",
+        "time": round(time.time() - start_time, 3),
+        "error": None,
+        **usage_fields(response.usage, content, reasoning)
+    }
+
+
+def _rate_stats(run: RunStats, actual_duration: float, duration: int, rps: float, arrival: str) -> Dict[str, Any]:
+    stats = run.summary(actual_duration)
+    stats["duration"] = round(actual_duration, 3)
+    stats["target_duration"] = duration
+    stats["target_rps"] = rps
+    stats["arrival"] = arrival
+    stats["offered_rps"] = round(run.total / duration, 2) if duration > 0 else 0
+    stats["unsent"] = run.unsent
+    return stats
+
+
+def _watch_progress(run: RunStats, start_time: float, end_time: float, duration: int,
+                    show_progress: bool, progress_callback: Any, steady: Optional[SteadyState] = None) -> None:
+    """
+    固定时长模式的进度循环：tqdm 进度条或每秒一次回调（附带最近一秒的时间窗口），直到 end_time；
+    提供 steady 时每秒推进预热/稳态检测，置信区间达标后提前返回
+    """
+    if show_progress and progress_callback is None:
+        with tqdm(total=duration, desc="持续测试", unit="s") as pbar:
+            while time.time() < end_time:
+                remaining = end_time - time.time()
+                if remaining <= 0:
+                    break
+                pbar.update(1)
+                time.sleep(1)
+                snap = run.snapshot()
+                elapsed = max(1e-6, time.time() - start_time)
+                pbar.set_postfix({
+                    'requests': snap['requests'],
+                    'success': snap['success'],
+                    'qps': round(snap['success'] / elapsed, 2),
+                    **({'phase': steady.phase} if steady is not None else {})
+                })
+                if steady is not None and steady.update(snap['window']):
+                    break
+    else:
+        # 使用回调提供实时进度（每秒一次），或简单等待
+        while time.time() < end_time:
+            if progress_callback is not None or steady is not None:
+                snap = run.snapshot()
+            if steady is not None and steady.update(snap['window']):
+                break
+            if progress_callback is not None:
+                elapsed = max(1e-6, time.time() - start_time)
+                progress_callback({
+                    'elapsed': round(elapsed, 2),
+                    'target': duration,
+                    'requests': snap['requests'],
+                    'success': snap['success'],
+                    'qps': round(snap['success'] / elapsed, 2),
+                    'window': snap['window'],
+                    **({'phase': steady.phase} if steady is not None else {})
+                })
+            time.sleep(1)
+
 
 class OpenAITester:
-    def __init__(self, base_url: str, api_key: str, model: str, timeout: int = 30):
-        self.client = OpenAI(api_key=api_key, base_url=base_url.rstrip("/"), timeout=timeout)
+    """
+    线程池压测引擎
+
+    Args:
+        base_url / api_key / model / timeout: 服务配置
+        pool_size: 连接池上限，应不小于并发数，否则请求会在客户端排队等待空闲连接
+        keepalive: 是否复用连接
+        http2: 是否启用 HTTP/2（需安装 h2）
+        client_mode: shared（所有线程共享一个客户端与连接池）或 per_worker（每个工作线程独立的客户端）
+        request_path: sdk（openai SDK）或 raw（预编码请求体 + 增量 SSE 解析的精简路径，见 rawhttp.py）
+        keep_text: 是否保留回答文本；压测时关闭可减少内存与拼接开销，只统计 token 数
+        endpoint: chat（/chat/completions）、completions（旧版文本补全）或 embeddings，见 endpoints.py
+        batch_size: 非聊天端点每个请求包含的输入条数（可在两次测试之间修改，批量扫描即如此）
+        stream_usage: 流式请求是否携带 stream_options.include_usage（服务端不接受该参数时关闭，改为本地计数）
+    """
+
+    def __init__(self, base_url: str, api_key: str, model: str, timeout: int = 30, pool_size: int = 1000,
+                 keepalive: bool = True, http2: bool = False, client_mode: str = "shared",
+                 request_path: str = "sdk", keep_text: bool = True, endpoint: str = "chat", batch_size: int = 1,
+                 stream_usage: bool = True):
+        if client_mode not in CLIENT_MODES:
+            raise ValueError(f"不支持的客户端模式: {client_mode}")
+        if request_path not in REQUEST_PATHS:
+            raise ValueError(f"不支持的请求路径: {request_path}")
+        check_batch(endpoint, batch_size)
         self.model = model
+        self.client_mode = client_mode
+        self.request_path = request_path
+        self.keep_text = keep_text
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self._url = f"{base_url.rstrip('/')}{ENDPOINT_PATHS[endpoint]}"
+        self._headers = auth_headers(api_key)
+        self._encoder = BatchEncoder(model, endpoint, stream_usage=stream_usage)
+        self.connection = describe(pool_size, keepalive, http2, client_mode)
+        self._client_args = (api_key, base_url.rstrip("/"), timeout, pool_size, keepalive, http2)
+        self.client = self._new_client()
+        self._local = threading.local()
+        self._worker_clients = []
+        self._worker_lock = threading.Lock()
+
+    def _new_client(self) -> Any:
+        """sdk 路径返回 OpenAI 客户端，raw 路径直接返回 httpx.Client"""
+        api_key, base_url, timeout, pool_size, keepalive, http2 = self._client_args
+        http_client = build_http_client(timeout, pool_size, keepalive, http2)
+        if self.request_path == "raw":
+            return http_client
+        return OpenAI(api_key=api_key, base_url=base_url, timeout=timeout, http_client=http_client)
+
+    def _get_client(self) -> Any:
+        """per_worker 模式下每个线程首次请求时创建自己的客户端"""
+        if self.client_mode == "shared":
+            return self.client
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self._new_client()
+            with self._worker_lock:
+                self._worker_clients.append(client)
+        return client
+
+    def close(self):
+        """关闭所有客户端的连接池"""
+        for client in [self.client] + self._worker_clients:
+            client.close()
 
     def single_chat(self, prompt: str, system_prompt: str = "You are a helpful assistant.",
-                    temperature: float = 0.7, max_tokens: int = 4096, stream: bool = False) -> Dict[str, Any]:
-        messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}]
+                    temperature: float = 0.7, max_tokens: int = 4096, stream: bool = False,
+                    messages: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+        """
+        发送一次聊天请求；messages 提供时直接作为完整的消息列表发送（多轮会话），忽略 prompt 与 system_prompt；
+        非聊天端点发送 batch_size 条 prompt（忽略 system_prompt 与 messages）
+        """
+        conn = track_connections()
+        if self.endpoint != "chat":
+            if self.request_path == "raw":
+                body = self._encoder.batch_body(prompt, self.batch_size, temperature, max_tokens, stream)
+                result = raw_request(self._get_client(), self._url, self._headers, self.endpoint, body, stream,
+                                     self.keep_text)
+            else:
+                payload = self._encoder.payload(prompt, self.batch_size, temperature, max_tokens, stream)
+                result = sdk_request(self._get_client(), self.endpoint, payload, stream, self.keep_text)
+            return {**fill_input_tokens(result, [prompt] * self.batch_size), **connection_fields(conn)}
+        if self.request_path == "raw":
+            if messages is not None:
+                body = self._encoder.messages_body(messages, temperature, max_tokens, stream)
+            else:
+                body = self._encoder.body(prompt, system_prompt, temperature, max_tokens, stream)
+            result = raw_chat(self._get_client(), self._url, self._headers, body, stream, self.keep_text)
+            return {**fill_input_tokens(result, _message_texts(messages, prompt, system_prompt)),
+                    **connection_fields(conn)}
+        if messages is None:
+            messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}]
         start_time = time.time()
         try:
-            response = self.client.chat.completions.create(
+            response = self._get_client().chat.completions.create(
                 model=self.model,
                 messages=messages,
                 temperature=temperature,
                 max_tokens=max_tokens,
                 stream=stream,
+                **self._encoder.stream_options(stream)
             )
             if stream:
-                full_response = ""
-                reasoning_content = ""
+                # 以列表收集、结束后一次拼接，避免长回答下 += 的平方级开销
+                acc = StreamAccumulator(self.keep_text)
                 for chunk in response:
-                    delta = chunk.choices[0].delta
-                    if hasattr(delta, "content") and delta.content:
-                        full_response += delta.content
-                    if hasattr(delta, "reasoning_content") and delta.reasoning_content:
-                        reasoning_content += delta.reasoning_content
-                return {
+                    acc.add_chunk(chunk)
+                result = {
                     "success": True,
-                    "response": full_response,
-                    "reasoning": reasoning_content,
+                    "response": "".join(acc.content),
+                    "reasoning": "".join(acc.reasoning),
                     "time": round(time.time() - start_time, 3),
-                    "error": None
+                    "error": None,
+                    **stream_metrics(start_time, acc.chunk_times),
+                    **acc.fields()
                 }
             else:
-                msg = response.choices[0].message
-                reasoning = getattr(msg, "reasoning_content", "")
-                content = msg.content or ""
-                return {
-                    "success": True,
-                    "response": content,
-                    "reasoning": reasoning,
-                    "time": round(time.time() - start_time, 3),
-                    "error": None
-                }
+                result = _sdk_message_result(response, start_time, self.keep_text)
+            return {**fill_input_tokens(result, _message_texts(messages)), **connection_fields(conn)}
         except Exception as e:
             return {
                 "success": False,
                 "response": "",
                 "reasoning": "",
                 "time": round(time.time() - start_time, 3),
-                "error": str(e)
+                "error": str(e),
+                # 429/503 等响应携带的 Retry-After（秒），供自适应并发控制退避
+                "retry_after": retry_after(getattr(getattr(e, "response", None), "headers", None)),
+                **connection_fields(conn)
             }
 
     def concurrent_test(self, prompt: str, total: int, concurrency: int, system_prompt: str = "",
-                        temperature: float = 0.7, max_tokens: int = 4096, show_progress: bool = True) -> Dict[str, Any]:
-        results = []
+                        temperature: float = 0.7, max_tokens: int = 4096, show_progress: bool = True,
+                        stream: bool = False, run: Optional[RunStats] = None,
+                        workload: Any = None) -> Dict[str, Any]:
+        run = run if run is not None else RunStats()
         start_wall_time = time.time()  # ✅ 记录开始时间
+        # 进度条
+        pbar = tqdm(total=total, desc="并发测试", disable=not show_progress)
+        pbar_lock = threading.Lock()
+
+        def task():
+            run.begin()
+            return self.single_chat(*resolve_request(workload, prompt, system_prompt, temperature, max_tokens),
+                                    stream)
+
+        def on_done(future):
+            # 完成即计入统计，不保留 future 与结果，内存不随 total 增长
+            run.record(future.result())
+            with pbar_lock:
+                pbar.update(1)
 
         with ThreadPoolExecutor(max_workers=concurrency) as executor:
-            futures = [
-                executor.submit(self.single_chat, prompt, system_prompt, temperature, max_tokens, False)
-                for _ in range(total)
-            ]
-            # 进度条
-            iterator = tqdm(as_completed(futures), total=total, desc="并发测试", disable=not show_progress)
-            for future in iterator:
-                results.append(future.result())
+            for _ in range(total):
+                executor.submit(task).add_done_callback(on_done)
+        pbar.close()
 
         end_wall_time = time.time()  # ✅ 记录结束时间
         total_wall_time = end_wall_time - start_wall_time  # ✅ 墙钟时间
 
-        # 统计
-        success_list = [r for r in results if r["success"]]
-        times = [r["time"] for r in success_list]
-        p95 = sorted(times)[int(len(times) * 0.95)] if len(times) >= 20 else 0
-        avg_time = sum(times) / len(times) if times else 0
-
-        # ✅ 正确 QPS 计算
-        qps = len(success_list) / total_wall_time if total_wall_time > 0 else 0
-
-        # 失败信息
-        failures = [f"Req-{r['time']}s: {r['error']}" for r in results if not r['success']][:5]
-
-        return {
-            "total": total,
-            "success": len(success_list),
-            "failed": total - len(success_list),
-            "success_rate": round(len(success_list) / total * 100, 2),
-            "avg_time": round(avg_time, 3),
-            "p95_time": round(p95, 3),
-            "qps": round(qps, 2),
-            "total_wall_time": round(total_wall_time, 3),  # ✅ 新增：总测试时间
-            "failures": failures
-        }
+        # 统计（QPS 基于墙钟时间）
+        stats = run.summary(total_wall_time)
+        stats["total_wall_time"] = round(total_wall_time, 3)  # ✅ 新增：总测试时间
+        return stats
 
     def duration_test(self, prompt: str, duration: int, concurrency: int, system_prompt: str = "",
                       temperature: float = 0.7, max_tokens: int = 4096, show_progress: bool = True,
-                      progress_callback: Any = None) -> Dict[str, Any]:
+                      progress_callback: Any = None, stream: bool = False,
+                      run: Optional[RunStats] = None, workload: Any = None,
+                      steady: Optional[SteadyState] = None) -> Dict[str, Any]:
         """
         固定时长测试模式：在指定时间内持续发送请求
         
@@ -115,20 +299,32 @@ class OpenAITester:
             temperature: 温度
             max_tokens: 最大tokens
             show_progress: 是否显示进度条
+            progress_callback: 每秒一次的进度回调
+            stream: 是否以流式请求压测（额外统计 TTFT、token 间隔与解码速度）
+            run: 记录结果的 RunStats，默认新建；多进程/分布式汇总时由调用方传入以便取回可合并的统计
+            workload: 请求源（如 JsonlWorkload），提供时每个请求从中取 prompt 等参数，prompt 等仅作缺省值
+            steady: 预热剔除 / 稳态检测 / 按置信区间提前结束（见 steady.py），提供时只统计稳态阶段的请求，
+                duration 作为时长上限
             
         Returns:
-            测试统计结果
+            测试统计结果（提供 steady 时额外包含 steady 字段）
         """
-        results = []
+        run = run if run is not None else RunStats()
         start_time = time.time()
         end_time = start_time + duration
         stop_flag = threading.Event()
+        if steady is not None:
+            steady.start(start_time, duration)
         
         def worker():
             """工作线程：持续发送请求直到时间结束"""
             while not stop_flag.is_set() and time.time() < end_time:
-                result = self.single_chat(prompt, system_prompt, temperature, max_tokens, False)
-                results.append(result)
+                args = resolve_request(workload, prompt, system_prompt, temperature, max_tokens)
+                run.begin()
+                result = self.single_chat(*args, stream)
+                run.record(result)
+                if steady is not None:
+                    steady.record(result)
                 # 如果当前时间已经超过结束时间，立即停止
                 if time.time() >= end_time:
                     break
@@ -145,35 +341,7 @@ class OpenAITester:
             threads.append(thread)
         
         # 实时进度反馈或进度条
-        if show_progress and progress_callback is None:
-            with tqdm(total=duration, desc="持续测试", unit="s") as pbar:
-                while time.time() < end_time:
-                    remaining = end_time - time.time()
-                    if remaining <= 0:
-                        break
-                    pbar.update(1)
-                    time.sleep(1)
-                    success_cnt = len([r for r in results if r['success']])
-                    elapsed = max(1e-6, time.time() - start_time)
-                    pbar.set_postfix({
-                        'requests': len(results),
-                        'success': success_cnt,
-                        'qps': round(success_cnt / elapsed, 2)
-                    })
-        else:
-            # 使用回调提供实时进度（每秒一次），或简单等待
-            while time.time() < end_time:
-                if progress_callback is not None:
-                    success_cnt = len([r for r in results if r['success']])
-                    elapsed = max(1e-6, time.time() - start_time)
-                    progress_callback({
-                        'elapsed': round(elapsed, 2),
-                        'target': duration,
-                        'requests': len(results),
-                        'success': success_cnt,
-                        'qps': round(success_cnt / elapsed, 2)
-                    })
-                time.sleep(1)
+        _watch_progress(run, start_time, end_time, duration, show_progress, progress_callback, steady)
         
         # 停止所有线程
         stop_flag.set()
@@ -182,28 +350,561 @@ class OpenAITester:
         
         actual_duration = time.time() - start_time
         
-        # 统计结果
-        success_list = [r for r in results if r["success"]]
-        times = [r["time"] for r in success_list]
-        p95 = sorted(times)[int(len(times) * 0.95)] if len(times) >= 20 else 0
-        avg_time = sum(times) / len(times) if times else 0
-        
-        # 计算QPS（基于实际测试时长）
-        qps = len(success_list) / actual_duration if actual_duration > 0 else 0
-        
-        # 失败信息
-        failures = [f"Req-{r['time']}s: {r['error']}" for r in results if not r['success']][:5]
-        
-        return {
-            "total": len(results),
-            "success": len(success_list),
-            "failed": len(results) - len(success_list),
-            "success_rate": round(len(success_list) / len(results) * 100, 2) if results else 0,
-            "avg_time": round(avg_time, 3),
-            "p95_time": round(p95, 3),
-            "qps": round(qps, 2),
-            "duration": round(actual_duration, 3),
-            "target_duration": duration,
-            "failures": failures
-        }
+        # 统计结果（QPS 基于实际测试时长；稳态模式下只统计稳态阶段）
+        stats = steady.summary(run) if steady is not None else run.summary(actual_duration)
+        stats["duration"] = round(actual_duration, 3)
+        stats["target_duration"] = duration
+        return stats
+
+
+    def rate_test(self, prompt: str, rps: float, duration: int, concurrency: int, arrival: str = "constant",
+                  system_prompt: str = "", temperature: float = 0.7, max_tokens: int = 4096,
+                  show_progress: bool = True, progress_callback: Any = None, stream: bool = False,
+                  run: Optional[RunStats] = None, workload: Any = None) -> Dict[str, Any]:
+        """
+        固定速率测试模式（开环）：按时间表发送请求，不等待之前的请求返回
+
+        服务端变慢时发送速率不会随之下降，因此排队造成的延迟能如实反映在统计中。
+
+        Args:
+            prompt: 测试问题
+            rps: 目标每秒请求数
+            duration: 测试时长（秒）
+            concurrency: 在途请求上限（线程数），占满后新请求排队并计入发送滞后
+            arrival: 到达模型，constant（等间隔）或 poisson（泊松过程）
+            其余参数同 duration_test
+
+        Returns:
+            测试统计结果，额外包含 send_lag_*（实际发送相对计划的滞后）、
+            intended_time_*（从计划时刻算起的延迟）、offered_rps 与 unsent
+        """
+        run = run if run is not None else RunStats()
+        start_time = time.time()
+        end_time = start_time + duration
+
+        def send(intended):
+            # 线程池占满时任务会排队，开始执行的时刻才是实际发送时刻
+            sent_at = time.time()
+            if sent_at >= end_time:
+                run.record_unsent()
+                return
+            args = resolve_request(workload, prompt, system_prompt, temperature, max_tokens)
+            run.begin()
+            result = self.single_chat(*args, stream)
+            run.record(_mark_schedule(result, intended, sent_at))
+
+        def dispatch():
+            for intended in _arrival_times(start_time, end_time, rps, arrival):
+                delay = intended - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(send, intended)
+
+        print(f"🚀 开始固定速率测试: {rps} req/s ({arrival}) / {duration}秒 / 在途上限 {concurrency}")
+        print(f"⏰ 测试将在 {time.strftime('%H:%M:%S', time.localtime(end_time))} 结束")
+
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        dispatcher = threading.Thread(target=dispatch, daemon=True)
+        dispatcher.start()
+        _watch_progress(run, start_time, end_time, duration, show_progress, progress_callback)
+        dispatcher.join()
+        # 等待已发出的请求完成；排队中尚未发出的请求会被跳过并计入 unsent
+        executor.shutdown(wait=True)
+
+        return _rate_stats(run, time.time() - start_time, duration, rps, arrival)
+
+    def adaptive_test(self, prompt: str, duration: int, controller: ConcurrencyController, system_prompt: str = "",
+                      temperature: float = 0.7, max_tokens: int = 4096, show_progress: bool = True,
+                      progress_callback: Any = None, stream: bool = False,
+                      run: Optional[RunStats] = None, workload: Any = None) -> Dict[str, Any]:
+        """
+        自适应并发测试：启动 controller.max_limit 个工作线程，由控制器根据延迟与错误信号决定其中多少个可以发送请求
+
+        Args:
+            controller: 并发上限控制器（见 adaptive.py）
+            其余参数同 duration_test
+
+        Returns:
+            duration_test 的统计字段，额外包含 adaptive（discovered_limit / steady_limit / trajectory 等）
+        """
+        run = run if run is not None else RunStats()
+        start_time = time.time()
+        end_time = start_time + duration
+
+        def worker(slot):
+            while controller.wait_turn(slot, end_time):
+                args = resolve_request(workload, prompt, system_prompt, temperature, max_tokens)
+                run.begin()
+                result = self.single_chat(*args, stream)
+                run.record(result)
+                controller.observe(result)
+
+        print(f"🚀 开始自适应并发测试: {duration}秒 / 并发 {controller.min_limit}~{controller.max_limit}"
+              f"（{controller.algorithm}，初始 {controller.limit}）")
+        threads = [threading.Thread(target=worker, args=(slot,), daemon=True) for slot in range(controller.max_limit)]
+        for thread in threads:
+            thread.start()
+        control_loop(controller, run, start_time, end_time, duration, show_progress, progress_callback)
+        # 与固定时长模式一致：到点后最多再等 1 秒
+        deadline = time.time() + 1
+        for thread in threads:
+            thread.join(timeout=max(0.0, deadline - time.time()))
+
+        actual_duration = time.time() - start_time
+        stats = run.summary(actual_duration)
+        stats["duration"] = round(actual_duration, 3)
+        stats["target_duration"] = duration
+        stats["adaptive"] = controller.report()
+        return stats
+
+    def session_test(self, prompt: str, duration: int, concurrency: int, script: SessionScript,
+                     system_prompt: str = "", temperature: float = 0.7, max_tokens: int = 4096,
+                     show_progress: bool = True, progress_callback: Any = None, stream: bool = True,
+                     run: Optional[RunStats] = None, workload: Any = None) -> Dict[str, Any]:
+        """
+        多轮会话测试：concurrency 个虚拟用户各自循环进行 script.turns 轮的对话，每轮追加上一轮的回答（见 sessions.py）
+
+        Args:
+            script: 会话脚本（轮数、思考时间、前缀模式）
+            workload: 请求源，提供时每轮的用户消息从中取 prompt（系统提示词在会话开始时确定）
+            其余参数同 duration_test；默认流式，以便按轮次比较 TTFT
+
+        Returns:
+            duration_test 的统计字段（所有轮次合计），额外包含 sessions（按轮次的统计与完成/中断的会话数）
+        """
+        if not self.keep_text:
+            raise ValueError("多轮会话需要保留回答文本以追加到对话历史，不能与 keep_text=False 同时使用")
+        run = run if run is not None else RunStats()
+        sessions = SessionStats(script.turns)
+        start_time = time.time()
+        end_time = start_time + duration
+        stop_flag = threading.Event()
+
+        def worker():
+            while not stop_flag.is_set() and time.time() < end_time:
+                messages = script.start(system_prompt)
+                completed = True
+                for turn in range(script.turns):
+                    think = script.think() if turn else 0.0
+                    # 思考时间内测试结束则中断会话
+                    if think and stop_flag.wait(min(think, max(0.0, end_time - time.time()))):
+                        completed = False
+                        break
+                    if time.time() >= end_time:
+                        completed = False
+                        break
+                    text, _, temp, tokens = resolve_request(workload, prompt, system_prompt, temperature, max_tokens)
+                    messages.append(script.user(text))
+                    request = script.request(messages)
+                    run.begin()
+                    result = self.single_chat(text, system_prompt, temp, tokens, stream, request)
+                    run.record(result)
+                    sessions.record(turn, result, request)
+                    if not result["success"]:
+                        completed = False
+                        break
+                    messages.append({"role": "assistant", "content": result["response"]})
+                sessions.end(completed)
+
+        print(f"🚀 开始多轮会话测试: {duration}秒 / {concurrency} 个虚拟用户 / 每段 {script.turns} 轮"
+              f"（前缀 {script.prefix_mode}，思考 {script.think_time}s）")
+        print(f"⏰ 测试将在 {time.strftime('%H:%M:%S', time.localtime(end_time))} 结束")
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        _watch_progress(run, start_time, end_time, duration, show_progress, progress_callback)
+        stop_flag.set()
+        for thread in threads:
+            thread.join(timeout=1)
+
+        actual_duration = time.time() - start_time
+        stats = run.summary(actual_duration)
+        stats["duration"] = round(actual_duration, 3)
+        stats["target_duration"] = duration
+        stats["sessions"] = sessions.report(script)
+        return stats
+
+# asyncio 引擎 per_worker 模式下当前协程使用的客户端（每个 Task 拥有独立的上下文副本）
+_worker_client: contextvars.ContextVar = contextvars.ContextVar("worker_client", default=None)
+
+
+class AsyncOpenAITester:
+    """
+    asyncio 压测引擎：基于 AsyncOpenAI，单进程即可维持数千在途请求
+
+    接口与 OpenAITester 保持一致（同步调用、返回同样的统计字典），可直接替换使用。
+    协程运行在一个常驻的后台事件循环线程中，多次测试之间复用同一个客户端与连接池。
+    连接、请求路径与端点参数同 OpenAITester，per_worker 模式下每个 worker 协程（固定速率模式下按在途槽位轮转）使用独立客户端。
+    """
+
+    def __init__(self, base_url: str, api_key: str, model: str, timeout: int = 30, pool_size: int = 10000,
+                 keepalive: bool = True, http2: bool = False, client_mode: str = "shared",
+                 request_path: str = "sdk", keep_text: bool = True, endpoint: str = "chat", batch_size: int = 1,
+                 stream_usage: bool = True):
+        if client_mode not in CLIENT_MODES:
+            raise ValueError(f"不支持的客户端模式: {client_mode}")
+        if request_path not in REQUEST_PATHS:
+            raise ValueError(f"不支持的请求路径: {request_path}")
+        check_batch(endpoint, batch_size)
+        self.model = model
+        self.client_mode = client_mode
+        self.request_path = request_path
+        self.keep_text = keep_text
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self._url = f"{base_url.rstrip('/')}{ENDPOINT_PATHS[endpoint]}"
+        self._headers = auth_headers(api_key)
+        self._encoder = BatchEncoder(model, endpoint, stream_usage=stream_usage)
+        self.connection = describe(pool_size, keepalive, http2, client_mode)
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._loop_thread.start()
+        # openai 默认连接池上限为 1000，高并发时需放大，否则请求会在客户端排队
+        self._client_args = (api_key, base_url.rstrip("/"), timeout, pool_size, keepalive, http2)
+        self.client = self._new_client()
+        self._worker_clients: List[Any] = []
+
+    def _new_client(self) -> Any:
+        """sdk 路径返回 AsyncOpenAI 客户端，raw 路径直接返回 httpx.AsyncClient"""
+        api_key, base_url, timeout, pool_size, keepalive, http2 = self._client_args
+        http_client = build_http_client(timeout, pool_size, keepalive, http2, async_client=True)
+        if self.request_path == "raw":
+            return http_client
+        return AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout, http_client=http_client)
+
+    def _use_worker_client(self, slot: int) -> None:
+        """per_worker 模式：让当前协程（及其后续请求）使用第 slot 个独立客户端"""
+        if self.client_mode == "shared":
+            return
+        while len(self._worker_clients) <= slot:
+            self._worker_clients.append(self._new_client())
+        _worker_client.set(self._worker_clients[slot])
+
+    def _run(self, coro):
+        """在后台事件循环中执行协程并阻塞等待结果"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def close(self):
+        """关闭所有客户端并停止后台事件循环"""
+        for client in [self.client] + self._worker_clients:
+            self._run(client.aclose() if self.request_path == "raw" else client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def achat(self, prompt: str, system_prompt: str = "You are a helpful assistant.",
+                    temperature: float = 0.7, max_tokens: int = 4096, stream: bool = False,
+                    messages: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+        """single_chat 的协程版本，参数与返回结构相同"""
+        conn = track_connections()
+        if self.endpoint != "chat":
+            client = _worker_client.get() or self.client
+            if self.request_path == "raw":
+                body = self._encoder.batch_body(prompt, self.batch_size, temperature, max_tokens, stream)
+                result = await araw_request(client, self._url, self._headers, self.endpoint, body, stream,
+                                            self.keep_text)
+            else:
+                payload = self._encoder.payload(prompt, self.batch_size, temperature, max_tokens, stream)
+                result = await asdk_request(client, self.endpoint, payload, stream, self.keep_text)
+            return {**fill_input_tokens(result, [prompt] * self.batch_size), **connection_fields(conn)}
+        if self.request_path == "raw":
+            if messages is not None:
+                body = self._encoder.messages_body(messages, temperature, max_tokens, stream)
+            else:
+                body = self._encoder.body(prompt, system_prompt, temperature, max_tokens, stream)
+            result = await araw_chat(_worker_client.get() or self.client, self._url, self._headers, body, stream,
+                                     self.keep_text)
+            return {**fill_input_tokens(result, _message_texts(messages, prompt, system_prompt)),
+                    **connection_fields(conn)}
+        if messages is None:
+            messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}]
+        start_time = time.time()
+        try:
+            response = await (_worker_client.get() or self.client).chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=stream,
+                **self._encoder.stream_options(stream)
+            )
+            if stream:
+                acc = StreamAccumulator(self.keep_text)
+                async for chunk in response:
+                    acc.add_chunk(chunk)
+                result = {
+                    "success": True,
+                    "response": "".join(acc.content),
+                    "reasoning": "".join(acc.reasoning),
+                    "time": round(time.time() - start_time, 3),
+                    "error": None,
+                    **stream_metrics(start_time, acc.chunk_times),
+                    **acc.fields()
+                }
+            else:
+                result = _sdk_message_result(response, start_time, self.keep_text)
+            return {**fill_input_tokens(result, _message_texts(messages)), **connection_fields(conn)}
+        except Exception as e:
+            return {
+                "success": False,
+                "response": "",
+                "reasoning": "",
+                "time": round(time.time() - start_time, 3),
+                "error": str(e),
+                # 429/503 等响应携带的 Retry-After（秒），供自适应并发控制退避
+                "retry_after": retry_after(getattr(getattr(e, "response", None), "headers", None)),
+                **connection_fields(conn)
+            }
+
+    def single_chat(self, prompt: str, system_prompt: str = "You are a helpful assistant.",
+                    temperature: float = 0.7, max_tokens: int = 4096, stream: bool = False,
+                    messages: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+        return self._run(self.achat(prompt, system_prompt, temperature, max_tokens, stream, messages))
+
+    async def _tracked_chat(self, run: RunStats, *args) -> Dict[str, Any]:
+        """run.begin() 后发送请求；到点被取消时从在途数中扣除，避免时间序列与 /metrics 的在途数一直偏高"""
+        run.begin()
+        try:
+            return await self.achat(*args)
+        except asyncio.CancelledError:
+            run.abandon()
+            raise
+
+    async def _concurrent(self, prompt: str, total: int, concurrency: int, system_prompt: str,
+                          temperature: float, max_tokens: int, show_progress: bool,
+                          stream: bool, run: RunStats, workload: Any) -> None:
+        remaining = [total]
+        pbar = tqdm(total=total, desc="并发测试", disable=not show_progress)
+
+        async def worker(slot):
+            # 固定数量的协程从共享计数器领取任务，避免一次性创建 total 个协程
+            self._use_worker_client(slot)
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                args = resolve_request(workload, prompt, system_prompt, temperature, max_tokens)
+                run.begin()
+                run.record(await self.achat(*args, stream))
+                pbar.update(1)
+
+        await asyncio.gather(*(worker(i) for i in range(min(concurrency, total))))
+        pbar.close()
 
+    def concurrent_test(self, prompt: str, total: int, concurrency: int, system_prompt: str = "",
+                        temperature: float = 0.7, max_tokens: int = 4096, show_progress: bool = True,
+                        stream: bool = False, run: Optional[RunStats] = None,
+                        workload: Any = None) -> Dict[str, Any]:
+        run = run if run is not None else RunStats()
+        start_wall_time = time.time()
+        self._run(self._concurrent(prompt, total, concurrency, system_prompt,
+                                   temperature, max_tokens, show_progress, stream, run, workload))
+        total_wall_time = time.time() - start_wall_time
+
+        stats = run.summary(total_wall_time)
+        stats["total_wall_time"] = round(total_wall_time, 3)
+        return stats
+
+    async def _duration(self, prompt: str, end_time: float, concurrency: int, system_prompt: str,
+                        temperature: float, max_tokens: int, stream: bool, run: RunStats,
+                        workload: Any, steady: Optional[SteadyState] = None) -> None:
+        async def worker(slot):
+            self._use_worker_client(slot)
+            while time.time() < end_time and not (steady is not None and steady.stopped):
+                args = resolve_request(workload, prompt, system_prompt, temperature, max_tokens)
+                result = await self._tracked_chat(run, *args, stream)
+                run.record(result)
+                if steady is not None:
+                    steady.record(result)
+
+        tasks = [asyncio.ensure_future(worker(i)) for i in range(concurrency)]
+        # 与线程模式一致：到点（或按置信区间提前结束）后最多再等1秒，仍未返回的请求直接取消
+        pending = set(tasks)
+        while pending:
+            deadline = min(end_time, steady.stopped_at or end_time) if steady is not None else end_time
+            if time.time() >= deadline + 1:
+                break
+            done, pending = await asyncio.wait(pending, timeout=min(1.0, deadline + 1 - time.time()))
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+
+    def duration_test(self, prompt: str, duration: int, concurrency: int, system_prompt: str = "",
+                      temperature: float = 0.7, max_tokens: int = 4096, show_progress: bool = True,
+                      progress_callback: Any = None, stream: bool = False,
+                      run: Optional[RunStats] = None, workload: Any = None,
+                      steady: Optional[SteadyState] = None) -> Dict[str, Any]:
+        """固定时长测试模式，参数与返回值同 OpenAITester.duration_test"""
+        run = run if run is not None else RunStats()
+        start_time = time.time()
+        end_time = start_time + duration
+        if steady is not None:
+            steady.start(start_time, duration)
+
+        print(f"🚀 开始固定时长测试(async): {duration}秒 / {concurrency} 并发")
+        print(f"⏰ 测试将在 {time.strftime('%H:%M:%S', time.localtime(end_time))} 结束")
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._duration(prompt, end_time, concurrency, system_prompt, temperature, max_tokens, stream, run,
+                           workload, steady),
+            self._loop)
+        _watch_progress(run, start_time, end_time, duration, show_progress, progress_callback, steady)
+        future.result()
+
+        actual_duration = time.time() - start_time
+        stats = steady.summary(run) if steady is not None else run.summary(actual_duration)
+        stats["duration"] = round(actual_duration, 3)
+        stats["target_duration"] = duration
+        return stats
+
+    async def _rate(self, prompt: str, rps: float, start_time: float, end_time: float, concurrency: int,
+                    arrival: str, system_prompt: str, temperature: float, max_tokens: int, stream: bool,
+                    run: RunStats, workload: Any) -> None:
+        sem = asyncio.Semaphore(concurrency)
+        tasks = set()
+        slots = itertools.cycle(range(concurrency))
+
+        async def send(intended, slot):
+            self._use_worker_client(slot)
+            async with sem:
+                sent_at = time.time()
+                if sent_at >= end_time:
+                    run.record_unsent()
+                    return
+                args = resolve_request(workload, prompt, system_prompt, temperature, max_tokens)
+                run.begin()
+                result = await self.achat(*args, stream)
+                run.record(_mark_schedule(result, intended, sent_at))
+
+        for intended in _arrival_times(start_time, end_time, rps, arrival):
+            delay = intended - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.ensure_future(send(intended, next(slots)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+
+    def rate_test(self, prompt: str, rps: float, duration: int, concurrency: int, arrival: str = "constant",
+                  system_prompt: str = "", temperature: float = 0.7, max_tokens: int = 4096,
+                  show_progress: bool = True, progress_callback: Any = None, stream: bool = False,
+                  run: Optional[RunStats] = None, workload: Any = None) -> Dict[str, Any]:
+        """固定速率（开环）测试模式，参数与返回值同 OpenAITester.rate_test"""
+        run = run if run is not None else RunStats()
+        start_time = time.time()
+        end_time = start_time + duration
+
+        print(f"🚀 开始固定速率测试(async): {rps} req/s ({arrival}) / {duration}秒 / 在途上限 {concurrency}")
+        print(f"⏰ 测试将在 {time.strftime('%H:%M:%S', time.localtime(end_time))} 结束")
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._rate(prompt, rps, start_time, end_time, concurrency, arrival, system_prompt,
+                       temperature, max_tokens, stream, run, workload),
+            self._loop)
+        _watch_progress(run, start_time, end_time, duration, show_progress, progress_callback)
+        future.result()
+
+        return _rate_stats(run, time.time() - start_time, duration, rps, arrival)
+
+    async def _adaptive(self, prompt: str, end_time: float, controller: ConcurrencyController, system_prompt: str,
+                        temperature: float, max_tokens: int, stream: bool, run: RunStats, workload: Any) -> None:
+        async def worker(slot):
+            self._use_worker_client(slot)
+            while await controller.await_turn(slot, end_time):
+                args = resolve_request(workload, prompt, system_prompt, temperature, max_tokens)
+                result = await self._tracked_chat(run, *args, stream)
+                run.record(result)
+                controller.observe(result)
+
+        tasks = [asyncio.ensure_future(worker(i)) for i in range(controller.max_limit)]
+        done, pending = await asyncio.wait(tasks, timeout=max(0.0, end_time - time.time()) + 1)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+
+    def adaptive_test(self, prompt: str, duration: int, controller: ConcurrencyController, system_prompt: str = "",
+                      temperature: float = 0.7, max_tokens: int = 4096, show_progress: bool = True,
+                      progress_callback: Any = None, stream: bool = False,
+                      run: Optional[RunStats] = None, workload: Any = None) -> Dict[str, Any]:
+        """自适应并发测试，参数与返回值同 OpenAITester.adaptive_test"""
+        run = run if run is not None else RunStats()
+        start_time = time.time()
+        end_time = start_time + duration
+
+        print(f"🚀 开始自适应并发测试(async): {duration}秒 / 并发 {controller.min_limit}~{controller.max_limit}"
+              f"（{controller.algorithm}，初始 {controller.limit}）")
+        future = asyncio.run_coroutine_threadsafe(
+            self._adaptive(prompt, end_time, controller, system_prompt, temperature, max_tokens, stream, run,
+                           workload),
+            self._loop)
+        control_loop(controller, run, start_time, end_time, duration, show_progress, progress_callback)
+        future.result()
+
+        actual_duration = time.time() - start_time
+        stats = run.summary(actual_duration)
+        stats["duration"] = round(actual_duration, 3)
+        stats["target_duration"] = duration
+        stats["adaptive"] = controller.report()
+        return stats
+
+    async def _sessions(self, prompt: str, end_time: float, concurrency: int, script: SessionScript,
+                        system_prompt: str, temperature: float, max_tokens: int, stream: bool, run: RunStats,
+                        sessions: SessionStats, workload: Any) -> None:
+        async def worker(slot):
+            self._use_worker_client(slot)
+            while time.time() < end_time:
+                messages = script.start(system_prompt)
+                completed = True
+                for turn in range(script.turns):
+                    think = script.think() if turn else 0.0
+                    if think:
+                        await asyncio.sleep(min(think, max(0.0, end_time - time.time())))
+                    if time.time() >= end_time:
+                        completed = False
+                        break
+                    text, _, temp, tokens = resolve_request(workload, prompt, system_prompt, temperature, max_tokens)
+                    messages.append(script.user(text))
+                    request = script.request(messages)
+                    result = await self._tracked_chat(run, text, system_prompt, temp, tokens, stream, request)
+                    run.record(result)
+                    sessions.record(turn, result, request)
+                    if not result["success"]:
+                        completed = False
+                        break
+                    messages.append({"role": "assistant", "content": result["response"]})
+                sessions.end(completed)
+
+        tasks = [asyncio.ensure_future(worker(i)) for i in range(concurrency)]
+        done, pending = await asyncio.wait(tasks, timeout=max(0.0, end_time - time.time()) + 1)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+
+    def session_test(self, prompt: str, duration: int, concurrency: int, script: SessionScript,
+                     system_prompt: str = "", temperature: float = 0.7, max_tokens: int = 4096,
+                     show_progress: bool = True, progress_callback: Any = None, stream: bool = True,
+                     run: Optional[RunStats] = None, workload: Any = None) -> Dict[str, Any]:
+        """多轮会话测试，参数与返回值同 OpenAITester.session_test"""
+        if not self.keep_text:
+            raise ValueError("多轮会话需要保留回答文本以追加到对话历史，不能与 keep_text=False 同时使用")
+        run = run if run is not None else RunStats()
+        sessions = SessionStats(script.turns)
+        start_time = time.time()
+        end_time = start_time + duration
+
+        print(f"🚀 开始多轮会话测试(async): {duration}秒 / {concurrency} 个虚拟用户 / 每段 {script.turns} 轮"
+              f"（前缀 {script.prefix_mode}，思考 {script.think_time}s）")
+        print(f"⏰ 测试将在 {time.strftime('%H:%M:%S', time.localtime(end_time))} 结束")
+        future = asyncio.run_coroutine_threadsafe(
+            self._sessions(prompt, end_time, concurrency, script, system_prompt, temperature, max_tokens, stream,
+                           run, sessions, workload),
+            self._loop)
+        _watch_progress(run, start_time, end_time, duration, show_progress, progress_callback)
+        future.result()
+
+        actual_duration = time.time() - start_time
+        stats = run.summary(actual_duration)
+        stats["duration"] = round(actual_duration, 3)
+        stats["target_duration"] = duration
+        stats["sessions"] = sessions.report(script)
+        return stats
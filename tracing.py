@@ -0,0 +1,208 @@
+# coding=utf-8
+"""
+逐请求时间线：采样记录每个请求各阶段的时刻，导出为 Chrome trace 或 OTLP JSON
+
+P95 变差时，只看总耗时无法区分请求是在客户端排队、在等待首字节，还是解码变慢。
+开启后按采样率保留部分请求的阶段时刻（来自 transport 的连接 trace 与流式指标）：
+    queued             计划时刻 -> 工作线程/协程开始发送（仅固定速率模式，即发送滞后）
+    acquire_connection 开始发送 -> 拿到连接（含客户端组装请求与连接池等待）
+    connect            新建连接的 TCP 建连与 TLS 握手
+    send               拿到连接（或建连完成）-> 请求体发送完毕
+    wait_first_byte    请求发送完毕 -> 收到响应头
+    wait_first_token   收到响应头 -> 首个内容块（流式）
+    decode             首个内容块 -> 最后一个内容块（流式）
+    receive            收到响应头 -> 读完响应（非流式）
+Chrome trace（--trace-format chrome）可直接在 https://ui.perfetto.dev 或 chrome://tracing 打开，
+每个工作线程/协程一行；OTLP JSON（--trace-format otlp）每个请求一个 trace，阶段为子 span，
+可通过 OpenTelemetry Collector 的 otlpjsonfile receiver 导入 Jaeger / Tempo 等后端。
+
+采样：先按 sample_rate 随机选取请求，再以蓄水池抽样保留至多 max_requests 个，
+长时间测试的内存占用有上限，且样本在整个测试时段内均匀分布。未被选中的请求只多一次随机数判断。
+"""
+import json
+import random
+import asyncio
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+from stats import classify_error
+
+TRACE_FORMATS = ("chrome", "otlp")
+
+
+def _worker_key() -> Tuple[str, int]:
+    """当前工作协程（asyncio 引擎）或工作线程的标识"""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        return "task", id(task)
+    return "thread", threading.get_ident()
+
+
+def _phases(result: Dict[str, Any], now: float) -> Tuple[Optional[float], float, List[Tuple[str, float, float]]]:
+    """根据 single_chat 的结果与完成时刻还原各阶段，返回 (计划时刻, 开始时刻, [(阶段, 开始, 结束)])"""
+    started = result.get("started_at") or now - result["time"]
+    scheduled = started - result["send_lag"] if result.get("send_lag") else None
+    acquired = result.get("acquired_at")
+    sent = result.get("sent_at")
+    first_byte = result.get("first_byte_at")
+    marks = [("queued", scheduled, started), ("acquire_connection", started, acquired)]
+    ready = acquired
+    if acquired is not None and result.get("connect_time") is not None:
+        ready = acquired + result["connect_time"] + (result.get("tls_time") or 0)
+        marks.append(("connect", acquired, ready))
+    marks += [("send", ready, sent), ("wait_first_byte", sent, first_byte)]
+    if result.get("ttft") is not None:
+        first_token = started + result["ttft"]
+        last_token = first_token + sum(result.get("itl") or ())
+        marks += [("wait_first_token", first_byte, first_token), ("decode", first_token, last_token)]
+    else:
+        marks.append(("receive", first_byte, now))
+    phases = [(name, begin, end) for name, begin, end in marks if begin is not None and end is not None and end >= begin]
+    return scheduled, started, phases
+
+
+class SpanRecorder:
+    """
+    逐请求时间线采样器，作为 RunStats.tracer 使用（由 RunStats.record() 在工作线程/协程中调用）
+
+    Args:
+        sample_rate: 请求被选中的概率（0~1）
+        max_requests: 最多保留的请求数（蓄水池抽样）
+        seed: 随机种子，便于复现采样结果
+    """
+
+    def __init__(self, sample_rate: float = 1.0, max_requests: int = 10000, seed: Optional[int] = None):
+        if not 0 < sample_rate <= 1:
+            raise ValueError(f"采样率需在 (0, 1] 之间: {sample_rate}")
+        if max_requests < 1:
+            raise ValueError(f"最多保留的请求数需大于 0: {max_requests}")
+        self.sample_rate = sample_rate
+        self.max_requests = max_requests
+        self.sampled = 0
+        self.requests: List[Dict[str, Any]] = []
+        self._random = random.Random(seed)
+        self._workers: Dict[Tuple[str, int], int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, result: Dict[str, Any], now: float) -> None:
+        if self.sample_rate < 1 and self._random.random() >= self.sample_rate:
+            return
+        scheduled, started, phases = _phases(result, now)
+        entry = {
+            "start": scheduled if scheduled is not None else started,
+            "end": now,
+            "phases": phases,
+            "success": result["success"],
+            "error": None if result["success"] else classify_error(result.get("error")),
+            "message": None if result["success"] else str(result.get("error"))[:200],
+            "output_tokens": result.get("output_tokens"),
+            "new_connections": result.get("new_connections"),
+        }
+        key = _worker_key()
+        with self._lock:
+            entry["worker"] = self._workers.setdefault(key, len(self._workers) + 1)
+            entry["worker_kind"] = key[0]
+            self.sampled += 1
+            if len(self.requests) < self.max_requests:
+                self.requests.append(entry)
+            else:
+                slot = self._random.randrange(self.sampled)
+                if slot < self.max_requests:
+                    self.requests[slot] = entry
+
+    def chrome_trace(self, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Chrome trace event 格式：每个请求一个 request 片段，阶段片段嵌套其中；时间单位微秒，相对最早的请求
+
+        Returns:
+            {"traceEvents": [...], "displayTimeUnit": "ms", "otherData": {...}}
+        """
+        requests = sorted(self.requests, key=lambda r: r["start"])
+        base = requests[0]["start"] if requests else 0.0
+
+        def us(t: float) -> float:
+            return round((t - base) * 1e6, 3)
+
+        events = [{"ph": "M", "name": "process_name", "pid": 1, "tid": 0, "args": {"name": "llm-loadtest"}}]
+        workers = {}
+        for r in requests:
+            workers.setdefault(r["worker"], r["worker_kind"])
+        for tid, kind in sorted(workers.items()):
+            events.append({"ph": "M", "name": "thread_name", "pid": 1, "tid": tid, "args": {"name": f"{kind}-{tid}"}})
+        for r in requests:
+            args = {"success": r["success"], "output_tokens": r["output_tokens"],
+                    "new_connections": r["new_connections"]}
+            if not r["success"]:
+                args.update({"error": r["error"], "message": r["message"]})
+            events.append({"ph": "X", "name": "request" if r["success"] else f"request ({r['error']})",
+                           "cat": "request", "pid": 1, "tid": r["worker"], "ts": us(r["start"]),
+                           "dur": round((r["end"] - r["start"]) * 1e6, 3), "args": args})
+            for name, begin, end in r["phases"]:
+                events.append({"ph": "X", "name": name, "cat": "phase", "pid": 1, "tid": r["worker"],
+                               "ts": us(begin), "dur": round((end - begin) * 1e6, 3)})
+        other = {"base_time": base, "sample_rate": self.sample_rate, "sampled": self.sampled, "kept": len(requests)}
+        other.update(metadata or {})
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": other}
+
+    def otlp(self, metadata: Optional[Dict[str, Any]] = None, service_name: str = "llm-loadtest") -> Dict[str, Any]:
+        """
+        OTLP/JSON（ExportTraceServiceRequest）：每个请求一个 trace，根 span 为 request，阶段为子 span
+
+        Args:
+            metadata: 附加到 resource 上的属性（如测试模式、模型）
+            service_name: resource 的 service.name
+        """
+        rng = random.Random()
+        spans = []
+        for r in sorted(self.requests, key=lambda r: r["start"]):
+            trace_id = "%032x" % rng.getrandbits(128)
+            root_id = "%016x" % rng.getrandbits(64)
+            attributes = {"worker": f"{r['worker_kind']}-{r['worker']}", "success": r["success"],
+                          "output_tokens": r["output_tokens"], "new_connections": r["new_connections"]}
+            status = {"code": 1}
+            if not r["success"]:
+                attributes["error.type"] = r["error"]
+                status = {"code": 2, "message": r["message"]}
+            spans.append({"traceId": trace_id, "spanId": root_id, "name": "request", "kind": 3,
+                          "startTimeUnixNano": _nanos(r["start"]), "endTimeUnixNano": _nanos(r["end"]),
+                          "attributes": _attributes(attributes), "status": status})
+            for name, begin, end in r["phases"]:
+                spans.append({"traceId": trace_id, "spanId": "%016x" % rng.getrandbits(64), "parentSpanId": root_id,
+                              "name": name, "kind": 1, "startTimeUnixNano": _nanos(begin),
+                              "endTimeUnixNano": _nanos(end)})
+        resource = dict(metadata or {}, **{"service.name": service_name, "loadtest.sample_rate": self.sample_rate})
+        return {"resourceSpans": [{"resource": {"attributes": _attributes(resource)},
+                                   "scopeSpans": [{"scope": {"name": "llm-loadtest"}, "spans": spans}]}]}
+
+    def write(self, path: str, fmt: str = "chrome", metadata: Optional[Dict[str, Any]] = None) -> None:
+        """把采样到的时间线写入 JSON 文件，fmt 为 chrome 或 otlp"""
+        if fmt not in TRACE_FORMATS:
+            raise ValueError(f"不支持的时间线格式: {fmt}")
+        data = self.chrome_trace(metadata) if fmt == "chrome" else self.otlp(metadata)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+
+def _nanos(t: float) -> str:
+    # OTLP/JSON 中 64 位整数以字符串表示
+    return str(int(t * 1e9))
+
+
+def _attributes(values: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """转换为 OTLP 的 KeyValue 列表（None 值跳过）"""
+    attributes = []
+    for key, value in values.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        attributes.append({"key": key, "value": typed})
+    return attributes
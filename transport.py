@@ -0,0 +1,155 @@
+# coding=utf-8
+"""
+HTTP 连接层：连接池大小、keep-alive、HTTP/2 配置，以及逐请求的建连指标
+
+openai SDK 默认的连接池（最多 1000 个连接、只保留 100 个空闲连接）远小于压测时常用的并发数，
+超出部分要么在客户端排队等待空闲连接，要么每次请求重新建连，这段时间原本都被计入了服务端耗时。
+这里由压测工具显式构建 httpx 客户端，并通过 httpcore 的 trace 扩展记录每个请求：
+    new_connections  本次请求（含 SDK 自动重试）新建的连接数
+    pool_wait        从进入连接池到拿到连接（开始建连或开始发送请求头）的等待时间
+    connect_time     TCP 建连耗时
+    tls_time         TLS 握手耗时
+以及各阶段的绝对时刻（Unix 时间，供逐请求时间线 tracing.py 使用）：
+    started_at       开始发起请求（工作线程/协程取到任务）
+    acquired_at      拿到连接（开始建连或复用连接发送请求头）
+    sent_at          请求体发送完毕
+    first_byte_at    收到响应头
+指标通过 contextvars 归属到当前线程/协程中正在执行的请求，多线程与 asyncio 下互不干扰。
+"""
+import time
+import contextvars
+import email.utils
+import importlib.util
+from typing import Dict, Any, Optional
+import httpx
+
+CLIENT_MODES = ("shared", "per_worker")
+
+_current: contextvars.ContextVar = contextvars.ContextVar("connection_metrics", default=None)
+
+
+def track_connections() -> Dict[str, Any]:
+    """为当前线程/协程即将发出的请求开启连接指标收集，返回会被 trace 回调填充的字典"""
+    metrics = {"new_connections": 0, "pool_wait": 0.0, "connect_time": 0.0, "tls_time": 0.0,
+               "started": time.time(), "perf": time.perf_counter(), "acquired": None, "sent": None, "first_byte": None}
+    _current.set(metrics)
+    return metrics
+
+
+def connection_fields(metrics: Dict[str, Any]) -> Dict[str, Any]:
+    """把 track_connections() 收集到的指标转换为 single_chat 结果中的字段"""
+    return {
+        "new_connections": metrics["new_connections"],
+        "pool_wait": round(metrics["pool_wait"], 6),
+        "connect_time": round(metrics["connect_time"], 6) if metrics["new_connections"] else None,
+        "tls_time": round(metrics["tls_time"], 6) if metrics["tls_time"] else None,
+        "started_at": metrics["started"],
+        "acquired_at": metrics["acquired"],
+        "sent_at": metrics["sent"],
+        "first_byte_at": metrics["first_byte"]
+    }
+
+
+def _make_tracer(metrics: Dict[str, Any]):
+    """
+    单个 HTTP 请求的 trace 回调：事件名形如 connection.connect_tcp.started、http11.send_request_headers.started
+
+    SDK 自动重试时每次尝试都会重新记录阶段时刻，最终保留的是产生响应的那次尝试
+    """
+    entered = time.perf_counter()
+    marks = {}
+    # perf_counter -> Unix 时间
+    offset = metrics["started"] - metrics["perf"]
+
+    def trace(event: str, info: Dict[str, Any]) -> None:
+        now = time.perf_counter()
+        if "pool" not in marks and (event.endswith("connect_tcp.started")
+                                    or event.endswith("send_request_headers.started")):
+            # 开始建连或直接复用连接发送请求头，说明已从连接池拿到连接
+            marks["pool"] = now
+            metrics["pool_wait"] += now - entered
+            metrics["acquired"] = now + offset
+        if event.endswith("connect_tcp.started"):
+            metrics["new_connections"] += 1
+            marks["tcp"] = now
+        elif event.endswith("connect_tcp.complete") and "tcp" in marks:
+            metrics["connect_time"] += now - marks["tcp"]
+        elif event.endswith("start_tls.started"):
+            marks["tls"] = now
+        elif event.endswith("start_tls.complete") and "tls" in marks:
+            metrics["tls_time"] += now - marks["tls"]
+        elif event.endswith("send_request_body.complete"):
+            metrics["sent"] = now + offset
+        elif event.endswith("receive_response_headers.complete"):
+            metrics["first_byte"] = now + offset
+
+    return trace
+
+
+def _sync_hook(request: httpx.Request) -> None:
+    metrics = _current.get()
+    if metrics is not None:
+        request.extensions["trace"] = _make_tracer(metrics)
+
+
+async def _async_hook(request: httpx.Request) -> None:
+    metrics = _current.get()
+    if metrics is not None:
+        tracer = _make_tracer(metrics)
+
+        async def trace(event: str, info: Dict[str, Any]) -> None:
+            tracer(event, info)
+        request.extensions["trace"] = trace
+
+
+def retry_after(headers: Any) -> Optional[float]:
+    """解析 Retry-After（秒数或 HTTP 日期）或 retry-after-ms 响应头，没有或无法解析时返回 None"""
+    if headers is None:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        parsed = email.utils.parsedate_tz(value)
+        return max(0.0, email.utils.mktime_tz(parsed) - time.time()) if parsed else None
+
+
+def build_http_client(timeout: float, pool_size: int = 1000, keepalive: bool = True, http2: bool = False,
+                      async_client: bool = False):
+    """
+    构建带连接指标的 httpx 客户端
+
+    Args:
+        timeout: 超时秒数
+        pool_size: 连接池上限（同时打开的连接数），应不小于并发数，否则请求会在客户端排队
+        keepalive: 是否复用连接；关闭后每个请求都重新建连（可用于测量建连开销）
+        http2: 是否启用 HTTP/2（多个请求复用同一连接，需安装 h2）
+        async_client: 构建 httpx.AsyncClient（asyncio 引擎）还是 httpx.Client（线程引擎）
+    """
+    if http2 and importlib.util.find_spec("h2") is None:
+        raise ValueError("启用 HTTP/2 需要安装 h2：pip install 'httpx[http2]'")
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size if keepalive else 0)
+    if async_client:
+        return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2, event_hooks={"request": [_async_hook]})
+    return httpx.Client(limits=limits, timeout=timeout, http2=http2, event_hooks={"request": [_sync_hook]})
+
+
+def connection_options(config: Dict[str, Any]) -> Dict[str, Any]:
+    """从 tester 配置字典中取出连接、请求路径与端点选项（未设置的项使用 tester 默认值）"""
+    return {key: config[key] for key in ("pool_size", "keepalive", "http2", "client_mode", "request_path", "keep_text",
+                                         "endpoint", "batch_size", "stream_usage")
+            if config.get(key) is not None}
+
+
+def describe(pool_size: Optional[int], keepalive: bool, http2: bool, client_mode: str) -> str:
+    """连接配置的一行描述，用于启动时打印"""
+    return (f"连接池 {pool_size} / keep-alive {'开' if keepalive else '关'} / "
+            f"{'HTTP/2' if http2 else 'HTTP/1.1'} / {'每个 worker 独立客户端' if client_mode == 'per_worker' else '共享客户端'}")
@@ -0,0 +1,186 @@
+# coding=utf-8
+"""
+数据集驱动的负载：从 JSONL 文件流式读取请求
+
+每行一个 JSON 对象，字段：
+    prompt          必填，用户输入（也接受 messages 数组，取其中的 system 与最后一条 user）
+    system_prompt   可选，系统提示词
+    max_tokens      可选，最大输出 token
+    temperature     可选，温度
+    weight          可选，weighted 采样时的权重，默认 1
+
+文件按行惰性读取，任何时刻只在内存中保留一个有界缓冲区，数 GB 的线上流量日志也可直接回放。
+"""
+import json
+import random
+import threading
+from typing import Dict, Any, Optional, List, Tuple
+
+SAMPLING_MODES = ("sequential", "shuffle", "weighted")
+
+
+def parse_item(obj: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """把一行 JSON 转换为请求参数，无法识别的行返回 None"""
+    item = {}
+    if isinstance(obj.get("prompt"), str):
+        item["prompt"] = obj["prompt"]
+    elif isinstance(obj.get("messages"), list):
+        for msg in obj["messages"]:
+            if not isinstance(msg, dict):
+                continue
+            if msg.get("role") == "system":
+                item["system_prompt"] = msg.get("content", "")
+            elif msg.get("role") == "user":
+                item["prompt"] = msg.get("content", "")
+    if "prompt" not in item:
+        return None
+    if isinstance(obj.get("system_prompt"), str):
+        item["system_prompt"] = obj["system_prompt"]
+    if obj.get("max_tokens") is not None:
+        item["max_tokens"] = int(obj["max_tokens"])
+    if obj.get("temperature") is not None:
+        item["temperature"] = float(obj["temperature"])
+    item["weight"] = float(obj.get("weight", 1.0))
+    return item
+
+
+class JsonlWorkload:
+    """
+    JSONL 请求源，next() 线程安全
+
+    Args:
+        path: JSONL 文件路径
+        mode: sequential（按文件顺序）、shuffle（有界缓冲区随机打乱）、weighted（按 weight 字段加权抽样）
+        buffer_size: shuffle / weighted 的缓冲区行数；文件行数不超过该值时为精确打乱/精确加权
+        seed: 随机种子
+        shard: (index, count)，只读取行号 % count == index 的行，多进程/多机时各自回放不重叠的子集；
+               该分片中没有有效行时打印警告并改为回放整个文件
+
+    读到文件末尾后自动从头继续，因此 next() 总能返回请求；整个文件中没有有效行时构造即报错。
+    """
+
+    def __init__(self, path: str, mode: str = "sequential", buffer_size: int = 1024, seed: Optional[int] = None,
+                 shard: Tuple[int, int] = (0, 1)):
+        if mode not in SAMPLING_MODES:
+            raise ValueError(f"不支持的采样模式: {mode}")
+        self.path = path
+        self.mode = mode
+        self.buffer_size = buffer_size
+        self.seed = seed
+        self.shard = tuple(shard)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._file = open(path, "r", encoding="utf-8")
+        self._buffer: List[Dict[str, Any]] = []
+        self._fill()
+        if not self._buffer and self.shard != (0, 1):
+            # 分片按行号划分，有效行很少（或集中在某些行号上）时个别分片可能一行都没有：
+            # 退回回放整个文件（与其他分片重叠），不让整个多进程 / 分布式测试因此失败
+            print(f"⚠️ {path} 的分片 {self.shard[0]}/{self.shard[1]} 中没有可用的请求行，改为回放整个文件")
+            self.shard = (0, 1)
+            self._fill()
+        if not self._buffer:
+            self._file.close()
+            raise ValueError(f"{path} 中没有可用的请求行")
+
+    def spec(self) -> Dict[str, Any]:
+        """可序列化的构造参数，供子进程 / 远程代理重建"""
+        return {"path": self.path, "mode": self.mode, "buffer_size": self.buffer_size,
+                "seed": self.seed, "shard": list(self.shard)}
+
+    @classmethod
+    def from_spec(cls, spec: Dict[str, Any]) -> "JsonlWorkload":
+        return cls(**spec)
+
+    def _fill(self) -> None:
+        """从文件开头重新读取并填充缓冲区（读取位置、遍数与跳过计数一并重置）"""
+        self._file.seek(0)
+        self._line_no = 0
+        self._passes = 0
+        self._pass_hits = 0
+        self._exhausted = False
+        self.skipped = 0
+        # 首次填充缓冲区时不回绕，避免小文件在缓冲区里出现重复行；sequential 模式缓冲区只有 1 行
+        while len(self._buffer) < (1 if self.mode == "sequential" else self.buffer_size):
+            item = self._read(wrap=False)
+            if item is None:
+                self._exhausted = True
+                break
+            self._buffer.append(item)
+
+    def _read(self, wrap: bool = True) -> Optional[Dict[str, Any]]:
+        """从文件读取下一条属于本分片的有效请求，到达末尾时按需回绕"""
+        index, count = self.shard
+        while True:
+            line = self._file.readline()
+            if not line:
+                if not wrap or self._pass_hits == 0:
+                    return None
+                self._file.seek(0)
+                self._line_no = 0
+                self._passes += 1
+                self._pass_hits = 0
+                continue
+            line_no = self._line_no
+            self._line_no += 1
+            if line_no % count != index or not line.strip():
+                continue
+            try:
+                item = parse_item(json.loads(line))
+            except (ValueError, TypeError):
+                item = None
+            if item is None:
+                if self._passes == 0:
+                    self.skipped += 1
+                continue
+            self._pass_hits += 1
+            return item
+
+    def next(self) -> Dict[str, Any]:
+        """取下一条请求：{prompt, [system_prompt], [max_tokens], [temperature]}"""
+        with self._lock:
+            if self.mode == "sequential":
+                item = self._buffer[0]
+                self._buffer[0] = self._read()
+                return item
+            if self.mode == "shuffle":
+                # 随机取出一行，空位由文件中的下一行补上（近似打乱，内存占用固定为 buffer_size 行）
+                i = self._rng.randrange(len(self._buffer))
+                item = self._buffer[i]
+                self._buffer[i] = self._read()
+                return item
+            # weighted：按权重有放回抽样；文件大于缓冲区时每次随机替换一个槽位，缓冲区逐步滑过整个文件
+            item = self._rng.choices(self._buffer, weights=[x["weight"] for x in self._buffer])[0]
+            if not self._exhausted:
+                replacement = self._read()
+                if replacement is not None:
+                    self._buffer[self._rng.randrange(len(self._buffer))] = replacement
+            return item
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def resolve_request(workload: Any, prompt: str, system_prompt: str, temperature: float,
+                    max_tokens: int) -> Tuple[str, str, float, int]:
+    """取本次请求的参数：有 workload 时用数据集中的值，缺省字段回落到测试参数"""
+    if workload is None:
+        return prompt, system_prompt, temperature, max_tokens
+    item = workload.next()
+    return (item["prompt"], item.get("system_prompt", system_prompt),
+            item.get("temperature", temperature), item.get("max_tokens", max_tokens))
+
+
+def shard_spec(spec: Dict[str, Any], index: int, count: int) -> Dict[str, Any]:
+    """在已有分片基础上再拆分（多机 -> 多进程两级拆分时各自回放不重叠的行）"""
+    base_index, base_count = spec.get("shard", (0, 1))
+    new_index = base_index + index * base_count
+    seed = spec.get("seed")
+    return dict(spec, shard=[new_index, base_count * count], seed=None if seed is None else seed + new_index)
+
+
+def load_workload(workload: Any) -> Any:
+    """接受 JsonlWorkload 实例或其 spec() 字典（跨进程传递时），返回可调用 next() 的请求源"""
+    if isinstance(workload, dict):
+        return JsonlWorkload.from_spec(workload)
+    return workload